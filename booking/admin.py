@@ -1,4 +1,5 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.utils import timezone
 from .models import (
     Table,
     Booking,
@@ -7,7 +8,12 @@ from .models import (
     GalleryImage,
     MenuItem,
     TeamMember,
+    WaitlistEntry,
+    OutgoingEmail,
+    RestaurantSettings,
 )
+from .pagination import EstimatedCountPaginator
+from .publish import HOME, publish_dir, publish_pages
 
 
 @admin.register(Table)
@@ -16,6 +22,7 @@ class TableAdmin(admin.ModelAdmin):
     list_filter = ["is_vip", "is_active"]
     search_fields = ["number", "description"]
     list_editable = ["is_active"]
+    filter_horizontal = ["adjacent_tables"]
 
 
 @admin.register(Booking)
@@ -28,11 +35,49 @@ class BookingAdmin(admin.ModelAdmin):
         "start_time",
         "end_time",
         "guests_count",
+        "combined_with",
     ]
     list_filter = ["date", "table"]
     search_fields = ["user__email", "table__number"]
     date_hierarchy = "date"
     readonly_fields = ["created_at", "updated_at"]
+    # Без COUNT(*) по всей таблице на каждой странице списка
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = [
+        "id",
+        "user",
+        "date",
+        "window_start",
+        "window_end",
+        "guests_count",
+        "promoted_booking",
+    ]
+    list_filter = ["date"]
+    search_fields = ["user__email"]
+    date_hierarchy = "date"
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    readonly_fields = ["created_at", "promoted_at", "promoted_booking"]
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ["subject", "to_email", "status", "attempts", "next_attempt_at", "sent_at"]
+    list_filter = ["status"]
+    search_fields = ["to_email", "subject"]
+    readonly_fields = ["created_at", "sent_at", "attempts", "last_error"]
+    actions = ["retry"]
+
+    @admin.action(description="Отправить повторно")
+    def retry(self, request, queryset):
+        queryset.exclude(status=OutgoingEmail.STATUS_SENT).update(
+            status=OutgoingEmail.STATUS_PENDING, attempts=0, next_attempt_at=timezone.now()
+        )
 
 
 @admin.register(Feedback)
@@ -75,6 +120,16 @@ class PageAdmin(admin.ModelAdmin):
     list_filter = ["page_type", "is_active"]
     list_editable = ["is_active", "order"]
     search_fields = ["title", "content"]
+    actions = ["publish"]
+
+    @admin.action(description="Опубликовать статические страницы")
+    def publish(self, request, queryset):
+        if not publish_dir():
+            self.message_user(request, "Публикация выключена: не задан STATIC_PAGES_DIR", messages.ERROR)
+            return
+        names = [HOME] + [page.page_type for page in queryset]
+        published = publish_pages(names)
+        self.message_user(request, f"Опубликовано страниц: {len(published)}")
 
     def get_inline_instances(self, request, obj=None):
         if not obj:
@@ -89,3 +144,33 @@ class PageAdmin(admin.ModelAdmin):
             inlines.append(TeamMemberInline(self.model, self.admin_site))
 
         return inlines
+
+
+@admin.register(RestaurantSettings)
+class RestaurantSettingsAdmin(admin.ModelAdmin):
+    fieldsets = [
+        ("Ресторан", {"fields": ["restaurant_name", "head_name", "description"]}),
+        ("Контакты", {"fields": ["contact_phone", "contact_email", "address"]}),
+        (
+            "Бронирование",
+            {
+                "fields": [
+                    "open_time",
+                    "close_time",
+                    "min_booking_hours",
+                    "max_booking_hours",
+                    "max_booking_days_ahead",
+                    "booking_rules",
+                ]
+            },
+        ),
+        ("Столики", {"fields": ["max_table_capacity", "table_capacities", "booking_statuses"]}),
+    ]
+    readonly_fields = ["updated_at"]
+
+    def has_add_permission(self, request):
+        # Запись одна, ее создает сигнал post_migrate
+        return not RestaurantSettings.objects.exists()
+
+    def has_delete_permission(self, request, obj=None):
+        return False
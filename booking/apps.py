@@ -7,3 +7,6 @@ class BookingConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "booking"
     verbose_name = "Бронирования"
+
+    def ready(self):
+        from . import signals  # noqa: F401
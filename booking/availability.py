@@ -0,0 +1,341 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from django.db.models import Count, FilteredRelation, Q, Sum
+from .models import Booking, Table
+from .cache import get_or_load
+from .restaurant import get_restaurant
+
+
+def format_interval(start_time, end_time):
+    """Форматирует интервал брони в виде строки ЧЧ:ММ-ЧЧ:ММ"""
+    return f"{start_time.strftime('%H:%M')}-{end_time.strftime('%H:%M')}"
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+class SlotGrid:
+    """Почасовая сетка слотов между открытием и закрытием ресторана"""
+
+    def __init__(self, open_hour, close_hour):
+        self.open_hour = open_hour
+        self.close_hour = close_hour
+        self.size = max(close_hour - open_hour, 0)
+        self.full_mask = (1 << self.size) - 1
+
+    @classmethod
+    def from_settings(cls):
+        restaurant = get_restaurant()
+        return cls(restaurant.open_time.hour, restaurant.close_time.hour)
+
+    def slot_time(self, index):
+        """Время начала слота с указанным номером"""
+        return time(self.open_hour + index)
+
+    def interval_mask(self, start_time, end_time):
+        """Маска слотов, пересекающихся с интервалом [start_time, end_time)"""
+        start = _minutes(start_time)
+        end = _minutes(end_time)
+        mask = 0
+        for index in range(self.size):
+            slot_start = (self.open_hour + index) * 60
+            if slot_start < end and slot_start + 60 > start:
+                mask |= 1 << index
+        return mask
+
+    def request_mask(self, start_time, duration_hours):
+        """Маска запрошенного интервала или None, если он не ложится на сетку"""
+        if start_time.minute or start_time.second or start_time.microsecond:
+            return None
+        index = start_time.hour - self.open_hour
+        if index < 0 or index + duration_hours > self.size:
+            return None
+        return ((1 << duration_hours) - 1) << index
+
+
+class DayAvailability:
+    """Занятость столика на день в виде битовой маски почасовых слотов"""
+
+    def __init__(self, date, bookings, grid=None):
+        self.date = date
+        self.grid = grid or SlotGrid.from_settings()
+        self.bookings = sorted(bookings, key=lambda booking: booking[1])
+        self.booking_masks = {}
+        self.mask = 0
+        # Брони с концом раньше начала не выражаются маской - для них
+        # проверка идет по интервалам, как в исходном SQL-условии
+        self.exact_only = False
+
+        for booking_id, start_time, end_time in self.bookings:
+            if end_time <= start_time:
+                self.exact_only = True
+            booking_mask = self.grid.interval_mask(start_time, end_time)
+            self.booking_masks[booking_id] = booking_mask
+            self.mask |= booking_mask
+
+    def add_booking(self, booking_id, start_time, end_time):
+        """Учитывает новую бронь без повторной загрузки дня"""
+        self.bookings = sorted(
+            self.bookings + [(booking_id, start_time, end_time)], key=lambda booking: booking[1]
+        )
+        if end_time <= start_time:
+            self.exact_only = True
+        booking_mask = self.grid.interval_mask(start_time, end_time)
+        self.booking_masks[booking_id] = booking_mask
+        self.mask |= booking_mask
+
+    def busy_mask(self, exclude_booking_id=None):
+        """Маска занятых слотов без учета исключенной брони"""
+        if exclude_booking_id not in self.booking_masks:
+            return self.mask
+        mask = 0
+        for booking_id, booking_mask in self.booking_masks.items():
+            if booking_id != exclude_booking_id:
+                mask |= booking_mask
+        return mask
+
+    def is_available(self, start_time, duration_hours, exclude_booking_id=None):
+        """Проверяет, свободен ли столик в указанное время"""
+        duration_hours = int(duration_hours)
+        request_mask = None
+        if not self.exact_only:
+            request_mask = self.grid.request_mask(start_time, duration_hours)
+
+        if request_mask is not None:
+            return not request_mask & self.busy_mask(exclude_booking_id)
+
+        end_time = (
+            datetime.combine(self.date, start_time) + timedelta(hours=duration_hours)
+        ).time()
+        for booking_id, booking_start, booking_end in self.bookings:
+            if exclude_booking_id and booking_id == exclude_booking_id:
+                continue
+            if booking_start < end_time and booking_end > start_time:
+                return False
+        return True
+
+    def free_slots(self, duration_hours, exclude_booking_id=None):
+        """Список свободных времен начала для брони указанной длительности"""
+        duration_hours = int(duration_hours)
+        if self.exact_only:
+            return [
+                self.grid.slot_time(index)
+                for index in range(self.grid.size - duration_hours + 1)
+                if self.is_available(
+                    self.grid.slot_time(index), duration_hours, exclude_booking_id
+                )
+            ]
+
+        busy = self.busy_mask(exclude_booking_id)
+        window = (1 << duration_hours) - 1
+        return [
+            self.grid.slot_time(index)
+            for index in range(self.grid.size - duration_hours + 1)
+            if not (window << index) & busy
+        ]
+
+    def busy_times(self, exclude_booking_id=None):
+        """Занятые интервалы по броням в виде строк ЧЧ:ММ-ЧЧ:ММ"""
+        return [
+            format_interval(start_time, end_time)
+            for booking_id, start_time, end_time in self.bookings
+            if not (exclude_booking_id and booking_id == exclude_booking_id)
+        ]
+
+
+def load_day(table, date):
+    """Загружает занятость одного столика на день из кэша или одним запросом"""
+    table_id = getattr(table, "id", table)
+    bookings = get_or_load(
+        f"day:{table_id}:{date.isoformat()}",
+        lambda: list(
+            Booking.objects.filter(table_id=table_id, date=date).order_by().values_list(
+                "id", "start_time", "end_time"
+            )
+        ),
+    )
+    return DayAvailability(date, bookings)
+
+
+def load_tables_day(date, tables=None):
+    """Столики и их занятость на дату одним запросом с LEFT JOIN по броням"""
+    if tables is None:
+        tables = Table.objects.filter(is_active=True)
+
+    field_names = [field.attname for field in Table._meta.concrete_fields]
+    rows = (
+        tables.annotate(
+            day_booking=FilteredRelation("booking", condition=Q(booking__date=date))
+        )
+        .order_by("number")
+        .values_list(
+            *field_names,
+            "day_booking__id",
+            "day_booking__start_time",
+            "day_booking__end_time",
+        )
+    )
+
+    grid = SlotGrid.from_settings()
+    tables_by_id = {}
+    bookings_by_table = defaultdict(list)
+    for row in rows:
+        table_values = row[:len(field_names)]
+        booking_id, start_time, end_time = row[len(field_names):]
+        table = tables_by_id.get(table_values[0])
+        if table is None:
+            table = Table.from_db(rows.db, field_names, table_values)
+            tables_by_id[table.id] = table
+        if booking_id is not None:
+            bookings_by_table[table.id].append((booking_id, start_time, end_time))
+
+    return [
+        (table, DayAvailability(date, bookings_by_table[table.id], grid))
+        for table in tables_by_id.values()
+    ]
+
+
+def get_venue_day(date):
+    """Активные столики и их занятость на дату из кэша или одним запросом"""
+    return get_or_load(f"venue:{date.isoformat()}", lambda: load_tables_day(date))
+
+
+def fit_key(candidate):
+    """Ключ выбора столика: наименьшая вместимость, VIP - в последнюю очередь"""
+    table = candidate[0]
+    return table.capacity, table.is_vip, table.number
+
+
+def find_best_fit(date, start_time, duration_hours, guests_count, exclude_booking_id=None):
+    """Наименьший свободный столик для гостей и его занятость одним запросом"""
+    candidates = [
+        (table, availability)
+        for table, availability in get_venue_day(date)
+        if table.capacity >= guests_count
+        and availability.is_available(start_time, duration_hours, exclude_booking_id)
+    ]
+    if not candidates:
+        return None, None
+    return min(candidates, key=fit_key)
+
+
+def suggest_alternatives(venue_day, table, start_time, duration_hours, guests_count,
+                         exclude_booking_id=None, limit=3):
+    """Ближайшее свободное время на том же столике и подходящие столики на то же время"""
+    availability = dict(
+        (venue_table.id, venue_availability) for venue_table, venue_availability in venue_day
+    ).get(table.id)
+
+    times = []
+    if availability is not None:
+        requested = _minutes(start_time)
+        free = availability.free_slots(duration_hours, exclude_booking_id)
+        times = sorted(
+            sorted(free, key=lambda slot: (abs(_minutes(slot) - requested), slot))[:limit]
+        )
+
+    candidates = [
+        (venue_table, venue_availability)
+        for venue_table, venue_availability in venue_day
+        if venue_table.id != table.id
+        and venue_table.capacity >= guests_count
+        and venue_availability.is_available(start_time, duration_hours, exclude_booking_id)
+    ]
+    tables = [venue_table for venue_table, _ in sorted(candidates, key=fit_key)[:limit]]
+
+    return {"times": times, "tables": tables}
+
+
+def assign_table(date, start_time, duration_hours, guests_count, exclude_booking_id=None):
+    """Подбирает наименьший свободный столик, вмещающий гостей"""
+    table, _ = find_best_fit(date, start_time, duration_hours, guests_count, exclude_booking_id)
+    return table
+
+
+def get_table_status(date):
+    """Статус всех активных столиков на дату из кэша"""
+    return get_or_load(f"status:{date.isoformat()}", lambda: build_table_status(date))
+
+
+def build_table_status(date):
+    """Статус всех активных столиков на дату за постоянное число запросов"""
+    tables = list(Table.objects.filter(is_active=True))
+
+    busy_by_table = defaultdict(list)
+    bookings = (
+        Booking.objects.filter(table__is_active=True, date=date)
+        .order_by("start_time")
+        .values_list("table_id", "start_time", "end_time")
+    )
+    for table_id, start_time, end_time in bookings:
+        busy_by_table[table_id].append(format_interval(start_time, end_time))
+
+    table_status = []
+    for table in tables:
+        busy_times = busy_by_table.get(table.id, [])
+        table_status.append(
+            {
+                "table": table,
+                "busy_times": busy_times,
+                "has_bookings_today": bool(busy_times),
+                "bookings_count": len(busy_times),
+            }
+        )
+
+    return table_status
+
+
+def get_heatmap(start_date, days):
+    """Свободная вместимость по дням и часам на горизонт бронирования из кэша"""
+    return get_or_load(
+        f"heatmap:{start_date.isoformat()}:{days}", lambda: build_heatmap(start_date, days)
+    )
+
+
+def build_heatmap(start_date, days):
+    """Свободная вместимость по дням и часам одним сгруппированным запросом"""
+    grid = SlotGrid.from_settings()
+    end_date = start_date + timedelta(days=days)
+
+    totals = Table.objects.filter(is_active=True).aggregate(
+        seats=Sum("capacity"), tables=Count("id")
+    )
+    total_seats = totals["seats"] or 0
+    total_tables = totals["tables"]
+
+    busy_seats = defaultdict(lambda: [0] * grid.size)
+    busy_tables = defaultdict(lambda: [0] * grid.size)
+    intervals = (
+        Booking.objects.filter(table__is_active=True, date__range=(start_date, end_date))
+        .values("date", "start_time", "end_time")
+        .annotate(seats=Sum("table__capacity"), tables=Count("id"))
+        .order_by()
+    )
+    for interval in intervals:
+        mask = grid.interval_mask(interval["start_time"], interval["end_time"])
+        for index in range(grid.size):
+            if mask >> index & 1:
+                busy_seats[interval["date"]][index] += interval["seats"]
+                busy_tables[interval["date"]][index] += interval["tables"]
+
+    heatmap = []
+    for offset in range(days + 1):
+        day = start_date + timedelta(days=offset)
+        hours = {}
+        for index in range(grid.size):
+            hours[grid.slot_time(index).strftime("%H:%M")] = {
+                "free_seats": max(total_seats - busy_seats[day][index], 0),
+                "free_tables": max(total_tables - busy_tables[day][index], 0),
+            }
+        free_capacity = sum(hour["free_seats"] for hour in hours.values())
+        heatmap.append(
+            {
+                "date": day.isoformat(),
+                "free_capacity": free_capacity,
+                "total_capacity": total_seats * grid.size,
+                "is_full": all(hour["free_tables"] == 0 for hour in hours.values()),
+                "hours": hours,
+            }
+        )
+    return heatmap
@@ -0,0 +1,106 @@
+import time
+from collections import Counter
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = "booking:availability:version"
+CACHE_TIMEOUT = 60 * 60
+# Страницы сайта меняются редко и сбрасываются сигналами при изменении
+PAGE_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Кэши, которые видит только свой процесс: сброс версии из команды или
+# другого воркера до них не доходит, поэтому данные в них не кэшируются
+PROCESS_LOCAL_BACKENDS = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+stats = Counter()
+
+
+def is_shared():
+    """Общий ли кэш для всех процессов (Redis, Memcached, база, файлы)"""
+    return settings.CACHES["default"]["BACKEND"] not in PROCESS_LOCAL_BACKENDS
+
+
+def get_version(key=VERSION_KEY):
+    """Текущая версия данных о занятости столиков (или другого ключа версии)"""
+    version = cache.get(key)
+    if version is None:
+        # Начальное значение из времени, чтобы после сброса кэша
+        # версия не совпала с одной из уже использованных
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key=VERSION_KEY):
+    """Делает устаревшими все закэшированные данные о занятости (или другого ключа)"""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), timeout=None)
+
+
+def bump_version_on_commit(key=VERSION_KEY):
+    """Сбрасывает версию сейчас и еще раз после фиксации транзакции"""
+    bump_version(key)
+    # Повторный сброс не дает закэшировать данные, прочитанные
+    # другим процессом до фиксации изменения
+    transaction.on_commit(lambda: bump_version(key))
+
+
+def get_or_load(key, loader):
+    """Значение из кэша текущей версии или результат loader(); без общего кэша - всегда loader()"""
+    if not is_shared():
+        stats["misses"] += 1
+        return loader()
+    versioned_key = f"booking:availability:{get_version()}:{key}"
+    value = cache.get(versioned_key)
+    if value is not None:
+        stats["hits"] += 1
+        return value
+
+    stats["misses"] += 1
+    value = loader()
+    cache.set(versioned_key, value, CACHE_TIMEOUT)
+    return value
+
+
+def page_cache_key(page_type):
+    return f"booking:page:{page_type}"
+
+
+def get_page(page_type):
+    """Готовая страница сайта для анонимных посетителей или None"""
+    if not is_shared():
+        return None
+    return cache.get(page_cache_key(page_type))
+
+
+def set_page(page_type, content):
+    if not is_shared():
+        return
+    cache.set(page_cache_key(page_type), content, PAGE_CACHE_TIMEOUT)
+
+
+def invalidate_pages():
+    """Удаляет из кэша страницы сайта сейчас и еще раз после фиксации транзакции"""
+    from .models import Page
+
+    keys = [page_cache_key(page_type) for page_type, _ in Page.PAGE_TYPES]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_stats():
+    """Счетчики попаданий и промахов кэша занятости в текущем процессе"""
+    hits = stats["hits"]
+    misses = stats["misses"]
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / total if total else 0.0,
+    }
@@ -0,0 +1,134 @@
+from collections import defaultdict
+from django.conf import settings
+from .availability import get_venue_day
+from .cache import get_or_load
+from .models import Table
+
+# Сколько столиков можно сдвинуть для одной компании
+MAX_COMBINED_TABLES = getattr(settings, "MAX_COMBINED_TABLES", 4)
+
+
+def get_adjacency():
+    """Граф соседства столиков из кэша или одним запросом"""
+
+    def load():
+        adjacency = defaultdict(set)
+        pairs = Table.adjacent_tables.through.objects.values_list("from_table_id", "to_table_id")
+        for from_id, to_id in pairs:
+            adjacency[from_id].add(to_id)
+            adjacency[to_id].add(from_id)
+        return {table_id: frozenset(neighbors) for table_id, neighbors in adjacency.items()}
+
+    return get_or_load("adjacency", load)
+
+
+def combination_cost(tables, guests_count):
+    """Стоимость группы: лишние места, число столиков, VIP, номера"""
+    return (
+        sum(table.capacity for table in tables) - guests_count,
+        len(tables),
+        sum(table.is_vip for table in tables),
+        sorted(table.number for table in tables),
+    )
+
+
+def iter_groups(neighbors, capacities, max_tables, grow=None):
+    """Связные группы до max_tables столиков с их вместимостью, каждая один раз (алгоритм ESU)
+
+    grow(group, capacity) решает, расширять ли уже выданную группу дальше.
+    """
+
+    def extend(seed, group, closed, extension, capacity):
+        yield group, capacity
+        if len(group) == max_tables or (grow is not None and not grow(group, capacity)):
+            return
+        extension = sorted(extension)
+        while extension:
+            table_id = extension.pop()
+            new_extension = set(extension)
+            new_extension.update(
+                u for u in neighbors[table_id] if u > seed and u not in closed
+            )
+            yield from extend(
+                seed,
+                group + [table_id],
+                closed | neighbors[table_id] | {table_id},
+                new_extension,
+                capacity + capacities[table_id],
+            )
+
+    for seed in sorted(neighbors):
+        yield from extend(
+            seed,
+            [seed],
+            neighbors[seed] | {seed},
+            {u for u in neighbors[seed] if u > seed},
+            capacities[seed],
+        )
+
+
+def restrict(adjacency, table_ids):
+    """Граф соседства только между данными столиками"""
+    return {
+        table_id: frozenset(u for u in adjacency.get(table_id, ()) if u in table_ids)
+        for table_id in table_ids
+    }
+
+
+def solve_combination(tables, adjacency, guests_count, max_tables=MAX_COMBINED_TABLES):
+    """Самая дешевая связная группа свободных столиков, вмещающая гостей"""
+    capacities = {table_id: table.capacity for table_id, table in tables.items()}
+    max_capacity = max(capacities.values(), default=0)
+    best = None
+    best_cost = None
+
+    def grow(group, capacity):
+        # Рост группы прекращается, как только она вмещает всех гостей
+        if capacity >= guests_count:
+            return False
+        # Даже самые большие столики не помогут вместить всех гостей
+        if capacity + (max_tables - len(group)) * max_capacity < guests_count:
+            return False
+        # Без лишних мест уже найдена группа из меньшего числа столиков
+        return best_cost is None or best_cost[0] != 0 or len(group) + 1 <= best_cost[1]
+
+    for group, capacity in iter_groups(restrict(adjacency, tables), capacities, max_tables, grow):
+        if capacity < guests_count:
+            continue
+        short_cost = (capacity - guests_count, len(group))
+        if best_cost is None or short_cost <= best_cost[:2]:
+            group_tables = [tables[table_id] for table_id in group]
+            cost = combination_cost(group_tables, guests_count)
+            if best_cost is None or cost < best_cost:
+                best, best_cost = group_tables, cost
+
+    if best is None:
+        return []
+    return sorted(best, key=lambda table: (-table.capacity, table.number))
+
+
+def find_table_combination(date, start_time, duration_hours, guests_count,
+                           exclude_booking_id=None, max_tables=MAX_COMBINED_TABLES):
+    """Свободные соседние столики для большой компании; первый - основной"""
+    free_tables = {
+        table.id: table
+        for table, availability in get_venue_day(date)
+        if availability.is_available(start_time, duration_hours, exclude_booking_id)
+    }
+    return solve_combination(free_tables, get_adjacency(), guests_count, max_tables)
+
+
+def max_party_size(capacities, max_tables=MAX_COMBINED_TABLES):
+    """Наибольшая компания за одним столиком или связной группой соседних; capacities - {id: вместимость}"""
+    if not capacities:
+        return 1
+    max_capacity = max(capacities.values())
+    best = max_capacity
+
+    def grow(group, capacity):
+        # Группа не станет больше найденной, даже если добавить самые большие столики
+        return capacity + (max_tables - len(group)) * max_capacity > best
+
+    for _, capacity in iter_groups(restrict(get_adjacency(), capacities), capacities, max_tables, grow):
+        best = max(best, capacity)
+    return best
@@ -0,0 +1,130 @@
+import csv
+from datetime import datetime, timezone as dt_timezone
+from django.core import signing
+from .models import Booking
+from .restaurant import get_restaurant
+
+# Брони читаются из БД пачками, память не зависит от длины истории
+CHUNK_SIZE = 500
+CSV_HEADER = [
+    "Номер брони", "Дата", "Начало", "Конец", "Длительность, ч", "Гостей", "Столики", "Пожелания", "Создана",
+]
+CALENDAR_SALT = "booking.calendar"
+
+
+class Echo:
+    """Файлоподобный объект для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def user_bookings(user):
+    return (
+        Booking.objects.filter(user=user, combined_with__isnull=True)
+        .select_related("table")
+        .prefetch_related("combined_bookings__table")
+    )
+
+
+def table_numbers(booking):
+    tables = [booking.table] + [combined.table for combined in booking.combined_bookings.all()]
+    return ", ".join(f"№{table.number}" for table in tables)
+
+
+def iter_csv(bookings):
+    """Строки CSV по одной брони; BOM в начале нужен Excel для кириллицы"""
+    writer = csv.writer(Echo())
+    yield "\ufeff" + writer.writerow(CSV_HEADER)
+    for booking in bookings.order_by("-date", "-start_time", "-id").iterator(chunk_size=CHUNK_SIZE):
+        yield writer.writerow([
+            booking.id,
+            booking.date.strftime("%d.%m.%Y"),
+            booking.start_time.strftime("%H:%M"),
+            booking.end_time.strftime("%H:%M"),
+            booking.duration_hours,
+            booking.guests_count,
+            table_numbers(booking),
+            booking.special_requests or "",
+            booking.created_at.strftime("%d.%m.%Y %H:%M"),
+        ])
+
+
+def escape_text(value):
+    """Экранирование текста по RFC 5545"""
+    return (
+        value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+def fold(line):
+    """Строка календаря, перенесенная по 75 октетов (RFC 5545, 3.1)"""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(encoded))
+        # Не разрезаем многобайтовый символ UTF-8
+        while cut < len(encoded) and encoded[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode())
+        encoded = encoded[cut:]
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def format_utc(value):
+    return value.astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def event_lines(booking, restaurant, host):
+    start = datetime.combine(booking.date, booking.start_time)
+    end = datetime.combine(booking.date, booking.end_time)
+    summary = f"Бронь столика {table_numbers(booking)}"
+    if restaurant.restaurant_name:
+        summary += f" - {restaurant.restaurant_name}"
+    description = f"Гостей: {booking.guests_count}"
+    if booking.special_requests:
+        description += f"\nПожелания: {booking.special_requests}"
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:booking-{booking.id}@{host}",
+        f"DTSTAMP:{format_utc(booking.updated_at)}",
+        f"LAST-MODIFIED:{format_utc(booking.updated_at)}",
+        # Время брони хранится местным, без часового пояса
+        f"DTSTART:{start.strftime('%Y%m%dT%H%M%S')}",
+        f"DTEND:{end.strftime('%Y%m%dT%H%M%S')}",
+        f"SUMMARY:{escape_text(summary)}",
+        f"DESCRIPTION:{escape_text(description)}",
+    ]
+    if restaurant.address:
+        lines.append(f"LOCATION:{escape_text(restaurant.address)}")
+    lines.append("END:VEVENT")
+    return lines
+
+
+def iter_ics(bookings, host):
+    """Календарь iCalendar по одному событию на бронь"""
+    restaurant = get_restaurant()
+    name = restaurant.restaurant_name or "Бронирования"
+    for line in ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//booking//RU", "CALSCALE:GREGORIAN",
+                 f"X-WR-CALNAME:{escape_text(name)}"]:
+        yield fold(line)
+    for booking in bookings.order_by("date", "start_time", "id").iterator(chunk_size=CHUNK_SIZE):
+        yield "".join(fold(line) for line in event_lines(booking, restaurant, host))
+    yield fold("END:VCALENDAR")
+
+
+def calendar_token(user):
+    """Подписанный токен ссылки на календарь: календарные программы не входят в аккаунт"""
+    return signing.Signer(salt=CALENDAR_SALT).sign(str(user.pk))
+
+
+def calendar_user_id(token):
+    """id пользователя из токена календаря или None, если подпись неверна"""
+    try:
+        return int(signing.Signer(salt=CALENDAR_SALT).unsign(token))
+    except (signing.BadSignature, ValueError):
+        return None
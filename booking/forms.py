@@ -1,7 +1,10 @@
 from django import forms
 from django.core.exceptions import ValidationError
-from django.conf import settings
-from .models import Feedback, Table, Booking
+from .models import Feedback, Table, Booking, WaitlistEntry
+from .availability import find_best_fit
+from .combinations import find_table_combination, max_party_size
+from .policy import get_policy
+from .restaurant import get_restaurant
 from datetime import date, timedelta, datetime
 
 
@@ -9,8 +12,7 @@ class BookingForm(forms.ModelForm):
     """Форма создания бронирования"""
 
     duration_hours = forms.ChoiceField(
-        choices=[(i, f"{i} час" if i == 1 else f"{i} часа" if i < 5 else f"{i} часов")
-                 for i in range(1, settings.MAX_BOOKING_HOURS + 1)],
+        choices=[],
         label="Продолжительность",
         widget=forms.Select(attrs={"class": "form-control", "id": "id_duration"}),
     )
@@ -53,53 +55,49 @@ class BookingForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         table_id = kwargs.pop('table_id', None)
         super().__init__(*args, **kwargs)
+        self.policy = get_policy()
+        self.restaurant = self.policy.restaurant
+        self.fields["duration_hours"].choices = self.policy.duration_choices
+        self.availability = None
+        self.extra_tables = []
+        self.suggestions = {"times": [], "tables": []}
 
         self.fields["table"].queryset = Table.objects.filter(is_active=True)
 
-        table = None
-        if table_id:
-            try:
-                table = Table.objects.get(id=table_id)
-                self.fields["table"].initial = table
-                self.fields["table"].disabled = True
-            except Table.DoesNotExist:
-                pass
-
-        if not table and 'table' in self.initial and self.initial['table']:
-            try:
-                table = Table.objects.get(id=self.initial['table'])
-            except (Table.DoesNotExist, ValueError):
-                pass
+        table = self.lookup_table(table_id or self.initial.get("table"))
+        if table_id and table:
+            self.fields["table"].initial = table
+            self.fields["table"].disabled = True
 
         if table:
-            guest_choices = [(i, f"{i} чел.") for i in range(1, table.capacity + 1)]
-            self.fields["guests_count"].choices = guest_choices
+            self.fields["guests_count"].choices = self.policy.guest_choices(table.capacity)
+        elif not table_id:
+            self.fields["table"].required = False
+            self.fields["table"].empty_label = "Подобрать автоматически"
+            max_guests = max_party_size(
+                dict(self.fields["table"].queryset.values_list("id", "capacity"))
+            )
+            self.fields["guests_count"].choices = self.policy.guest_choices(max_guests)
 
         if not self.fields["date"].initial:
             today = date.today()
             self.fields["date"].initial = today.strftime("%Y-%m-%d")
 
+        self.fields["start_time"].choices = self.policy.start_time_choices
+        self.fields["date"].help_text = self.policy.date_help_text
+
+    def lookup_table(self, table_id):
+        """Столик формы; столик редактируемой брони берется без лишнего запроса"""
+        if not table_id:
+            return None
+        if self.instance.pk and str(self.instance.table_id) == str(getattr(table_id, "pk", table_id)):
+            return self.instance.table
+        if isinstance(table_id, Table):
+            return table_id
         try:
-            open_time = datetime.strptime(settings.OPEN_TIME, "%H:%M").time()
-            close_time = datetime.strptime(settings.CLOSE_TIME, "%H:%M").time()
-
-            time_choices = []
-            current_hour = open_time.hour
-
-            while current_hour < close_time.hour:
-                time_str = f"{current_hour:02d}:00"
-                time_choices.append((time_str, time_str))
-                current_hour += 1
-
-            self.fields["start_time"].choices = time_choices
-
-        except ValueError:
-            self.fields["start_time"].widget = forms.TimeInput(
-                attrs={"type": "time", "class": "form-control", "id": "id_start_time"}
-            )
-
-        self.fields[
-            "date"].help_text = f"Максимально можно забронировать на {settings.MAX_BOOKING_DAYS_AHEAD} дней вперед"
+            return Table.objects.get(id=table_id)
+        except (Table.DoesNotExist, ValueError):
+            return None
 
     def clean(self):
         cleaned_data = super().clean()
@@ -109,78 +107,41 @@ class BookingForm(forms.ModelForm):
         duration_hours = cleaned_data.get("duration_hours")
         guests_count = cleaned_data.get("guests_count")
 
-        if all([table, date_obj, start_time, duration_hours, guests_count]):
-            try:
-                duration = int(duration_hours)
-                guests = int(guests_count)
-                start_time_obj = start_time
-
-                open_time = datetime.strptime(settings.OPEN_TIME, "%H:%M").time()
-                close_time = datetime.strptime(settings.CLOSE_TIME, "%H:%M").time()
-
-                start_datetime = datetime.combine(date_obj, start_time_obj)
-                end_datetime = start_datetime + timedelta(hours=duration)
-                end_time_obj = end_datetime.time()
-
-                now = datetime.now()
-
-                if date_obj == now.date():
-                    if start_datetime < now + timedelta(hours=1):
-                        self.add_error(
-                            "start_time",
-                            "Бронь должна быть минимум на 1 час позже текущего времени"
-                        )
-
-                if start_time_obj < open_time:
-                    self.add_error(
-                        "start_time",
-                        f"Ресторан открывается в {settings.OPEN_TIME}"
+        if not table and not self.fields["table"].required and "table" not in self.errors:
+            if all([date_obj, start_time, duration_hours, guests_count]):
+                table, self.availability = find_best_fit(
+                    date_obj, start_time, int(duration_hours), int(guests_count)
+                )
+                if not table:
+                    combination = find_table_combination(
+                        date_obj, start_time, int(duration_hours), int(guests_count)
                     )
-
-                end_date = date_obj
-                if end_time_obj < start_time_obj:
-                    end_date = date_obj + timedelta(days=1)
-
-                if end_date > date_obj:
+                    if combination:
+                        table, self.extra_tables = combination[0], combination[1:]
+                if table:
+                    cleaned_data["table"] = table
+                else:
                     self.add_error(
-                        "duration_hours",
-                        f"Бронь не может переходить на следующий день"
-                    )
-                    raise ValidationError("")
-                elif end_time_obj > close_time:
-                    self.add_error(
-                        "duration_hours",
-                        f"Бронь завершится в {end_time_obj.strftime('%H:%M')}, но ресторан закрывается в {settings.CLOSE_TIME}"
-                    )
-                    raise ValidationError("")
-
-                if table and not table.is_available(date_obj, start_time_obj, duration):
-                    busy_times = table.get_busy_times(date_obj)
-                    self.add_error(
-                        "start_time",
-                        f"Столик занят на выбранное время. Занятое время: {', '.join(busy_times)}"
+                        "table",
+                        f"Нет свободных столиков на {int(guests_count)} гостей в выбранное время"
                     )
 
-                max_future_date = now.date() + timedelta(days=settings.MAX_BOOKING_DAYS_AHEAD)
-                if date_obj > max_future_date:
-                    self.add_error(
-                        "date",
-                        f"Можно бронировать максимум на {settings.MAX_BOOKING_DAYS_AHEAD} дней вперед"
-                    )
-
-            except ValueError as e:
-                self.add_error(None, f"Ошибка обработки данных: {str(e)}")
+        if all([table, date_obj, start_time, duration_hours, guests_count]):
+            result = self.policy.validate(
+                table, date_obj, start_time, int(duration_hours), int(guests_count),
+                extra_tables=self.extra_tables,
+                availability=self.availability,
+                exclude_booking_id=self.instance.pk,
+            )
+            self.availability = result.availability
+            self.suggestions = result.suggestions
+            for field, message in result.errors:
+                self.add_error(field, message)
+        elif table and guests_count:
+            for field, message in self.policy.check_capacity([table, *self.extra_tables], int(guests_count)):
+                self.add_error(field, message)
 
-        if table and guests_count:
-            try:
-                guests = int(guests_count)
-                if guests > table.capacity:
-                    self.add_error(
-                        "guests_count",
-                        f"Этот столик вмещает максимум {table.capacity} гостей"
-                    )
-            except ValueError:
-                pass
+        return cleaned_data
 
     def clean_date(self):
         date_obj = self.cleaned_data.get("date")
@@ -216,10 +177,10 @@ class BookingEditForm(BookingForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
+        self.fields["table"].required = True
+
         if self.instance and self.instance.pk:
-            table = self.instance.table
-            guest_choices = [(i, f"{i} чел.") for i in range(1, table.capacity + 1)]
-            self.fields["guests_count"].choices = guest_choices
+            self.fields["guests_count"].choices = self.policy.guest_choices(self.instance.table.capacity)
             self.fields["guests_count"].initial = self.instance.guests_count
 
             self.fields["duration_hours"].initial = self.instance.duration_hours
@@ -230,96 +191,83 @@ class BookingEditForm(BookingForm):
             self.fields["date"].initial = date_str
             self.initial['date'] = date_str
 
-    def clean(self):
-        cleaned_data = super(forms.ModelForm, self).clean()
 
-        table = cleaned_data.get("table")
-        date_obj = cleaned_data.get("date")
-        start_time = cleaned_data.get("start_time")
-        duration_hours = cleaned_data.get("duration_hours")
-        guests_count = cleaned_data.get("guests_count")
+class WaitlistForm(forms.ModelForm):
+    """Форма записи в лист ожидания"""
 
-        if all([table, date_obj, start_time, duration_hours, guests_count]):
-            try:
-                duration = int(duration_hours)
-                guests = int(guests_count)
-                start_time_obj = start_time
+    window_start = forms.ChoiceField(
+        label="Не раньше",
+        widget=forms.Select(attrs={"class": "form-control"}),
+        choices=[]
+    )
 
-                open_time = datetime.strptime(settings.OPEN_TIME, "%H:%M").time()
-                close_time = datetime.strptime(settings.CLOSE_TIME, "%H:%M").time()
+    window_end = forms.ChoiceField(
+        label="Не позже",
+        widget=forms.Select(attrs={"class": "form-control"}),
+        choices=[]
+    )
 
-                start_datetime = datetime.combine(date_obj, start_time_obj)
-                end_datetime = start_datetime + timedelta(hours=duration)
-                end_time_obj = end_datetime.time()
+    duration_hours = forms.TypedChoiceField(
+        coerce=int,
+        choices=[],
+        label="Продолжительность",
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
 
-                now = datetime.now()
+    class Meta:
+        model = WaitlistEntry
+        fields = ["date", "window_start", "window_end", "duration_hours", "guests_count"]
+        widgets = {
+            "date": forms.DateInput(attrs={"type": "date", "class": "form-control"}),
+            "guests_count": forms.NumberInput(attrs={"class": "form-control", "min": 1}),
+        }
+        labels = {
+            "date": "Дата",
+            "guests_count": "Количество гостей",
+        }
 
-                if date_obj == now.date():
-                    if start_datetime < now + timedelta(hours=1):
-                        self.add_error(
-                            "start_time",
-                            "Бронь должна быть минимум на 1 час позже текущего времени"
-                        )
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.restaurant = get_restaurant()
+        self.fields["duration_hours"].choices = self.restaurant.duration_choices()
 
-                if start_time_obj < open_time:
-                    self.add_error(
-                        "start_time",
-                        f"Ресторан открывается в {settings.OPEN_TIME}"
-                    )
+        hours = self.restaurant.start_time_choices() + [f"{self.restaurant.close_time.hour:02d}:00"]
+        self.fields["window_start"].choices = [(hour, hour) for hour in hours[:-1]]
+        self.fields["window_end"].choices = [(hour, hour) for hour in hours[1:]]
 
-                end_date = date_obj
-                if end_time_obj < start_time_obj:
-                    end_date = date_obj + timedelta(days=1)
+    def clean_window_start(self):
+        return datetime.strptime(self.cleaned_data["window_start"], "%H:%M").time()
 
-                if end_date > date_obj:
-                    self.add_error(
-                        "duration_hours",
-                        f"Бронь не может переходить на следующий день"
-                    )
-                    raise ValidationError("")
-                elif end_time_obj > close_time:
-                    self.add_error(
-                        "duration_hours",
-                        f"Бронь завершится в {end_time_obj.strftime('%H:%M')}, но ресторан закрывается в {settings.CLOSE_TIME}"
-                    )
-                    raise ValidationError("")
-
-                if table and not table.is_available(date_obj, start_time_obj, duration,
-                                                    exclude_booking_id=self.instance.id):
-                    busy_times = table.get_busy_times(date_obj)
-                    busy_times_filtered = []
-                    for busy in busy_times:
-                        start_str, end_str = busy.split('-')
-                        if not (start_str == self.instance.start_time.strftime(
-                                '%H:%M') and end_str == self.instance.end_time.strftime('%H:%M')):
-                            busy_times_filtered.append(busy)
-
-                    if busy_times_filtered:
-                        self.add_error(
-                            "start_time",
-                            f"Столик занят на выбранное время. Занятое время: {', '.join(busy_times_filtered)}"
-                        )
-
-                max_future_date = now.date() + timedelta(days=settings.MAX_BOOKING_DAYS_AHEAD)
-                if date_obj > max_future_date:
-                    self.add_error(
-                        "date",
-                        f"Можно бронировать максимум на {settings.MAX_BOOKING_DAYS_AHEAD} дней вперед"
-                    )
+    def clean_window_end(self):
+        return datetime.strptime(self.cleaned_data["window_end"], "%H:%M").time()
+
+    def clean_date(self):
+        date_obj = self.cleaned_data.get("date")
+        if date_obj and date_obj < date.today():
+            raise ValidationError("Нельзя записаться на прошедшую дату")
+        max_days = self.restaurant.max_booking_days_ahead
+        if date_obj and date_obj > date.today() + timedelta(days=max_days):
+            raise ValidationError(f"Можно записаться максимум на {max_days} дней вперед")
+        return date_obj
 
-            except ValueError as e:
-                self.add_error(None, f"Ошибка обработки данных: {str(e)}")
+    def clean_guests_count(self):
+        guests = self.cleaned_data.get("guests_count")
+        if guests is not None and guests < 1:
+            raise ValidationError("Количество гостей должно быть не менее 1")
+        return guests
 
-        if table and guests_count:
-            try:
-                guests = int(guests_count)
-                if guests > table.capacity:
-                    self.add_error(
-                        "guests_count",
-                        f"Этот столик вмещает максимум {table.capacity} гостей"
-                    )
-            except ValueError:
-                pass
+    def clean(self):
+        cleaned_data = super().clean()
+        window_start = cleaned_data.get("window_start")
+        window_end = cleaned_data.get("window_end")
+        duration = cleaned_data.get("duration_hours")
+
+        if window_start and window_end and duration:
+            if window_end.hour - window_start.hour < duration:
+                self.add_error(
+                    "window_end",
+                    "Окно ожидания должно быть не короче продолжительности брони"
+                )
 
         return cleaned_data
 
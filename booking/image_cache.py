@@ -0,0 +1,191 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import ExifTags, Image
+from .images import VARIANT_FORMATS, VARIANTS_TIMEOUT, encode, open_image, resize_to_width
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только внутри процесса
+    fcntl = None
+
+# Ширины, которые можно запросить у /images/, чтобы нельзя было
+# заполнить кэш произвольными размерами
+RESIZE_WIDTHS = getattr(
+    settings, "IMAGE_RESIZE_WIDTHS", [160, 240, 320, 480, 640, 800, 960, 1280, 1600]
+)
+CONTENT_TYPES = {"webp": "image/webp", "jpg": "image/jpeg"}
+CACHE_DIR = getattr(settings, "IMAGE_CACHE_DIR", os.path.join(settings.BASE_DIR, "cache", "images"))
+CACHE_MAX_BYTES = getattr(settings, "IMAGE_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+# Повороты EXIF, после которых ширина и высота меняются местами
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+# Время последнего использования файла обновляется не чаще раза в час
+TOUCH_INTERVAL = 60 * 60
+
+# Полный обход кэша для вытеснения - не чаще раза в 10 минут, если по оценке
+# процесса лимит не превышен (другие процессы тоже пишут в кэш)
+EVICT_INTERVAL = 10 * 60
+
+thread_locks = [threading.Lock() for _ in range(256)]
+# Размер кэша на момент последнего обхода плюс копии, записанные процессом после него
+cache_size = {"bytes": None, "scanned_at": 0.0}
+size_lock = threading.Lock()
+
+
+def source_version(name):
+    """Короткий отпечаток оригинала: меняется при замене файла"""
+    stat = os.stat(default_storage.path(name))
+    return hashlib.sha256(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:12]
+
+
+def resized_url(name, width, ext, version=None):
+    return reverse(
+        "resized_image",
+        kwargs={"version": version or source_version(name), "width": width, "ext": ext, "name": name},
+    )
+
+
+def source_width(name, version):
+    """Ширина оригинала с учетом поворота из EXIF; читается только заголовок файла"""
+    # Ключ с отпечатком оригинала не устаревает и в кэше отдельного процесса
+    key = f"booking:image:width:{version}:{hashlib.md5(name.encode()).hexdigest()}"
+    width = cache.get(key)
+    if width is None:
+        with default_storage.open(name) as f:
+            image = Image.open(f)
+            width, height = image.size
+            if image.getexif().get(ExifTags.Base.Orientation) in TRANSPOSED_ORIENTATIONS:
+                width = height
+        cache.set(key, width, VARIANTS_TIMEOUT)
+    return width
+
+
+def resized_srcset(name, widths, ext):
+    """srcset из копий заданных ширин меньше оригинала, которые готовит /images/"""
+    version = source_version(name)
+    # Копия не шире оригинала: большие ширины обещали бы браузеру несуществующую четкость
+    width_limit = source_width(name, version)
+    return ", ".join(
+        f"{resized_url(name, width, ext, version)} {width}w" for width in widths if width < width_limit
+    )
+
+
+def cache_path(version, name, width, ext):
+    key = hashlib.sha256(f"{version}:{name}:{width}".encode()).hexdigest()
+    return key, os.path.join(CACHE_DIR, "files", key[:2], f"{key}.{ext}")
+
+
+@contextmanager
+def key_lock(key):
+    """Блокировка ключа в потоках процесса и между процессами (256 полос по первому байту)"""
+    stripe = key[:2]
+    with thread_locks[int(stripe, 16)]:
+        if fcntl is None:
+            yield
+            return
+        lock_dir = os.path.join(CACHE_DIR, "locks")
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(os.path.join(lock_dir, f"{stripe}.lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def open_cached(path):
+    """Открытый файл копии из кэша или None; отмечает его использование для вытеснения"""
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    if os.fstat(f.fileno()).st_mtime < time.time() - TOUCH_INTERVAL:
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+    return f
+
+
+def get_resized(name, width, ext, version):
+    """Открытый файл уменьшенной копии из дискового кэша, копия готовится при первом запросе"""
+    key, path = cache_path(version, name, width, ext)
+    f = open_cached(path)
+    if f:
+        return f
+    with key_lock(key):
+        # Пока ждали блокировку, копию мог подготовить другой запрос
+        f = open_cached(path)
+        if f:
+            return f
+        image = open_image(name, width)
+        if width < image.width:
+            image = resize_to_width(image, width)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path))
+        data = encode(image, VARIANT_FORMATS[ext])
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp, path)
+        # Файл открыт до вытеснения и будет отдан, даже если его удалят
+        f = open(path, "rb")
+    if evict_due(len(data)):
+        evict(CACHE_MAX_BYTES)
+    return f
+
+
+def evict_due(written):
+    """Учитывает записанную копию; True, если пора обойти кэш и вытеснить старые копии"""
+    now = time.monotonic()
+    with size_lock:
+        if cache_size["bytes"] is not None:
+            cache_size["bytes"] += written
+        due = (
+            cache_size["bytes"] is None
+            or cache_size["bytes"] > CACHE_MAX_BYTES
+            or now - cache_size["scanned_at"] >= EVICT_INTERVAL
+        )
+        if due:
+            # Параллельные запросы не запускают второй обход
+            cache_size["scanned_at"] = now
+        return due
+
+
+def evict(max_bytes):
+    """Удаляет давно не использованные копии, пока кэш больше max_bytes, возвращает их число"""
+    entries = []
+    for root, _, names in os.walk(os.path.join(CACHE_DIR, "files")):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    if total <= max_bytes:
+        with size_lock:
+            cache_size["bytes"] = total
+        return 0
+    # Освобождается 10% сверх лимита, чтобы не обходить кэш после каждой записи
+    target = max_bytes * 0.9
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    with size_lock:
+        cache_size["bytes"] = total
+    return removed
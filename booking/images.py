@@ -0,0 +1,138 @@
+import hashlib
+import io
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+from .cache import invalidate_pages, is_shared
+from .models import GalleryImage, MenuItem, Page, Table, TeamMember
+from .publish import schedule_publish
+
+logger = logging.getLogger(__name__)
+
+# Поля с загружаемыми изображениями, для которых готовятся уменьшенные копии
+IMAGE_FIELDS = {
+    Table: "image",
+    Page: "main_image",
+    GalleryImage: "image",
+    MenuItem: "image",
+    TeamMember: "photo",
+}
+VARIANT_WIDTHS = getattr(settings, "IMAGE_VARIANT_WIDTHS", [320, 640, 1280])
+VARIANT_QUALITY = getattr(settings, "IMAGE_VARIANT_QUALITY", 80)
+# WebP для современных браузеров, JPEG - для остальных
+VARIANT_FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+VARIANTS_TIMEOUT = 7 * 24 * 60 * 60
+
+executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "IMAGE_VARIANT_THREADS", 2),
+    thread_name_prefix="image-variants",
+)
+
+
+def variant_name(name, width, ext):
+    """Путь копии рядом с оригиналом: gallery/photo.jpg -> gallery/photo.w640.webp"""
+    root, _ = posixpath.splitext(name)
+    return f"{root}.w{width}.{ext}"
+
+
+def variants_cache_key(name):
+    return "booking:image:" + hashlib.md5(name.encode()).hexdigest()
+
+
+def has_alpha(image):
+    return image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+
+
+def open_image(name, largest=None):
+    """Открывает оригинал с учетом поворота из EXIF"""
+    with default_storage.open(name) as f:
+        image = Image.open(f)
+        # JPEG сразу декодируется в уменьшенном размере, если это не
+        # меньше самой большой копии
+        largest = (largest or max(VARIANT_WIDTHS)) + 1
+        image.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if has_alpha(image) else "RGB")
+    return image
+
+
+def encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == "JPEG":
+        if image.mode == "RGBA":
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        image.save(buffer, fmt, quality=VARIANT_QUALITY, optimize=True, progressive=True)
+    else:
+        image.save(buffer, fmt, quality=VARIANT_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def resize_to_width(image, width):
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def generate_variants(name, force=False):
+    """Готовит копии изображения всех ширин меньше оригинала, возвращает (ширины, создано)"""
+    image = open_image(name)
+    widths = [width for width in sorted(VARIANT_WIDTHS) if width < image.width]
+    created = 0
+    for width in widths:
+        names = {ext: variant_name(name, width, ext) for ext in VARIANT_FORMATS}
+        if not force and all(default_storage.exists(path) for path in names.values()):
+            continue
+        resized = resize_to_width(image, width)
+        for ext, fmt in VARIANT_FORMATS.items():
+            # Storage.save не перезаписывает файл, а подбирает новое имя
+            default_storage.delete(names[ext])
+            default_storage.save(names[ext], ContentFile(encode(resized, fmt)))
+            created += 1
+    return widths, created
+
+
+def remember_variants(name, widths):
+    if not is_shared():
+        return
+    cache.set(variants_cache_key(name), widths, VARIANTS_TIMEOUT)
+
+
+def get_variants(name):
+    """Ширины готовых копий изображения из кэша или по наличию файлов"""
+    if not name:
+        return []
+    widths = cache.get(variants_cache_key(name)) if is_shared() else None
+    if widths is None:
+        widths = [
+            width
+            for width in sorted(VARIANT_WIDTHS)
+            if default_storage.exists(variant_name(name, width, "webp"))
+        ]
+        remember_variants(name, widths)
+    return widths
+
+
+def process_image(name):
+    """Готовит копии в фоне и сбрасывает кэш страниц, где они показываются"""
+    try:
+        widths, _ = generate_variants(name)
+    except Exception:
+        logger.exception("Не удалось подготовить копии изображения %s", name)
+        return
+    remember_variants(name, widths)
+    invalidate_pages()
+    schedule_publish()
+
+
+def schedule_variants(name):
+    """Ставит подготовку копий в фоновый поток после фиксации транзакции"""
+    transaction.on_commit(lambda: executor.submit(process_image, name))
@@ -0,0 +1,190 @@
+import os
+import random
+import time as timer
+from datetime import date, time, timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from booking.availability import SlotGrid
+from booking.models import Table, Booking
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Заполнить базу тестовыми бронями и сравнить планы запросов с индексами и без"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Сколько тестовых броней создать перед замером"
+        )
+        parser.add_argument("--tables", type=int, default=60, help="Количество тестовых столиков")
+        parser.add_argument("--users", type=int, default=1000, help="Количество тестовых пользователей")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Размер пакета bulk_create")
+        parser.add_argument("--repeat", type=int, default=5, help="Сколько раз выполнять каждый запрос")
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Не удалять отдельную базу замера, чтобы повторить замер без нового --seed",
+        )
+        parser.add_argument(
+            "--replace",
+            action="store_true",
+            help="Удалить и создать заново отдельную базу замера, если она уже существует",
+        )
+        parser.add_argument(
+            "--use-current-db",
+            action="store_true",
+            help="Замер на настроенной базе: DROP INDEX блокирует таблицу броней, --seed пишет в нее тестовые данные",
+        )
+
+    def handle(self, *args, **options):
+        if options["use_current_db"]:
+            if options["keep"] or options["replace"]:
+                raise CommandError("--keep и --replace относятся к отдельной базе замера, а не к --use-current-db")
+            self.benchmark(options)
+            return
+        if options["keep"] and options["replace"]:
+            raise CommandError("Укажите --keep или --replace, но не оба")
+
+        # По умолчанию замер идет в отдельной базе (test_<имя базы>): рабочая база
+        # не блокируется и не получает тестовых данных
+        scratch_name = connection.creation._get_test_db_name()
+        # Базу с таким именем могла оставить и другая команда (manage.py test --keepdb)
+        if not options["keep"] and not options["replace"] and self.database_exists(scratch_name):
+            raise CommandError(
+                f"База {scratch_name} уже существует: --keep - замер в ней, --replace - удалить и создать заново"
+            )
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=options["replace"], serialize=False, keepdb=options["keep"]
+        )
+        self.stdout.write(f"База замера: {connection.settings_dict['NAME']}")
+        try:
+            self.benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keep"])
+
+    def database_exists(self, name):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", [name])
+                return cursor.fetchone() is not None
+        if connection.vendor == "sqlite":
+            return not connection.creation.is_in_memory_db(name) and os.path.exists(name)
+        return False
+
+    def benchmark(self, options):
+        if options["seed"]:
+            self.seed(options)
+
+        table = Table.objects.order_by("?").first()
+        user = User.objects.filter(booking__isnull=False).order_by("?").first()
+        if not table or not user:
+            self.stdout.write("Нет данных для замера. Запустите команду с --seed N")
+            return
+
+        day = Booking.objects.filter(table=table).values_list("date", flat=True).first() or date.today()
+        queries = [
+            (
+                "is_available / get_busy_times",
+                Booking.objects.filter(table=table, date=day).order_by().values_list("id", "start_time", "end_time"),
+            ),
+            (
+                "home",
+                Booking.objects.filter(table__is_active=True, date=day)
+                .order_by("start_time")
+                .values_list("table_id", "start_time", "end_time"),
+            ),
+            (
+                "booking_list",
+                Booking.objects.filter(user=user).order_by("-date", "-start_time", "-id")[:11],
+            ),
+        ]
+
+        self.stdout.write(f"Броней в базе: {Booking.objects.count()}")
+        if connection.features.can_rollback_ddl:
+            # Индексы удаляются внутри транзакции и возвращаются откатом
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for index in Booking._meta.indexes:
+                        cursor.execute(f"DROP INDEX {connection.ops.quote_name(index.name)}")
+                self.report("Без индексов", queries, options["repeat"])
+                transaction.set_rollback(True)
+        else:
+            self.stdout.write("База не поддерживает откат DDL, замер без индексов пропущен")
+        self.report("С индексами", queries, options["repeat"])
+
+    def report(self, title, queries, repeat):
+        self.stdout.write("")
+        self.stdout.write("=" * 40)
+        self.stdout.write(title)
+        self.stdout.write("=" * 40)
+        for name, queryset in queries:
+            if connection.vendor == "postgresql":
+                plan = queryset.explain(analyze=True)
+            else:
+                plan = queryset.explain()
+
+            started = timer.perf_counter()
+            for _ in range(repeat):
+                list(queryset.all())
+            elapsed = (timer.perf_counter() - started) / repeat * 1000
+
+            self.stdout.write(f"{name}: {elapsed:.2f} мс")
+            for line in plan.splitlines():
+                self.stdout.write(f"    {line}")
+
+    def seed(self, options):
+        self.stdout.write(f"Создание {options['seed']} тестовых броней...")
+        started = timer.perf_counter()
+
+        first_number = (Table.objects.order_by("-number").values_list("number", flat=True).first() or 0) + 1
+        Table.objects.bulk_create(
+            Table(number=first_number + i, capacity=random.choice([2, 4, 6, 8]))
+            for i in range(options["tables"])
+        )
+        tables = list(Table.objects.values_list("id", flat=True))
+
+        prefix = f"bench{int(timer.time())}"
+        User.objects.bulk_create(
+            User(username=f"{prefix}_{i}", email=f"{prefix}_{i}@example.com", password="!")
+            for i in range(options["users"])
+        )
+        users = list(User.objects.filter(username__startswith=prefix).values_list("id", flat=True))
+
+        grid = SlotGrid.from_settings()
+        batch = []
+        created = 0
+        day = date.today() + timedelta(days=30)
+        while created < options["seed"]:
+            for table_id in tables:
+                hour = grid.open_hour
+                while hour + 1 <= grid.close_hour and created < options["seed"]:
+                    duration = random.randint(1, 3)
+                    if hour + duration > grid.close_hour:
+                        break
+                    if random.random() < 0.6:
+                        batch.append(
+                            Booking(
+                                user_id=random.choice(users),
+                                table_id=table_id,
+                                date=day,
+                                start_time=time(hour),
+                                end_time=time(hour + duration),
+                                guests_count=2,
+                            )
+                        )
+                        created += 1
+                    hour += duration
+                if len(batch) >= options["batch_size"]:
+                    Booking.objects.bulk_create(batch)
+                    batch = []
+            day -= timedelta(days=1)
+        Booking.objects.bulk_create(batch)
+
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE booking_booking")
+
+        self.stdout.write(f"Создано {created} броней за {timer.perf_counter() - started:.1f} с")
@@ -0,0 +1,56 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import django
+from django.core.management.base import BaseCommand
+from booking.cache import invalidate_pages
+from booking.images import IMAGE_FIELDS, generate_variants, remember_variants
+from booking.publish import publish_dir, publish_pages
+
+
+def process(name, force):
+    """Выполняется в дочернем процессе и не обращается к БД, ошибка одного файла не останавливает остальные"""
+    try:
+        widths, created = generate_variants(name, force)
+    except Exception as e:
+        return name, None, 0, str(e)
+    return name, widths, created, ""
+
+
+class Command(BaseCommand):
+    help = "Подготовить уменьшенные копии всех загруженных изображений"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count(), help="Число процессов"
+        )
+        parser.add_argument(
+            "--force", action="store_true", help="Пересоздать уже готовые копии"
+        )
+
+    def handle(self, *args, **options):
+        names = set()
+        for model, field in IMAGE_FIELDS.items():
+            names.update(name for name in model.objects.values_list(field, flat=True) if name)
+
+        started = time.perf_counter()
+        created = failed = 0
+        with ProcessPoolExecutor(options["workers"], initializer=django.setup) as pool:
+            futures = [pool.submit(process, name, options["force"]) for name in sorted(names)]
+            for future in as_completed(futures):
+                name, widths, count, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f"{name}: {error}")
+                    continue
+                # Кэш процесса-воркера мог быть локальным, ширины запоминает родитель
+                remember_variants(name, widths)
+                created += count
+        invalidate_pages()
+        if publish_dir():
+            publish_pages()
+        seconds = time.perf_counter() - started
+        self.stdout.write(
+            f"Изображений: {len(names)}, создано копий: {created}, с ошибкой: {failed} "
+            f"за {seconds:.2f} с"
+        )
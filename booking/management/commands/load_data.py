@@ -1,74 +1,94 @@
-import json
 import os
-import shutil
-from django.core.management.base import BaseCommand
-from django.core.serializers import deserialize
+import time
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
-from django.db import transaction
-from booking.models import Table, Booking, Page, Feedback, GalleryImage, MenuItem, TeamMember
+from django.db import IntegrityError, transaction
+from booking.cache import bump_version, invalidate_pages
+from booking.media_backup import MEDIA_MANIFEST, media_store, restore_media, restore_media_copy
+from booking.publish import publish_dir, publish_pages
+from booking.snapshot import DELTAS, SnapshotLoader, iter_records
+
+DEFAULT_PATHS = ["data/snapshot", "data/data.json"]
 
 
 class Command(BaseCommand):
     help = "Загрузить данные и медиа файлы"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--file",
+            default=None,
+            help="Папка снимка или файл data.json старого формата (по умолчанию data/snapshot или data/data.json)",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=2000, help="Записей в одном bulk_create"
+        )
+        parser.add_argument(
+            "--copy",
+            action="store_true",
+            help="Загружать брони и отзывы через COPY (только PostgreSQL)",
+        )
+
     def handle(self, *args, **options):
-        if not os.path.exists("data/data.json"):
-            self.stdout.write("Файл data/data.json не найден")
+        path = options["file"] or next(
+            (path for path in DEFAULT_PATHS if os.path.exists(path)), DEFAULT_PATHS[0]
+        )
+        if not os.path.exists(path):
+            self.stdout.write(f"Файл {path} не найден")
             self.stdout.write("Сначала выполните: python manage.py save_data")
             return
 
-        with open("data/data.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        total_loaded = 0
-        total_errors = 0
-
-        model_map = {
-            "Table": Table,
-            "Booking": Booking,
-            "Page": Page,
-            "Feedback": Feedback,
-            "GalleryImage": GalleryImage,
-            "MenuItem": MenuItem,
-            "TeamMember": TeamMember,
-        }
-
-        with transaction.atomic():
-            for item in data:
-                model_name = item["model"]
-                records = item["data"]
-
-                self.stdout.write(f"Загрузка {model_name} ({len(records)} записей)")
-
-                for i, record in enumerate(records, 1):
-                    try:
-                        natural_key = record.get("pk")
-                        record["pk"] = None
-
-                        obj = list(deserialize("json", json.dumps([record])))[0]
-
-                        obj.object.pk = None
-
-                        obj.save(using="default")
-                        total_loaded += 1
-
-                        if i % 100 == 0:
-                            self.stdout.write(f"  Загружено {i} записей...")
-
-                    except Exception as e:
-                        total_errors += 1
-                        self.stderr.write(f"Ошибка записи {i}: {e}")
-
-        media_backup = "data/media"
-        if os.path.exists(media_backup):
-            if hasattr(settings, "MEDIA_ROOT"):
-                if os.path.exists(settings.MEDIA_ROOT):
-                    shutil.rmtree(settings.MEDIA_ROOT)
-                shutil.copytree(media_backup, settings.MEDIA_ROOT)
+        loader = SnapshotLoader(options["chunk_size"], options["copy"])
+        if options["copy"] and not loader.use_copy:
+            self.stdout.write("COPY доступен только для PostgreSQL, используется bulk_create")
+
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                self.load(loader, path, options)
+        except (KeyError, ValueError, OSError, EOFError, IntegrityError) as e:
+            raise CommandError(f"Ошибка загрузки снимка: {e!r}")
+        # bulk_create не вызывает сигналы, поэтому кэш сбрасывается явно
+        bump_version()
+        invalidate_pages()
+        total_seconds = time.perf_counter() - started
+
+        for model_name, (rows, seconds) in loader.stats.items():
+            self.stdout.write(
+                f"{model_name}: {rows} записей за {seconds:.2f} с "
+                f"({rows / max(seconds, 1e-6):.0f} в секунду)"
+            )
+
+        media_manifest = os.path.join(path, MEDIA_MANIFEST)
+        media_backup = os.path.join(os.path.dirname(os.path.normpath(path)), "media")
+        if hasattr(settings, "MEDIA_ROOT"):
+            if os.path.isfile(media_manifest):
+                try:
+                    count = restore_media(media_manifest, media_store(path), settings.MEDIA_ROOT)
+                except (ValueError, OSError) as e:
+                    raise CommandError(f"Ошибка восстановления медиа: {e!r}")
+                self.stdout.write(f"Медиа файлы восстановлены: {count}")
+            elif os.path.exists(media_backup):
+                restore_media_copy(media_backup, settings.MEDIA_ROOT)
                 self.stdout.write("Медиа файлы восстановлены")
+        if publish_dir():
+            published = publish_pages()
+            self.stdout.write(f"Статические страницы опубликованы: {len(published)}")
 
+        total_loaded = sum(rows for rows, _ in loader.stats.values())
         self.stdout.write("")
         self.stdout.write("=" * 40)
-        self.stdout.write(f"Загружено записей: {total_loaded}")
-        self.stdout.write(f"Ошибок: {total_errors}")
+        self.stdout.write(f"Загружено записей: {total_loaded} за {total_seconds:.2f} с")
+        if loader.deleted:
+            self.stdout.write(f"Удалено записей: {loader.deleted}")
+        self.stdout.write(f"Пропущено (неизвестные модели): {loader.skipped}")
         self.stdout.write("=" * 40)
+
+    def load(self, loader, path, options):
+        loader.load(iter_records(path))
+        deltas = os.path.join(path, DELTAS)
+        if os.path.isdir(deltas) and os.listdir(deltas):
+            self.stdout.write(
+                "Загружен только полный снимок. Для инкрементальных снимков выполните: "
+                "python manage.py restore_data"
+            )
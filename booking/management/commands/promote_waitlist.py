@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from booking.waitlist import promote_pending
+
+
+class Command(BaseCommand):
+    help = "Перевести в брони заявки из листа ожидания, для которых освободились столики"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true", help="Работать постоянно, проверяя лист ожидания"
+        )
+        parser.add_argument(
+            "--interval", type=float, default=60, help="Пауза между проверками, сек."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                promoted = promote_pending()
+                if promoted:
+                    self.stdout.write(f"Переведено в брони: {len(promoted)}")
+                if not options["loop"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from booking.publish import page_names, publish_dir, publish_pages
+
+
+class Command(BaseCommand):
+    help = "Опубликовать главную и страницы сайта статическими файлами для прокси"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", help="Папка для страниц (по умолчанию STATIC_PAGES_DIR)"
+        )
+        parser.add_argument(
+            "pages", nargs="*", help=f"Страницы: {', '.join(page_names())} (по умолчанию все)"
+        )
+
+    def handle(self, *args, **options):
+        directory = options["output"] or publish_dir()
+        if not directory:
+            raise CommandError("Укажите --output или STATIC_PAGES_DIR в настройках")
+        unknown = set(options["pages"]) - set(page_names())
+        if unknown:
+            raise CommandError(f"Неизвестные страницы: {', '.join(sorted(unknown))}")
+
+        started = time.perf_counter()
+        published = publish_pages(options["pages"], directory)
+        for path, target in published:
+            self.stdout.write(f"{path} -> {target}")
+        self.stdout.write(
+            f"Опубликовано страниц: {len(published)} за {time.perf_counter() - started:.2f} с"
+        )
@@ -0,0 +1,18 @@
+from booking.management.commands import load_data
+
+
+class Command(load_data.Command):
+    help = "Восстановить данные из полного снимка и цепочки инкрементальных снимков"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--until",
+            type=int,
+            default=None,
+            help="Номер последнего применяемого инкрементального снимка (0 - только полный)",
+        )
+
+    def load(self, loader, path, options):
+        chain = loader.restore(path, options["until"])
+        self.stdout.write(f"Применено инкрементальных снимков: {len(chain) - 1}")
@@ -1,37 +1,51 @@
-import json
 import os
-import shutil
+import time
 from django.core.management.base import BaseCommand
-from django.core import serializers
 from django.conf import settings
-from booking.models import Table, Booking, Page, Feedback, GalleryImage, MenuItem, TeamMember
+from booking.media_backup import MEDIA_MANIFEST, backup_media, media_store
+from booking.snapshot import MANIFEST, write_delta, write_snapshot
 
 
 class Command(BaseCommand):
     help = "Сохранить все данные и медиа файлы"
 
-    def handle(self, *args, **options):
-        if not os.path.exists("data"):
-            os.makedirs("data")
-
-        all_data = []
-
-        for model in [Table, Booking, Page, Feedback, GalleryImage, MenuItem, TeamMember]:
-            try:
-                data = serializers.serialize("json", model.objects.all())
-                all_data.append({"model": model.__name__, "data": json.loads(data)})
-                print(f"Сохранено: {model.__name__}")
-            except Exception as e:
-                print(f"Ошибка {model.__name__}: {e}")
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", default="data/snapshot", help="Папка снимка"
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=2000, help="Записей, читаемых из базы за раз"
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Сохранить только изменения после последнего снимка",
+        )
 
-        with open("data/data.json", "w", encoding="utf-8") as f:
-            json.dump(all_data, f, indent=2)
+    def handle(self, *args, **options):
+        def report(model, rows, seconds):
+            self.stdout.write(
+                f"Сохранено: {model.__name__} - {rows} записей за {seconds:.2f} с "
+                f"({rows / max(seconds, 1e-6):.0f} в секунду)"
+            )
+
+        output = options["output"]
+        if options["incremental"] and os.path.exists(os.path.join(output, MANIFEST)):
+            manifest = write_delta(output, options["chunk_size"], on_model=report)
+            tombstones = manifest["tombstones"]["rows"]
+            self.stdout.write(f"Инкрементальный снимок сохранен, удаленных записей: {tombstones}")
+        else:
+            if options["incremental"]:
+                self.stdout.write("Полного снимка еще нет, сохраняется полный снимок")
+            write_snapshot(output, options["chunk_size"], on_model=report)
 
         if hasattr(settings, "MEDIA_ROOT") and os.path.exists(settings.MEDIA_ROOT):
-            media_backup = "data/media"
-            if os.path.exists(media_backup):
-                shutil.rmtree(media_backup)
-            shutil.copytree(settings.MEDIA_ROOT, media_backup)
-            print(f"Медиа файлы сохранены в {media_backup}")
-
-        print("Все данные сохранены в папке data/")
+            started = time.perf_counter()
+            stats = backup_media(settings.MEDIA_ROOT, media_store(output), os.path.join(output, MEDIA_MANIFEST))
+            self.stdout.write(
+                f"Медиа файлы: {stats['files']}, прочитано заново: {stats['hashed']}, "
+                f"скопировано: {stats['copied']} ({stats['copied_bytes'] / 1024 / 1024:.1f} МБ), "
+                f"удалено из хранилища: {stats['removed']} за {time.perf_counter() - started:.2f} с"
+            )
+
+        self.stdout.write(f"Все данные сохранены в папке {output}")
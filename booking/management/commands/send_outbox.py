@@ -0,0 +1,41 @@
+import time
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from booking.outbox import BATCH_SIZE, MAX_ATTEMPTS, send_pending
+
+
+class Command(BaseCommand):
+    help = "Отправить письма из очереди"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=BATCH_SIZE, help="Писем за одну транзакцию"
+        )
+        parser.add_argument(
+            "--max-attempts", type=int, default=MAX_ATTEMPTS, help="Попыток до статуса «Не доставлено»"
+        )
+        parser.add_argument(
+            "--loop", action="store_true", help="Работать постоянно, проверяя очередь"
+        )
+        parser.add_argument(
+            "--interval", type=float, default=10, help="Пауза между проверками очереди, сек."
+        )
+
+    def handle(self, *args, **options):
+        connection = get_connection()
+        try:
+            while True:
+                sent, failed = send_pending(
+                    connection, options["batch_size"], options["max_attempts"]
+                )
+                if sent or failed:
+                    self.stdout.write(f"Отправлено: {sent}, с ошибкой: {failed}")
+                if not options["loop"]:
+                    break
+                # Не держим SMTP-соединение открытым, пока очередь пуста
+                connection.close()
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
@@ -0,0 +1,89 @@
+import time
+from datetime import timedelta
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.loader import get_template
+from django.utils import timezone
+from booking.models import Booking, OutgoingEmail
+from booking.outbox import send_pending
+from booking.utils import build_email, email_context
+
+SUBJECT = "Напоминание о бронировании"
+TEMPLATE = "emails/booking_reminder.html"
+
+
+class Command(BaseCommand):
+    help = "Отправить напоминания о завтрашних бронированиях"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=500, help="Броней за один запрос"
+        )
+        parser.add_argument(
+            "--no-send",
+            action="store_true",
+            help="Только поставить письма в очередь, отправит send_outbox",
+        )
+
+    def handle(self, *args, **options):
+        day = timezone.localdate() + timedelta(days=1)
+        # Шаблон компилируется один раз на весь запуск
+        template = get_template(TEMPLATE)
+        started = time.perf_counter()
+
+        queued = 0
+        for chunk in self.iter_chunks(day, options["chunk_size"]):
+            emails = [
+                build_email(
+                    booking.user.email,
+                    SUBJECT,
+                    template.render(email_context(user=booking.user, booking=booking)),
+                )
+                for booking in chunk
+            ]
+            # Письма и отметка о напоминании фиксируются вместе, повторный
+            # запуск не поставит их в очередь еще раз
+            with transaction.atomic():
+                OutgoingEmail.objects.bulk_create(emails)
+                now = timezone.now()
+                Booking.objects.filter(id__in=[booking.id for booking in chunk]).update(
+                    reminder_sent_at=now, updated_at=now
+                )
+            queued += len(chunk)
+        queue_seconds = time.perf_counter() - started
+        self.stdout.write(
+            f"Напоминаний на {day}: {queued} за {queue_seconds:.2f} с "
+            f"({queued / max(queue_seconds, 1e-6):.0f} в секунду)"
+        )
+
+        if options["no_send"] or not queued:
+            return
+        started = time.perf_counter()
+        connection = get_connection()
+        try:
+            sent, failed = send_pending(connection)
+        finally:
+            connection.close()
+        send_seconds = time.perf_counter() - started
+        self.stdout.write(
+            f"Отправлено: {sent}, с ошибкой: {failed} за {send_seconds:.2f} с "
+            f"({sent / max(send_seconds, 1e-6):.0f} в секунду)"
+        )
+
+    def iter_chunks(self, day, chunk_size):
+        """Брони на дату без напоминания пачками по возрастанию id"""
+        bookings = (
+            Booking.objects.filter(
+                date=day, reminder_sent_at__isnull=True, combined_with__isnull=True
+            )
+            .select_related("user", "table")
+            .order_by("id")
+        )
+        last_id = 0
+        while True:
+            chunk = list(bookings.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1].id
@@ -0,0 +1,24 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.urls import NoReverseMatch, reverse
+from booking.cache import invalidate_pages
+from booking.models import Page
+from booking.views import page_detail
+
+
+class Command(BaseCommand):
+    help = "Заполнить кэш страниц сайта (запускается после деплоя)"
+
+    def handle(self, *args, **options):
+        invalidate_pages()
+        factory = RequestFactory()
+        for page_type, title in Page.PAGE_TYPES:
+            try:
+                path = reverse(page_type)
+            except NoReverseMatch:
+                continue
+            request = factory.get(path)
+            request.user = AnonymousUser()
+            response = page_detail(request, page_type)
+            self.stdout.write(f"{title} ({path}): {response.status_code}, {len(response.content)} байт")
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+MEDIA_MANIFEST = "media.json"
+# Список манифестов снимков, которые ссылаются на хранилище
+MANIFEST_REFS = "manifests.json"
+HASH_BLOCK = 1024 * 1024
+# Временные папки восстановления внутри папки медиа
+STAGING_PREFIX = ".media-restore-"
+
+
+def media_store(snapshot_path):
+    """Хранилище медиа рядом со снимком, общее для всех снимков"""
+    return os.path.join(os.path.dirname(os.path.abspath(snapshot_path)), "media-store")
+
+
+def file_sha256(path):
+    checksum = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def object_path(store, digest):
+    return os.path.join(store, "objects", digest[:2], digest)
+
+
+def read_media_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["files"]
+
+
+def write_media_manifest(path, files):
+    """Записывает манифест через временный файл, чтобы не оставить его недописанным"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".media-", dir=directory)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"files": files}, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def iter_media_files(media_root):
+    """Относительные пути всех файлов в папке медиа"""
+    for root, dirs, files in os.walk(media_root):
+        dirs[:] = [name for name in dirs if not name.startswith(".")]
+        for name in files:
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, media_root).replace(os.sep, "/"), path
+
+
+def backup_media(media_root, store, manifest_path):
+    """Сохраняет медиа в хранилище по хэшу содержимого и пишет манифест путь -> хэш"""
+    # Последний манифест хранилища переживает замену папки полного снимка
+    latest_path = os.path.join(store, MEDIA_MANIFEST)
+    previous = read_media_manifest(latest_path)
+    files = {}
+    stats = {"files": 0, "hashed": 0, "copied": 0, "copied_bytes": 0}
+    os.makedirs(store, exist_ok=True)
+    for relpath, path in iter_media_files(media_root):
+        stat = os.stat(path)
+        entry = previous.get(relpath)
+        # Размер и время изменения не поменялись - файл заново не читается
+        if not entry or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+            entry = {"sha256": file_sha256(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            stats["hashed"] += 1
+        target = object_path(store, entry["sha256"])
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(target))
+            os.close(fd)
+            shutil.copy(path, tmp)
+            os.replace(tmp, target)
+            stats["copied"] += 1
+            stats["copied_bytes"] += stat.st_size
+        files[relpath] = entry
+        stats["files"] += 1
+    write_media_manifest(manifest_path, files)
+    write_media_manifest(latest_path, files)
+    # Хранилище общее: объекты нужны всем снимкам, а не только последнему
+    stats["removed"] = prune_store(store, register_manifest(store, manifest_path))
+    return stats
+
+
+def register_manifest(store, manifest_path):
+    """Добавляет манифест в список хранилища, возвращает все манифесты, которые еще существуют"""
+    refs_path = os.path.join(store, MANIFEST_REFS)
+    refs = []
+    if os.path.exists(refs_path):
+        with open(refs_path, encoding="utf-8") as f:
+            refs = json.load(f)["manifests"]
+    refs.append(os.path.abspath(manifest_path))
+    # Удаленный снимок больше не держит свои объекты
+    refs = sorted(path for path in set(refs) if os.path.exists(path))
+    fd, tmp = tempfile.mkstemp(prefix=".media-", dir=store)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"manifests": refs}, f, indent=2)
+    os.replace(tmp, refs_path)
+    return refs + [os.path.join(store, MEDIA_MANIFEST)]
+
+
+def prune_store(store, manifest_paths):
+    """Удаляет из хранилища объекты, на которые не ссылается ни один манифест"""
+    keep = set()
+    for path in manifest_paths:
+        keep.update(entry["sha256"] for entry in read_media_manifest(path).values())
+    removed = 0
+    objects = os.path.join(store, "objects")
+    if not os.path.isdir(objects):
+        return removed
+    for root, _, names in os.walk(objects):
+        for name in names:
+            if name not in keep:
+                os.remove(os.path.join(root, name))
+                removed += 1
+    return removed
+
+
+def make_staging(media_root):
+    """Скрытая пустая папка внутри папки медиа: тот же диск, перенос - атомарный rename"""
+    os.makedirs(media_root, exist_ok=True)
+    return tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=media_root)
+
+
+def swap_contents(staging, media_root):
+    """Заменяет содержимое папки медиа содержимым staging по одному элементу
+
+    Сама папка остается на месте: в docker-compose она точка монтирования тома,
+    ее нельзя переименовать. Прежний элемент уходит в сторону и сразу же на его
+    место переносится новый, поэтому элемент верхнего уровня (например, gallery)
+    отсутствует только между двумя вызовами rename, а не на время всей замены.
+    """
+    previous = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=media_root)
+    swapped = []
+    try:
+        for name in sorted(os.listdir(staging)):
+            target = os.path.join(media_root, name)
+            if os.path.lexists(target):
+                os.rename(target, os.path.join(previous, name))
+            swapped.append(name)
+            os.rename(os.path.join(staging, name), target)
+        # Элементы, которых нет в восстановленных медиа
+        for name in os.listdir(media_root):
+            if not name.startswith(STAGING_PREFIX) and name not in swapped:
+                os.rename(os.path.join(media_root, name), os.path.join(previous, name))
+    except BaseException:
+        # Убираем уже перенесенные новые элементы и возвращаем прежние на место
+        for name in swapped:
+            target = os.path.join(media_root, name)
+            if os.path.isdir(target) and not os.path.islink(target):
+                shutil.rmtree(target)
+            elif os.path.lexists(target):
+                os.remove(target)
+        for name in os.listdir(previous):
+            os.rename(os.path.join(previous, name), os.path.join(media_root, name))
+        raise
+    finally:
+        shutil.rmtree(previous, ignore_errors=True)
+    os.rmdir(staging)
+
+
+def restore_media(manifest_path, store, media_root):
+    """Собирает файлы медиа по манифесту во временной папке и подменяет ими содержимое папки медиа"""
+    files = read_media_manifest(manifest_path)
+    for entry in files.values():
+        if not os.path.exists(object_path(store, entry["sha256"])):
+            raise ValueError(f"В хранилище медиа нет объекта {entry['sha256']}")
+
+    media_root = os.path.abspath(media_root)
+    staging = make_staging(media_root)
+    try:
+        for relpath, entry in files.items():
+            target = os.path.join(staging, *relpath.split("/"))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # Копия, а не жесткая ссылка: запись в файл медиа не должна менять объект хранилища
+            shutil.copyfile(object_path(store, entry["sha256"]), target)
+        swap_contents(staging, media_root)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return len(files)
+
+
+def restore_media_copy(source, media_root):
+    """Восстанавливает медиа из обычной копии папки (снимки старого формата)"""
+    media_root = os.path.abspath(media_root)
+    staging = make_staging(media_root)
+    try:
+        shutil.copytree(source, staging, dirs_exist_ok=True)
+        swap_contents(staging, media_root)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
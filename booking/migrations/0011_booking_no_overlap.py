@@ -0,0 +1,73 @@
+from django.db import migrations
+
+
+def booking_range(alias=""):
+    """Интервал брони; конец раньше начала означает переход через полночь"""
+    prefix = f"{alias}." if alias else ""
+    date, start, end = f'{prefix}"date"', f"{prefix}start_time", f"{prefix}end_time"
+    return (
+        f"tsrange({date} + {start}, {date} + {end} + CASE WHEN {end} < {start} "
+        "THEN interval '1 day' ELSE interval '0' END, '[)')"
+    )
+
+
+BOOKING_RANGE = booking_range()
+# Сколько пересекающихся пар показать в ошибке
+OVERLAP_REPORT_LIMIT = 20
+
+
+def find_overlaps(schema_editor):
+    """Пары пересекающихся броней одного столика, которые помешают добавить ограничение"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT a.id, b.id, a.table_id, a.\"date\", a.start_time, a.end_time, b.start_time, b.end_time "
+            "FROM booking_booking a JOIN booking_booking b "
+            "ON a.table_id = b.table_id AND a.id < b.id "
+            f"AND {booking_range('a')} && {booking_range('b')} "
+            "ORDER BY a.\"date\", a.table_id, a.id LIMIT %s",
+            [OVERLAP_REPORT_LIMIT + 1],
+        )
+        return cursor.fetchall()
+
+
+def add_no_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    overlaps = find_overlaps(schema_editor)
+    if overlaps:
+        # Какую из броней оставить, решает администратор: миграция ничего не удаляет
+        lines = [
+            f"  бронь #{first} ({start_a:%H:%M}-{end_a:%H:%M}) и бронь #{second} ({start_b:%H:%M}-{end_b:%H:%M}), "
+            f"столик id={table_id}, {day:%Y-%m-%d}"
+            for first, second, table_id, day, start_a, end_a, start_b, end_b in overlaps[:OVERLAP_REPORT_LIMIT]
+        ]
+        if len(overlaps) > OVERLAP_REPORT_LIMIT:
+            lines.append("  ...")
+        raise RuntimeError(
+            "Нельзя добавить ограничение booking_no_overlap: в базе есть пересекающиеся брони. "
+            "Перенесите или отмените их и повторите migrate:\n" + "\n".join(lines)
+        )
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    schema_editor.execute(
+        "ALTER TABLE booking_booking ADD CONSTRAINT booking_no_overlap "
+        f"EXCLUDE USING gist (table_id WITH =, {BOOKING_RANGE} WITH &&)"
+    )
+
+
+def remove_no_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "ALTER TABLE booking_booking DROP CONSTRAINT IF EXISTS booking_no_overlap"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("booking", "0010_page_teammember_menuitem_galleryimage"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_no_overlap_constraint, remove_no_overlap_constraint),
+    ]
@@ -0,0 +1,84 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.core.validators
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("booking", "0012_booking_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WaitlistEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="Дата")),
+                ("window_start", models.TimeField(verbose_name="Начало окна")),
+                ("window_end", models.TimeField(verbose_name="Конец окна")),
+                (
+                    "duration_hours",
+                    models.IntegerField(
+                        default=2,
+                        validators=[django.core.validators.MinValueValidator(1)],
+                        verbose_name="Продолжительность",
+                    ),
+                ),
+                (
+                    "guests_count",
+                    models.IntegerField(verbose_name="Количество гостей"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Дата создания"),
+                ),
+                (
+                    "promoted_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Дата перевода в бронь"
+                    ),
+                ),
+                (
+                    "promoted_booking",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="booking.booking",
+                        verbose_name="Созданное бронирование",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Заявка в листе ожидания",
+                "verbose_name_plural": "Лист ожидания",
+                "ordering": ["created_at"],
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("promoted_at__isnull", True)),
+                        fields=["date", "window_start", "window_end", "created_at"],
+                        name="waitlist_date_window_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("booking", "0013_waitlistentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="table",
+            name="adjacent_tables",
+            field=models.ManyToManyField(
+                blank=True,
+                help_text="Столики, которые можно сдвинуть с этим для большой компании",
+                to="booking.table",
+                verbose_name="Соседние столики",
+            ),
+        ),
+        migrations.AddField(
+            model_name="booking",
+            name="combined_with",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="combined_bookings",
+                to="booking.booking",
+                verbose_name="Основное бронирование",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("booking", "0015_outgoingemail"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="booking",
+            name="reminder_sent_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Напоминание отправлено"
+            ),
+        ),
+    ]
@@ -0,0 +1,130 @@
+import datetime
+import django.core.validators
+from django.conf import settings
+from django.db import migrations, models
+
+
+def parse_time(value, default):
+    try:
+        return datetime.datetime.strptime(value, "%H:%M").time()
+    except (TypeError, ValueError):
+        return default
+
+
+def fill_from_env(apps, schema_editor):
+    """Переносит в существующую запись настройки, которые раньше читались из .env"""
+    # Копия значений на момент миграции: booking.restaurant может измениться
+    RestaurantSettings = apps.get_model("booking", "RestaurantSettings")
+    RestaurantSettings.objects.update(
+        restaurant_name=getattr(settings, "RESTAURANT_NAME", None) or "",
+        head_name=getattr(settings, "RESTAURANT_HEAD_NAME", None) or "",
+        description=getattr(settings, "RESTAURANT_DESCRIPTION", None) or "",
+        contact_phone=getattr(settings, "CONTACT_PHONE", None) or "",
+        contact_email=getattr(settings, "CONTACT_EMAIL", None) or "",
+        address=getattr(settings, "ADDRESS", None) or "",
+        open_time=parse_time(getattr(settings, "OPEN_TIME", None), datetime.time(10, 0)),
+        close_time=parse_time(getattr(settings, "CLOSE_TIME", None), datetime.time(23, 0)),
+        min_booking_hours=getattr(settings, "MIN_BOOKING_HOURS", 1),
+        max_booking_hours=getattr(settings, "MAX_BOOKING_HOURS", 4),
+        max_booking_days_ahead=getattr(settings, "MAX_BOOKING_DAYS_AHEAD", 30),
+        booking_rules="\n".join(getattr(settings, "BOOKING_RULES", [])),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("booking", "0017_deletedrecord_booking_updated_idx"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="table",
+            name="capacity",
+            field=models.IntegerField(
+                help_text="Максимальное количество гостей",
+                validators=[django.core.validators.MinValueValidator(1)],
+                verbose_name="Вместимость",
+            ),
+        ),
+        migrations.AddField(
+            model_name="restaurantsettings",
+            name="restaurant_name",
+            field=models.CharField(blank=True, max_length=200, verbose_name="Название"),
+        ),
+        migrations.AddField(
+            model_name="restaurantsettings",
+            name="head_name",
+            field=models.CharField(blank=True, max_length=200, verbose_name="Название в шапке"),
+        ),
+        migrations.AddField(
+            model_name="restaurantsettings",
+            name="description",
+            field=models.TextField(blank=True, verbose_name="Описание"),
+        ),
+        migrations.AddField(
+            model_name="restaurantsettings",
+            name="contact_phone",
+            field=models.CharField(blank=True, max_length=50, verbose_name="Телефон"),
+        ),
+        migrations.AddField(
+            model_name="restaurantsettings",
+            name="contact_email",
+            field=models.EmailField(blank=True, max_length=254, verbose_name="Email"),
+        ),
+        migrations.AddField(
+            model_name="restaurantsettings",
+            name="address",
+            field=models.CharField(blank=True, max_length=300, verbose_name="Адрес"),
+        ),
+        migrations.AddField(
+            model_name="restaurantsettings",
+            name="open_time",
+            field=models.TimeField(default=datetime.time(10, 0), verbose_name="Время открытия"),
+        ),
+        migrations.AddField(
+            model_name="restaurantsettings",
+            name="close_time",
+            field=models.TimeField(default=datetime.time(23, 0), verbose_name="Время закрытия"),
+        ),
+        migrations.AddField(
+            model_name="restaurantsettings",
+            name="min_booking_hours",
+            field=models.PositiveSmallIntegerField(
+                default=1,
+                validators=[django.core.validators.MinValueValidator(1)],
+                verbose_name="Минимальная длительность брони (ч)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="restaurantsettings",
+            name="max_booking_hours",
+            field=models.PositiveSmallIntegerField(
+                default=4,
+                validators=[django.core.validators.MinValueValidator(1)],
+                verbose_name="Максимальная длительность брони (ч)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="restaurantsettings",
+            name="max_booking_days_ahead",
+            field=models.PositiveSmallIntegerField(
+                default=30, verbose_name="На сколько дней вперед можно бронировать"
+            ),
+        ),
+        migrations.AddField(
+            model_name="restaurantsettings",
+            name="booking_rules",
+            field=models.TextField(
+                blank=True,
+                help_text="Каждое правило с новой строки",
+                verbose_name="Правила бронирования",
+            ),
+        ),
+        migrations.AddField(
+            model_name="restaurantsettings",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Дата обновления"),
+        ),
+        migrations.RunPython(fill_from_env, migrations.RunPython.noop),
+    ]
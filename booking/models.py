@@ -1,7 +1,9 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from datetime import datetime, timedelta
+from django.utils import timezone
+from datetime import datetime, time, timedelta
 
 User = get_user_model()
 
@@ -20,6 +22,12 @@ class Table(models.Model):
     image = models.ImageField(
         upload_to="tables/", blank=True, null=True, verbose_name="Изображение"
     )
+    adjacent_tables = models.ManyToManyField(
+        "self",
+        blank=True,
+        verbose_name="Соседние столики",
+        help_text="Столики, которые можно сдвинуть с этим для большой компании",
+    )
 
     class Meta:
         verbose_name = "Столик"
@@ -28,36 +36,29 @@ class Table(models.Model):
     def __str__(self):
         return f"Столик №{self.number} ({self.capacity} чел.)"
 
-    def get_busy_times(self, date):
-        """Возвращает список занятых временных слотов"""
-        bookings = Booking.objects.filter(table=self, date=date).order_by("start_time")
+    def get_day_availability(self, date):
+        """Загружает занятость столика на дату одним запросом"""
+        from .availability import load_day
 
-        busy_times = []
-        for booking in bookings:
-            start_time = booking.start_time.strftime("%H:%M")
-            end_time = booking.end_time.strftime("%H:%M")
-            busy_times.append(f"{start_time}-{end_time}")
+        return load_day(self, date)
 
-        return busy_times
+    def get_busy_times(self, date):
+        """Возвращает список занятых временных слотов"""
+        return self.get_day_availability(date).busy_times()
 
     def is_available(self, date, start_time, duration_hours, exclude_booking_id=None):
         """Проверяет доступность столика в указанное время"""
-        end_time = (
-            datetime.combine(date, start_time) + timedelta(hours=duration_hours)
-        ).time()
-
-        conflicting_bookings = Booking.objects.filter(table=self, date=date).filter(
-            start_time__lt=end_time, end_time__gt=start_time
+        return self.get_day_availability(date).is_available(
+            start_time, duration_hours, exclude_booking_id
         )
 
-        if exclude_booking_id:
-            conflicting_bookings = conflicting_bookings.exclude(id=exclude_booking_id)
-
-        return not conflicting_bookings.exists()
-
 
 class Booking(models.Model):
     """Модель бронирования столика"""
+    # Ограничение исключения в PostgreSQL (миграция 0011) не дает
+    # сохранить две пересекающиеся по времени брони одного столика
+    NO_OVERLAP_CONSTRAINT = "booking_no_overlap"
+
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, verbose_name="Пользователь"
     )
@@ -69,6 +70,19 @@ class Booking(models.Model):
     special_requests = models.TextField(
         blank=True, null=True, verbose_name="Специальные пожелания"
     )
+    # Бронь на несколько сдвинутых столиков - основная запись и по одной
+    # связанной записи на каждый дополнительный столик
+    combined_with = models.ForeignKey(
+        "self",
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name="combined_bookings",
+        verbose_name="Основное бронирование",
+    )
+    reminder_sent_at = models.DateTimeField(
+        blank=True, null=True, verbose_name="Напоминание отправлено"
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
@@ -76,10 +90,50 @@ class Booking(models.Model):
         verbose_name = "Бронирование"
         verbose_name_plural = "Бронирования"
         ordering = ["-date", "-start_time"]
+        indexes = [
+            # Занятость столика на дату: is_available, get_busy_times, home
+            models.Index(
+                fields=["table", "date", "start_time"],
+                include=["end_time", "id"],
+                name="booking_table_date_idx",
+            ),
+            # Версия броней на дату для ETag свободных слотов: Max(updated_at) и Count
+            # считаются только по индексу
+            models.Index(
+                fields=["date"],
+                include=["updated_at"],
+                name="booking_date_idx",
+            ),
+            # Список броней пользователя по курсору (date, start_time, id): booking_list
+            models.Index(
+                fields=["user", "-date", "-start_time", "-id"],
+                name="booking_user_cursor_idx",
+            ),
+            # Измененные брони для инкрементального снимка
+            models.Index(fields=["updated_at"], name="booking_updated_idx"),
+        ]
 
     def __str__(self):
         return f"Бронирование #{self.id}"
 
+    def add_combined_tables(self, tables):
+        """Занимает дополнительные столики на время брони"""
+        for table in tables:
+            Booking.objects.create(
+                user=self.user,
+                table=table,
+                date=self.date,
+                start_time=self.start_time,
+                end_time=self.end_time,
+                guests_count=0,
+                combined_with=self,
+            )
+
+    @classmethod
+    def is_overlap_error(cls, error):
+        """Проверяет, что IntegrityError вызван пересечением броней"""
+        return cls.NO_OVERLAP_CONSTRAINT in str(error)
+
     @property
     def duration_hours(self):
         """Продолжительность бронирования в часах"""
@@ -93,6 +147,110 @@ class Booking(models.Model):
         return 0
 
 
+class WaitlistEntry(models.Model):
+    """Заявка в листе ожидания"""
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, verbose_name="Пользователь"
+    )
+    date = models.DateField(verbose_name="Дата")
+    window_start = models.TimeField(verbose_name="Начало окна")
+    window_end = models.TimeField(verbose_name="Конец окна")
+    duration_hours = models.IntegerField(
+        default=2, validators=[MinValueValidator(1)], verbose_name="Продолжительность"
+    )
+    guests_count = models.IntegerField(verbose_name="Количество гостей")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    promoted_booking = models.ForeignKey(
+        Booking,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        verbose_name="Созданное бронирование",
+    )
+    promoted_at = models.DateTimeField(
+        blank=True, null=True, verbose_name="Дата перевода в бронь"
+    )
+
+    class Meta:
+        verbose_name = "Заявка в листе ожидания"
+        verbose_name_plural = "Лист ожидания"
+        ordering = ["created_at"]
+        indexes = [
+            # Поиск ожидающих заявок при освобождении столика
+            models.Index(
+                fields=["date", "window_start", "window_end", "created_at"],
+                condition=models.Q(promoted_at__isnull=True),
+                name="waitlist_date_window_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Ожидание #{self.id} на {self.date}"
+
+
+class OutgoingEmail(models.Model):
+    """Письмо в очереди на отправку"""
+    STATUS_PENDING = "pending"
+    STATUS_SENT = "sent"
+    STATUS_DEAD = "dead"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "В очереди"),
+        (STATUS_SENT, "Отправлено"),
+        (STATUS_DEAD, "Не доставлено"),
+    ]
+
+    to_email = models.EmailField(verbose_name="Получатель")
+    subject = models.CharField(max_length=255, verbose_name="Тема")
+    body = models.TextField(verbose_name="Текст")
+    html_body = models.TextField(blank=True, verbose_name="HTML")
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name="Статус",
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Попытки")
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now, verbose_name="Следующая попытка"
+    )
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    sent_at = models.DateTimeField(blank=True, null=True, verbose_name="Дата отправки")
+
+    class Meta:
+        verbose_name = "Исходящее письмо"
+        verbose_name_plural = "Исходящие письма"
+        ordering = ["-created_at"]
+        indexes = [
+            # Выборка очередной пачки писем обработчиком очереди
+            models.Index(
+                fields=["next_attempt_at"],
+                condition=models.Q(status="pending"),
+                name="outgoing_email_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} → {self.to_email}"
+
+
+class DeletedRecord(models.Model):
+    """Отметка об удалении записи для инкрементальных снимков"""
+    model = models.CharField(max_length=100, verbose_name="Модель")
+    object_id = models.BigIntegerField(verbose_name="ID записи")
+    deleted_at = models.DateTimeField(
+        auto_now_add=True, db_index=True, verbose_name="Дата удаления"
+    )
+
+    class Meta:
+        verbose_name = "Удаленная запись"
+        verbose_name_plural = "Удаленные записи"
+        ordering = ["deleted_at"]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id}"
+
+
 class Feedback(models.Model):
     """Модель отзыва о ресторане"""
     name = models.CharField(max_length=100, verbose_name="Имя")
@@ -216,3 +374,56 @@ class TeamMember(models.Model):
 
     def __str__(self):
         return f"{self.name} - {self.position}"
+
+
+class RestaurantSettings(models.Model):
+    """Настройки ресторана (одна запись), начальные значения берутся из .env"""
+    max_table_capacity = models.IntegerField(
+        default=12, verbose_name="Максимальная вместимость столика"
+    )
+    table_capacities = models.JSONField(
+        default=list,
+        verbose_name="Доступные вместимости столиков",
+        help_text="В формате [2, 4, 6, 8, 10, 12]",
+    )
+    booking_statuses = models.JSONField(
+        default=list,
+        verbose_name="Статусы бронирований",
+        help_text="В формате ['active', 'cancelled']",
+    )
+    restaurant_name = models.CharField(max_length=200, blank=True, verbose_name="Название")
+    head_name = models.CharField(max_length=200, blank=True, verbose_name="Название в шапке")
+    description = models.TextField(blank=True, verbose_name="Описание")
+    contact_phone = models.CharField(max_length=50, blank=True, verbose_name="Телефон")
+    contact_email = models.EmailField(blank=True, verbose_name="Email")
+    address = models.CharField(max_length=300, blank=True, verbose_name="Адрес")
+    open_time = models.TimeField(default=time(10, 0), verbose_name="Время открытия")
+    close_time = models.TimeField(default=time(23, 0), verbose_name="Время закрытия")
+    min_booking_hours = models.PositiveSmallIntegerField(
+        default=1, validators=[MinValueValidator(1)], verbose_name="Минимальная длительность брони (ч)"
+    )
+    max_booking_hours = models.PositiveSmallIntegerField(
+        default=4, validators=[MinValueValidator(1)], verbose_name="Максимальная длительность брони (ч)"
+    )
+    max_booking_days_ahead = models.PositiveSmallIntegerField(
+        default=30, verbose_name="На сколько дней вперед можно бронировать"
+    )
+    booking_rules = models.TextField(
+        blank=True, verbose_name="Правила бронирования", help_text="Каждое правило с новой строки"
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Настройки ресторана"
+        verbose_name_plural = "Настройки ресторана"
+
+    def __str__(self):
+        return "Настройки ресторана"
+
+    def clean(self):
+        if self.open_time and self.close_time and self.close_time <= self.open_time:
+            raise ValidationError({"close_time": "Ресторан должен закрываться позже открытия"})
+        if self.max_booking_hours and self.min_booking_hours and self.max_booking_hours < self.min_booking_hours:
+            raise ValidationError(
+                {"max_booking_hours": "Максимальная длительность меньше минимальной"}
+            )
@@ -0,0 +1,75 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
+from django.utils import timezone
+from .models import OutgoingEmail
+
+# Сколько писем отправляется за одну транзакцию
+BATCH_SIZE = getattr(settings, "EMAIL_OUTBOX_BATCH_SIZE", 50)
+# После стольких неудачных попыток письмо считается недоставленным
+MAX_ATTEMPTS = getattr(settings, "EMAIL_OUTBOX_MAX_ATTEMPTS", 5)
+# Пауза после первой неудачи в секундах, дальше удваивается
+RETRY_DELAY = getattr(settings, "EMAIL_OUTBOX_RETRY_DELAY", 60)
+MAX_RETRY_DELAY = 6 * 60 * 60
+
+
+def retry_delay(attempts):
+    """Пауза перед следующей попыткой после заданного числа неудач"""
+    return timedelta(seconds=min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY))
+
+
+def build_message(email, connection):
+    """Письмо Django из записи очереди"""
+    message = EmailMultiAlternatives(
+        email.subject, email.body, None, [email.to_email], connection=connection
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, "text/html")
+    return message
+
+
+def send_batch(connection, batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS):
+    """Отправляет пачку писем из очереди через одно соединение"""
+    sent = failed = 0
+    with transaction.atomic():
+        # Заблокированные другим обработчиком письма пропускаются
+        emails = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutgoingEmail.STATUS_PENDING, next_attempt_at__lte=timezone.now())
+            .order_by("next_attempt_at", "id")[:batch_size]
+        )
+        for email in emails:
+            email.attempts += 1
+            try:
+                connection.open()
+                build_message(email, connection).send()
+            except Exception as e:
+                # Соединение могло оборваться, следующее письмо откроет новое
+                connection.close()
+                email.last_error = str(e) or e.__class__.__name__
+                if email.attempts >= max_attempts:
+                    email.status = OutgoingEmail.STATUS_DEAD
+                else:
+                    email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+                failed += 1
+            else:
+                email.status = OutgoingEmail.STATUS_SENT
+                email.sent_at = timezone.now()
+                email.last_error = ""
+                sent += 1
+        OutgoingEmail.objects.bulk_update(
+            emails, ["status", "attempts", "next_attempt_at", "last_error", "sent_at"]
+        )
+    return sent, failed
+
+
+def send_pending(connection, batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS):
+    """Отправляет все готовые письма пачками через одно соединение"""
+    total_sent = total_failed = 0
+    while True:
+        sent, failed = send_batch(connection, batch_size, max_attempts)
+        total_sent += sent
+        total_failed += failed
+        if sent + failed < batch_size:
+            return total_sent, total_failed
@@ -0,0 +1,124 @@
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+CURSOR_SEPARATOR = "_"
+# Начиная с этого числа строк админка показывает оценку из статистики PostgreSQL
+ESTIMATE_THRESHOLD = 10000
+
+
+class KeysetPage:
+    """Страница выборки по курсору: записи и курсоры соседних страниц"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+def encode_cursor(obj, ordering):
+    """Курсор записи из значений полей сортировки: 2026-10-17_12:00:00_42"""
+    return CURSOR_SEPARATOR.join(str(getattr(obj, name.lstrip("-"))) for name in ordering)
+
+
+def decode_cursor(model, ordering, value):
+    """Значения полей сортировки из курсора или None, если курсор поврежден"""
+    parts = value.split(CURSOR_SEPARATOR) if value else []
+    if len(parts) != len(ordering):
+        return None
+    try:
+        return [
+            model._meta.get_field(name.lstrip("-")).to_python(part)
+            for name, part in zip(ordering, parts)
+        ]
+    except ValidationError:
+        return None
+
+
+def keyset_filter(ordering, values, forward=True):
+    """Условие "строго после курсора" для сортировки ordering, с диапазоном по первому полю для индекса"""
+    condition = None
+    for name, value in reversed(list(zip(ordering, values))):
+        field = name.lstrip("-")
+        lookup = "lt" if name.startswith("-") == forward else "gt"
+        step = Q(**{f"{field}__{lookup}": value})
+        if condition is not None:
+            step |= Q(**{field: value}) & condition
+        condition = step
+    first = ordering[0]
+    bound = "lte" if first.startswith("-") == forward else "gte"
+    return Q(**{f"{first.lstrip('-')}__{bound}": values[0]}) & condition
+
+
+def reverse_ordering(ordering):
+    return [name[1:] if name.startswith("-") else f"-{name}" for name in ordering]
+
+
+def paginate_keyset(queryset, ordering, after=None, before=None, per_page=10):
+    """Страница queryset после курсора after или перед курсором before без COUNT(*) и OFFSET
+
+    ordering должен однозначно упорядочивать записи (последним полем идет id).
+    """
+    model = queryset.model
+    before_values = decode_cursor(model, ordering, before) if before else None
+    after_values = None if before_values else decode_cursor(model, ordering, after)
+
+    if before_values:
+        rows = list(
+            queryset.filter(keyset_filter(ordering, before_values, forward=False))
+            .order_by(*reverse_ordering(ordering))[:per_page + 1]
+        )
+        has_more = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_previous, has_next = has_more, True
+    else:
+        if after_values:
+            queryset = queryset.filter(keyset_filter(ordering, after_values))
+        rows = list(queryset.order_by(*ordering)[:per_page + 1])
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_previous = after_values is not None
+
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1], ordering) if rows and has_next else None,
+        previous_cursor=encode_cursor(rows[0], ordering) if rows and has_previous else None,
+    )
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator админки: для всей таблицы в PostgreSQL число строк берется из статистики, а не COUNT(*)"""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == "postgresql" and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= ESTIMATE_THRESHOLD:
+                return row[0]
+        return super().count
@@ -0,0 +1,120 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from .availability import get_venue_day, suggest_alternatives
+from .restaurant import get_restaurant
+
+# Бронь на сегодня - не раньше чем через час
+MIN_LEAD_TIME = timedelta(hours=1)
+
+# Правила для текущих настроек ресторана
+current = None
+
+
+@dataclass
+class PolicyResult:
+    """Итог проверки брони: ошибки [(поле, текст)], занятость столика и подсказки"""
+    errors: list = field(default_factory=list)
+    availability: object = None
+    suggestions: dict = field(default_factory=lambda: {"times": [], "tables": []})
+
+
+class BookingPolicy:
+    """Правила бронирования, разобранные один раз на версию настроек ресторана"""
+
+    def __init__(self, restaurant):
+        self.restaurant = restaurant
+        self.open_time = restaurant.open_time
+        self.close_time = restaurant.close_time
+        self.max_days_ahead = restaurant.max_booking_days_ahead
+        self.duration_choices = restaurant.duration_choices()
+        self.start_time_choices = [(value, value) for value in restaurant.start_time_choices()]
+        self.date_help_text = f"Максимально можно забронировать на {self.max_days_ahead} дней вперед"
+        self._guest_choices = {}
+
+    def guest_choices(self, capacity):
+        """Выбор количества гостей от 1 до capacity"""
+        choices = self._guest_choices.get(capacity)
+        if choices is None:
+            choices = [(i, f"{i} чел.") for i in range(1, capacity + 1)]
+            self._guest_choices[capacity] = choices
+        return choices
+
+    def check_time(self, date_obj, start_time, duration_hours, now=None):
+        """Часы работы, запас времени и горизонт бронирования - без обращения к БД"""
+        now = now or datetime.now()
+        start = datetime.combine(date_obj, start_time)
+        end = start + timedelta(hours=duration_hours)
+        errors = []
+
+        if date_obj == now.date() and start < now + MIN_LEAD_TIME:
+            errors.append(("start_time", "Бронь должна быть минимум на 1 час позже текущего времени"))
+        if start_time < self.open_time:
+            errors.append(("start_time", f"Ресторан открывается в {self.restaurant.open_time_display}"))
+        if end.date() > date_obj:
+            errors.append(("duration_hours", "Бронь не может переходить на следующий день"))
+        elif end.time() > self.close_time:
+            errors.append((
+                "duration_hours",
+                f"Бронь завершится в {end.strftime('%H:%M')}, "
+                f"но ресторан закрывается в {self.restaurant.close_time_display}",
+            ))
+        if date_obj > now.date() + timedelta(days=self.max_days_ahead):
+            errors.append(("date", f"Можно бронировать максимум на {self.max_days_ahead} дней вперед"))
+        return errors
+
+    def check_capacity(self, tables, guests_count):
+        capacity = sum(table.capacity for table in tables)
+        if guests_count > capacity:
+            return [("guests_count", f"Этот столик вмещает максимум {capacity} гостей")]
+        return []
+
+    def table_availability(self, venue_day, table, date_obj):
+        for venue_table, availability in venue_day:
+            if venue_table.id == table.id:
+                return availability
+        # Неактивного столика нет в общей загрузке на дату
+        return table.get_day_availability(date_obj)
+
+    def validate(self, table, date_obj, start_time, duration_hours, guests_count,
+                 extra_tables=(), availability=None, exclude_booking_id=None, now=None):
+        """Проверяет бронь целиком; занятость всех столиков на дату - не больше одного запроса"""
+        result = PolicyResult(errors=self.check_time(date_obj, start_time, duration_hours, now))
+        if not any(name == "duration_hours" for name, _ in result.errors):
+            # Общая загрузка дня из кэша занятости, она же нужна для подсказок
+            venue_day = get_venue_day(date_obj)
+            if availability is None:
+                availability = self.table_availability(venue_day, table, date_obj)
+            result.availability = availability
+            if not availability.is_available(start_time, duration_hours, exclude_booking_id):
+                result.suggestions = suggest_alternatives(
+                    venue_day, table, start_time, duration_hours, guests_count,
+                    exclude_booking_id=exclude_booking_id,
+                )
+                result.errors.append((
+                    "start_time",
+                    "Столик занят на выбранное время. Занятое время: "
+                    + ", ".join(availability.busy_times(exclude_booking_id))
+                    + self.suggestion_text(result.suggestions),
+                ))
+        result.errors += self.check_capacity([table, *extra_tables], guests_count)
+        return result
+
+    def suggestion_text(self, suggestions):
+        """Текст подсказки с ближайшими свободными вариантами"""
+        message = ""
+        if suggestions["times"]:
+            times = ", ".join(slot.strftime("%H:%M") for slot in suggestions["times"])
+            message += f". Ближайшее свободное время: {times}"
+        if suggestions["tables"]:
+            tables = ", ".join(f"№{item.number} ({item.capacity} чел.)" for item in suggestions["tables"])
+            message += f". Свободные столики на это время: {tables}"
+        return message
+
+
+def get_policy():
+    """Правила бронирования процесса, пересобираются при изменении настроек ресторана"""
+    global current
+    restaurant = get_restaurant()
+    if current is None or current.restaurant is not restaurant:
+        current = BookingPolicy(restaurant)
+    return current
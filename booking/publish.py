@@ -0,0 +1,126 @@
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections, transaction
+from django.http import HttpRequest
+from django.urls import NoReverseMatch, reverse
+from .models import Page
+
+logger = logging.getLogger(__name__)
+
+HOME = "home"
+# Главная меняется с каждой бронью: ее перерисовка откладывается на это
+# число секунд, и все изменения за это время дают одну перерисовку
+HOME_PUBLISH_DELAY = getattr(settings, "STATIC_HOME_DELAY", 60)
+
+# Один поток: повторные изменения, пришедшие во время отрисовки,
+# сливаются в один следующий проход
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="publish")
+pending = set()
+pending_lock = threading.Lock()
+
+
+def publish_dir():
+    """Папка статических страниц (STATIC_PAGES_DIR) или None, если публикация выключена"""
+    return getattr(settings, "STATIC_PAGES_DIR", None)
+
+
+def page_names():
+    return [HOME] + [page_type for page_type, _ in Page.PAGE_TYPES]
+
+
+def publish_host():
+    """Имя сайта для запроса отрисовки: первый из ALLOWED_HOSTS без шаблонов"""
+    hosts = [host for host in settings.ALLOWED_HOSTS if host != "*" and not host.startswith(".")]
+    return hosts[0] if hosts else "localhost"
+
+
+def render_anonymous(name):
+    """Страница так, как ее видит анонимный посетитель: (путь, ответ) или None без маршрута"""
+    from .views import home, render_page
+
+    try:
+        path = reverse(name)
+    except NoReverseMatch:
+        return None
+    request = HttpRequest()
+    request.method = "GET"
+    request.path = request.path_info = path
+    request.META = {"SERVER_NAME": publish_host(), "SERVER_PORT": "80"}
+    request.user = AnonymousUser()
+    # Мимо кэша страниц: в нем может лежать версия до изменения
+    response = home(request) if name == HOME else render_page(request, name)
+    return path, response
+
+
+def output_path(directory, path):
+    """Файл страницы: / -> index.html, /menu/ -> menu/index.html"""
+    parts = [part for part in path.split("/") if part]
+    return os.path.join(directory, *parts, "index.html")
+
+
+def write_file(path, content):
+    """Записывает файл через временный, чтобы прокси не отдал его недописанным"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+def publish_pages(names=None, directory=None):
+    """Отрисовывает страницы в статические файлы, возвращает [(путь, файл)]"""
+    directory = directory or publish_dir()
+    published = []
+    for name in names or page_names():
+        rendered = render_anonymous(name)
+        if rendered is None:
+            continue
+        path, response = rendered
+        if response.status_code != 200:
+            continue
+        target = output_path(directory, path)
+        write_file(target, response.content)
+        published.append((path, target))
+    return published
+
+
+def run_pending():
+    with pending_lock:
+        names = list(pending)
+        pending.clear()
+    try:
+        publish_pages(names)
+    except Exception:
+        logger.exception("Не удалось опубликовать страницы %s", names)
+    finally:
+        # Соединения этого потока не должны висеть до следующей публикации
+        connections.close_all()
+
+
+def schedule_publish(names=None, delay=0):
+    """Перерисовывает страницы в фоне после фиксации транзакции (через delay секунд), если публикация включена"""
+    if not publish_dir():
+        return
+    names = set(names or page_names())
+
+    def submit():
+        with pending_lock:
+            idle = not pending
+            pending.update(names)
+        if not idle:
+            # Проход уже запланирован и заберет эти страницы
+            return
+        if delay:
+            timer = threading.Timer(delay, executor.submit, [run_pending])
+            timer.daemon = True
+            timer.start()
+        else:
+            executor.submit(run_pending)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,130 @@
+from dataclasses import dataclass
+from datetime import datetime, time
+from django.conf import settings
+from .models import RestaurantSettings
+
+# Загруженные настройки процесса
+current = None
+
+
+@dataclass(frozen=True)
+class RestaurantConfig:
+    """Разобранные настройки ресторана, общие для всех запросов процесса"""
+    restaurant_name: str
+    head_name: str
+    description: str
+    contact_phone: str
+    contact_email: str
+    address: str
+    open_time: time
+    close_time: time
+    min_booking_hours: int
+    max_booking_hours: int
+    max_booking_days_ahead: int
+    booking_rules: tuple
+    max_table_capacity: int
+    table_capacities: tuple
+    updated_at: datetime
+
+    @classmethod
+    def from_model(cls, obj):
+        return cls(
+            restaurant_name=obj.restaurant_name,
+            head_name=obj.head_name,
+            description=obj.description,
+            contact_phone=obj.contact_phone,
+            contact_email=obj.contact_email,
+            address=obj.address,
+            open_time=obj.open_time,
+            close_time=obj.close_time,
+            min_booking_hours=obj.min_booking_hours,
+            max_booking_hours=obj.max_booking_hours,
+            max_booking_days_ahead=obj.max_booking_days_ahead,
+            booking_rules=tuple(line.strip() for line in obj.booking_rules.splitlines() if line.strip()),
+            max_table_capacity=obj.max_table_capacity,
+            table_capacities=tuple(obj.table_capacities),
+            updated_at=obj.updated_at,
+        )
+
+    @property
+    def open_time_display(self):
+        return self.open_time.strftime("%H:%M")
+
+    @property
+    def close_time_display(self):
+        return self.close_time.strftime("%H:%M")
+
+    def start_time_choices(self):
+        """Времена начала брони с шагом в час"""
+        return [f"{hour:02d}:00" for hour in range(self.open_time.hour, self.close_time.hour)]
+
+    def duration_choices(self):
+        return [
+            (i, f"{i} час" if i == 1 else f"{i} часа" if i < 5 else f"{i} часов")
+            for i in range(1, self.max_booking_hours + 1)
+        ]
+
+
+def parse_time(value, default):
+    try:
+        return datetime.strptime(value, "%H:%M").time()
+    except (TypeError, ValueError):
+        return default
+
+
+def initial_values():
+    """Значения для первой записи настроек из переменных окружения (.env)"""
+    capacities = getattr(settings, "TABLE_CAPACITIES", [])
+    statuses = getattr(settings, "BOOKING_STATUSES", [])
+    return {
+        "max_table_capacity": getattr(settings, "MAX_TABLE_CAPACITY", 12),
+        "table_capacities": [cap[0] for cap in capacities] or [2, 4, 6, 8, 10, 12],
+        "booking_statuses": [status[0] for status in statuses] or ["active", "cancelled"],
+        "restaurant_name": getattr(settings, "RESTAURANT_NAME", None) or "",
+        "head_name": getattr(settings, "RESTAURANT_HEAD_NAME", None) or "",
+        "description": getattr(settings, "RESTAURANT_DESCRIPTION", None) or "",
+        "contact_phone": getattr(settings, "CONTACT_PHONE", None) or "",
+        "contact_email": getattr(settings, "CONTACT_EMAIL", None) or "",
+        "address": getattr(settings, "ADDRESS", None) or "",
+        "open_time": parse_time(getattr(settings, "OPEN_TIME", None), time(10, 0)),
+        "close_time": parse_time(getattr(settings, "CLOSE_TIME", None), time(23, 0)),
+        "min_booking_hours": getattr(settings, "MIN_BOOKING_HOURS", 1),
+        "max_booking_hours": getattr(settings, "MAX_BOOKING_HOURS", 4),
+        "max_booking_days_ahead": getattr(settings, "MAX_BOOKING_DAYS_AHEAD", 30),
+        "booking_rules": "\n".join(getattr(settings, "BOOKING_RULES", [])),
+    }
+
+
+def load_settings():
+    """Запись настроек из БД; создается из .env, если ее еще нет"""
+    obj = RestaurantSettings.objects.order_by("pk").first()
+    if obj is None:
+        obj = RestaurantSettings.objects.create(**initial_values())
+    return obj
+
+
+def refresh():
+    """Перечитывает настройки, если время их изменения в БД сдвинулось (один запрос updated_at)"""
+    global current
+    updated_at = RestaurantSettings.objects.order_by("pk").values_list("updated_at", flat=True).first()
+    # Сравнение на неравенство: после загрузки снимка время может стать и меньше
+    if current is None or current.updated_at != updated_at:
+        current = RestaurantConfig.from_model(load_settings())
+    return current
+
+
+def get_restaurant():
+    """Настройки ресторана процесса; время изменения проверяется в начале каждого запроса"""
+    if current is None:
+        return refresh()
+    return current
+
+
+def restaurant_settings_middleware(get_response):
+    """Подхватывает изменения настроек из админки в каждом процессе без перезапуска"""
+
+    def middleware(request):
+        refresh()
+        return get_response(request)
+
+    return middleware
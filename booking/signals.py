@@ -1,31 +1,127 @@
-from django.db.models.signals import post_migrate
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_save
 from django.dispatch import receiver
-from django.conf import settings
+from django.apps import apps as global_apps
+from .cache import bump_version_on_commit, invalidate_pages
+from .images import IMAGE_FIELDS, schedule_variants
+from .publish import HOME, HOME_PUBLISH_DELAY, schedule_publish
+from .restaurant import initial_values
+from .snapshot import is_restoring
+from .models import (
+    Booking,
+    DeletedRecord,
+    GalleryImage,
+    MenuItem,
+    Page,
+    RestaurantSettings,
+    Table,
+    TeamMember,
+)
 
 
 @receiver(post_migrate)
 def create_restaurant_settings(sender, **kwargs):
     """Создает настройки ресторана из .env после миграций"""
     if sender.name == "booking":
-        from .models import RestaurantSettings
-
+        # flush (и TransactionTestCase) отправляет сигнал без apps
+        apps = kwargs.get("apps") or global_apps
+        try:
+            RestaurantSettings = apps.get_model("booking", "RestaurantSettings")
+        except LookupError:
+            return
         if not RestaurantSettings.objects.exists():
-            max_capacity = getattr(settings, "MAX_TABLE_CAPACITY", 12)
-
-            table_capacities = getattr(settings, "TABLE_CAPACITIES", [])
-            if table_capacities:
-                table_caps = [cap[0] for cap in table_capacities]
-            else:
-                table_caps = [2, 4, 6, 8, 10, 12]
-
-            booking_statuses = getattr(settings, "BOOKING_STATUSES", [])
-            if booking_statuses:
-                statuses = [status[0] for status in booking_statuses]
-            else:
-                statuses = ["active", "cancelled"]
-
-            RestaurantSettings.objects.create(
-                max_table_capacity=max_capacity,
-                table_capacities=table_caps,
-                booking_statuses=statuses,
-            )
+            RestaurantSettings.objects.create(**initial_values())
+
+
+@receiver(post_save, sender=RestaurantSettings)
+def invalidate_restaurant_settings(sender, **kwargs):
+    """Сбрасывает кэши, зависящие от настроек ресторана; процессы перечитывают их по updated_at"""
+    # Часы работы задают сетку слотов, контакты выводятся на всех страницах
+    bump_version_on_commit()
+    invalidate_pages()
+    schedule_publish()
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+@receiver(post_save, sender=Table)
+@receiver(post_delete, sender=Table)
+@receiver(m2m_changed, sender=Table.adjacent_tables.through)
+def invalidate_availability_cache(sender, **kwargs):
+    """Сбрасывает кэш занятости при изменении броней и столиков"""
+    bump_version_on_commit()
+    schedule_publish([HOME], delay=HOME_PUBLISH_DELAY)
+
+
+@receiver(post_delete, sender=Booking)
+def promote_waitlist_on_cancel(sender, instance, **kwargs):
+    """Ставит в очередь подбор заявок из листа ожидания на освободившееся время"""
+    from .waitlist import promote_for_interval, schedule_promotion
+
+    if is_restoring():
+        return
+    schedule_promotion(promote_for_interval, instance.date, instance.start_time, instance.end_time)
+
+
+@receiver(pre_save, sender=Table)
+def remember_table_activity(sender, instance, **kwargs):
+    """Запоминает прежнюю активность столика"""
+    instance._was_active = None
+    if instance.pk:
+        instance._was_active = (
+            Table.objects.filter(pk=instance.pk).values_list("is_active", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Table)
+def promote_waitlist_on_reactivation(sender, instance, created, **kwargs):
+    """Ставит в очередь подбор заявок из листа ожидания на вновь активный столик"""
+    from .waitlist import promote_for_table, schedule_promotion
+
+    if instance.is_active and (created or instance._was_active is False):
+        schedule_promotion(promote_for_table, instance)
+
+
+@receiver(post_delete, sender=Booking)
+@receiver(post_delete, sender=Page)
+def record_deletion(sender, instance, **kwargs):
+    """Запоминает удаление для инкрементального снимка"""
+    if is_restoring():
+        return
+    DeletedRecord.objects.create(model=sender._meta.label_lower, object_id=instance.pk)
+
+
+@receiver(post_save, sender=Page)
+@receiver(post_delete, sender=Page)
+@receiver(post_save, sender=GalleryImage)
+@receiver(post_delete, sender=GalleryImage)
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+@receiver(post_save, sender=TeamMember)
+@receiver(post_delete, sender=TeamMember)
+def invalidate_page_cache(sender, **kwargs):
+    """Сбрасывает кэш страниц сайта и перерисовывает статические копии"""
+    invalidate_pages()
+    schedule_publish()
+
+
+@receiver(pre_save, sender=Table)
+@receiver(pre_save, sender=Page)
+@receiver(pre_save, sender=GalleryImage)
+@receiver(pre_save, sender=MenuItem)
+@receiver(pre_save, sender=TeamMember)
+def remember_new_image(sender, instance, **kwargs):
+    """Запоминает, что изображение только что загружено и еще не сохранено"""
+    image = getattr(instance, IMAGE_FIELDS[sender])
+    instance._new_image = bool(image) and not image._committed
+
+
+@receiver(post_save, sender=Table)
+@receiver(post_save, sender=Page)
+@receiver(post_save, sender=GalleryImage)
+@receiver(post_save, sender=MenuItem)
+@receiver(post_save, sender=TeamMember)
+def generate_image_variants(sender, instance, **kwargs):
+    """Готовит уменьшенные копии загруженного изображения вне запроса"""
+    if instance._new_image:
+        instance._new_image = False
+        schedule_variants(getattr(instance, IMAGE_FIELDS[sender]).name)
@@ -0,0 +1,624 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import islice
+from django.apps import apps
+from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.serializers.python import Deserializer
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+from .models import (
+    Table,
+    Booking,
+    Page,
+    Feedback,
+    GalleryImage,
+    MenuItem,
+    TeamMember,
+    DeletedRecord,
+    RestaurantSettings,
+)
+
+# Модели, которые попадают в снимок данных
+SNAPSHOT_MODELS = [Table, Booking, Page, Feedback, GalleryImage, MenuItem, TeamMember, RestaurantSettings]
+# Модели из одной записи: загружаемая запись заменяет существующую
+SINGLETON_MODELS = [RestaurantSettings]
+# Самые большие модели, для которых на PostgreSQL можно использовать COPY
+COPY_MODELS = [Booking, Feedback]
+READ_SIZE = 64 * 1024
+MANIFEST = "manifest.json"
+TOMBSTONES = "tombstones.jsonl.gz"
+DELTAS = "deltas"
+SNAPSHOT_FORMAT = 1
+# Запас при поиске изменений: строки транзакций, зафиксированных уже после
+# прошлого снимка, не теряются, а повторная запись строки безвредна
+DELTA_OVERLAP = timedelta(minutes=5)
+
+# Флаг восстановления снимка в текущем потоке
+state = threading.local()
+
+
+def is_restoring():
+    """Идет ли восстановление снимка: сигналы с бизнес-логикой его пропускают"""
+    return getattr(state, "restoring", False)
+
+
+@contextmanager
+def restoring():
+    state.restoring = True
+    try:
+        yield
+    finally:
+        state.restoring = False
+
+
+class JsonStream:
+    """Последовательное чтение JSON-документа из файла небольшими блоками"""
+
+    def __init__(self, file):
+        self.file = file
+        self.buffer = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def fill(self):
+        data = self.file.read(READ_SIZE)
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return bool(data)
+
+    def peek(self):
+        """Следующий значимый символ без его чтения"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Ожидался символ {char!r} в позиции {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """Следующее значение целиком"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # Число на границе блока могло прочитаться не полностью
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def array(self):
+        """Проходит по элементам массива, каждый элемент читает вызывающий"""
+        self.expect("[")
+        while self.peek() != "]":
+            yield
+            if self.peek() == ",":
+                self.pos += 1
+        self.pos += 1
+
+
+def iter_records(path):
+    """Записи снимка по одной: папка с manifest.json или data.json"""
+    if os.path.isdir(path):
+        return iter_snapshot_records(path)
+    return iter_json_records(path)
+
+
+def iter_json_records(path):
+    """Записи снимка data.json по одной, без загрузки файла в память"""
+    with open(path, encoding="utf-8") as f:
+        stream = JsonStream(f)
+        for _ in stream.array():
+            stream.expect("{")
+            while stream.peek() != "}":
+                key = stream.value()
+                stream.expect(":")
+                if key == "data":
+                    for _ in stream.array():
+                        yield stream.value()
+                else:
+                    stream.value()
+                if stream.peek() == ",":
+                    stream.pos += 1
+            stream.pos += 1
+
+
+def model_file(model):
+    return f"{model._meta.label_lower}.jsonl.gz"
+
+
+def hashes_file(model):
+    return f"{model._meta.label_lower}.hashes.json.gz"
+
+
+def tracks_updates(model):
+    """Изменения модели ищутся по updated_at, у остальных моделей - по хэшам записей"""
+    return any(field.name == "updated_at" for field in model._meta.concrete_fields)
+
+
+def write_records(queryset, path, chunk_size, hashes=None, previous_hashes=None):
+    """Пишет записи в gzip JSON Lines, возвращает число строк и sha256"""
+    rows = 0
+    checksum = hashlib.sha256()
+    objects = queryset.order_by("pk").iterator(chunk_size=chunk_size)
+    with gzip.open(path, "wb") as f:
+        while True:
+            chunk = list(islice(objects, chunk_size))
+            if not chunk:
+                break
+            for record in serializers.serialize("python", chunk):
+                line = (json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n").encode()
+                if hashes is not None:
+                    key = str(record["pk"])
+                    hashes[key] = hashlib.sha256(line).hexdigest()
+                    # Неизменившаяся запись в инкрементальный снимок не попадает
+                    if previous_hashes is not None and previous_hashes.get(key) == hashes[key]:
+                        continue
+                checksum.update(line)
+                f.write(line)
+                rows += 1
+    return rows, checksum.hexdigest()
+
+
+def write_json_gz(path, data):
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def read_json_gz(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_entries(staging, manifest, querysets, chunk_size, previous_hashes, on_model):
+    """Пишет файлы моделей и хэши, добавляет их в манифест; возвращает хэши"""
+    all_hashes = {}
+    for model, queryset in querysets:
+        started = time.perf_counter()
+        filename = model_file(model)
+        hashes = None if tracks_updates(model) else {}
+        rows, checksum = write_records(
+            queryset,
+            os.path.join(staging, filename),
+            chunk_size,
+            hashes,
+            None if previous_hashes is None else previous_hashes.get(model),
+        )
+        if hashes is not None:
+            write_json_gz(os.path.join(staging, hashes_file(model)), hashes)
+            all_hashes[model] = hashes
+        manifest["models"].append(
+            {"model": model._meta.label_lower, "file": filename, "rows": rows, "sha256": checksum}
+        )
+        if on_model:
+            on_model(model, rows, time.perf_counter() - started)
+    return all_hashes
+
+
+def new_manifest(kind, created_at, previous=None):
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "kind": kind,
+        "created_at": created_at.isoformat(),
+        "models": [],
+    }
+    if previous:
+        manifest["previous"] = previous
+    return manifest
+
+
+def write_manifest(directory, manifest):
+    with open(os.path.join(directory, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def write_snapshot(directory, chunk_size=2000, on_model=None):
+    """Сохраняет полный снимок в папку: файл на модель и manifest.json"""
+    # Снимок собирается рядом и подменяет старый (вместе с его
+    # инкрементальными снимками) только целиком
+    target = os.path.abspath(directory)
+    parent = os.path.dirname(target)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".snapshot-", dir=parent)
+    created_at = timezone.now()
+    try:
+        manifest = new_manifest("full", created_at)
+        querysets = [(model, model.objects.all()) for model in SNAPSHOT_MODELS]
+        write_entries(staging, manifest, querysets, chunk_size, None, on_model)
+        write_manifest(staging, manifest)
+        swap_directory(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    # Отметки об удалениях до полного снимка больше не понадобятся; последняя
+    # отметка каждой модели остается: по ней считается Last-Modified календаря
+    latest = DeletedRecord.objects.values("model").annotate(latest=Max("id")).values("latest")
+    DeletedRecord.objects.filter(deleted_at__lt=created_at - DELTA_OVERLAP).exclude(id__in=latest).delete()
+    return manifest
+
+
+def write_delta(directory, chunk_size=2000, on_model=None):
+    """Сохраняет инкрементальный снимок: записи, измененные после последнего снимка"""
+    chain = snapshot_chain(directory)
+    last = chain[-1][1]
+    since = datetime.fromisoformat(last["created_at"]) - DELTA_OVERLAP
+    created_at = timezone.now()
+    previous_hashes = {
+        model: latest_hashes(chain, model) for model in SNAPSHOT_MODELS if not tracks_updates(model)
+    }
+
+    deltas = os.path.join(directory, DELTAS)
+    os.makedirs(deltas, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".delta-", dir=deltas)
+    try:
+        manifest = new_manifest("delta", created_at, previous=last["created_at"])
+        querysets = [
+            (model, model.objects.filter(updated_at__gte=since) if tracks_updates(model) else model.objects.all())
+            for model in SNAPSHOT_MODELS
+        ]
+        hashes = write_entries(staging, manifest, querysets, chunk_size, previous_hashes, on_model)
+
+        tombstones = [
+            {"model": label, "pk": object_id}
+            for label, object_id in DeletedRecord.objects.filter(deleted_at__gte=since)
+            .order_by("id")
+            .values_list("model", "object_id")
+        ]
+        # Удаления в моделях без updated_at видны по исчезнувшим хэшам
+        for model, current in hashes.items():
+            previous = previous_hashes[model] or {}
+            tombstones.extend(
+                {"model": model._meta.label_lower, "pk": int(key)} for key in previous if key not in current
+            )
+        lines = [(json.dumps(tombstone) + "\n").encode() for tombstone in tombstones]
+        with gzip.open(os.path.join(staging, TOMBSTONES), "wb") as f:
+            f.writelines(lines)
+        manifest["tombstones"] = {
+            "file": TOMBSTONES,
+            "rows": len(lines),
+            "sha256": hashlib.sha256(b"".join(lines)).hexdigest(),
+        }
+        write_manifest(staging, manifest)
+        os.rename(staging, os.path.join(deltas, f"{len(chain):04d}"))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return manifest
+
+
+def latest_hashes(chain, model):
+    """Хэши записей модели из последнего снимка цепочки, где они есть"""
+    for path, _ in reversed(chain):
+        filename = os.path.join(path, hashes_file(model))
+        if os.path.exists(filename):
+            return read_json_gz(filename)
+    return None
+
+
+def swap_directory(source, target):
+    """Ставит готовую папку на место target, старая удаляется после замены"""
+    previous = None
+    if os.path.exists(target):
+        previous = tempfile.mkdtemp(prefix=".previous-", dir=os.path.dirname(target))
+        os.rmdir(previous)
+        os.rename(target, previous)
+    os.rename(source, target)
+    if previous:
+        shutil.rmtree(previous)
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Неподдерживаемый формат снимка: {manifest.get('format')}")
+    return manifest
+
+
+def snapshot_chain(directory):
+    """Полный снимок и его инкрементальные снимки по порядку: [(папка, манифест)]"""
+    chain = [(directory, read_manifest(directory))]
+    deltas = os.path.join(directory, DELTAS)
+    names = sorted(name for name in os.listdir(deltas) if not name.startswith(".")) if os.path.isdir(deltas) else []
+    for name in names:
+        path = os.path.join(deltas, name)
+        manifest = read_manifest(path)
+        if manifest.get("previous") != chain[-1][1]["created_at"]:
+            raise ValueError(f"Цепочка снимков прервана на {path}")
+        chain.append((path, manifest))
+    return chain
+
+
+def iter_checked_lines(path, rows, checksum):
+    """Строки gzip-файла с проверкой числа строк и sha256 в конце"""
+    count = 0
+    digest = hashlib.sha256()
+    with gzip.open(path, "rb") as f:
+        for line in f:
+            digest.update(line)
+            count += 1
+            yield line
+    if count != rows or digest.hexdigest() != checksum:
+        raise ValueError(f"Файл {path} поврежден: не совпадает число строк или sha256")
+
+
+def iter_snapshot_records(directory, manifest=None):
+    """Записи снимка из папки с проверкой числа строк и контрольных сумм"""
+    manifest = manifest or read_manifest(directory)
+    for entry in manifest["models"]:
+        path = os.path.join(directory, entry["file"])
+        for line in iter_checked_lines(path, entry["rows"], entry["sha256"]):
+            yield json.loads(line)
+
+
+def iter_tombstones(directory, manifest):
+    entry = manifest.get("tombstones")
+    if not entry:
+        return
+    path = os.path.join(directory, entry["file"])
+    for line in iter_checked_lines(path, entry["rows"], entry["sha256"]):
+        yield json.loads(line)
+
+
+def related_fields(model):
+    """Внешние ключи модели на модели снимка"""
+    return [
+        field
+        for field in model._meta.concrete_fields
+        if field.many_to_one and field.related_model in SNAPSHOT_MODELS
+    ]
+
+
+def dependencies(model):
+    return {field.related_model for field in related_fields(model)} - {model}
+
+
+def dependency_order(models):
+    """Модели в порядке, при котором связанные записи загружаются раньше"""
+    ordered = []
+    remaining = list(models)
+    while remaining:
+        ready = [model for model in remaining if not dependencies(model) & set(remaining)]
+        if not ready:
+            raise ValueError("Циклическая зависимость моделей снимка")
+        ordered.extend(ready)
+        remaining = [model for model in remaining if model not in ready]
+    return ordered
+
+
+def quote_copy_value(value):
+    """Значение поля в формате CSV для COPY (NULL - пустое поле без кавычек)"""
+    if value is None:
+        return ""
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class SnapshotLoader:
+    """Загрузка записей снимка пачками с заменой первичных ключей"""
+
+    def __init__(self, chunk_size=2000, use_copy=False):
+        self.chunk_size = chunk_size
+        self.use_copy = use_copy and connection.vendor == "postgresql"
+        # Старый первичный ключ -> новый, по каждой модели
+        self.pk_map = defaultdict(dict)
+        # Ссылки модели на саму себя заполняются после загрузки всей модели
+        self.self_links = defaultdict(list)
+        self.m2m_links = defaultdict(list)
+        # Записи, чьи связи многие-ко-многим заменяются целиком
+        self.m2m_reset = defaultdict(set)
+        self.stats = defaultdict(lambda: [0, 0.0])
+        self.done = set()
+        self.skipped = 0
+        self.deleted = 0
+
+    def load(self, records):
+        """Загружает поток записей; снимок сгруппирован по моделям"""
+        spooled = {}
+        current, chunk = None, []
+        for record in records:
+            model = self.get_model(record["model"])
+            if model is None:
+                self.skipped += 1
+                continue
+            if model is not current:
+                self.close_model(current, chunk, spooled)
+                current, chunk = model, []
+            # Связанные модели еще не загружены - записи откладываются во
+            # временный файл до конца потока
+            if model in spooled or dependencies(model) - self.done:
+                if model not in spooled:
+                    spooled[model] = tempfile.TemporaryFile("w+", encoding="utf-8")
+                spooled[model].write(json.dumps(record) + "\n")
+                continue
+            chunk.append(record)
+            if len(chunk) >= self.chunk_size:
+                self.insert(model, chunk)
+                chunk = []
+        self.close_model(current, chunk, spooled)
+
+        for model in dependency_order(spooled):
+            with spooled[model] as f:
+                f.seek(0)
+                chunk = []
+                for line in f:
+                    chunk.append(json.loads(line))
+                    if len(chunk) >= self.chunk_size:
+                        self.insert(model, chunk)
+                        chunk = []
+                self.close_model(model, chunk, {})
+        self.link_m2m()
+
+    def restore(self, directory, until=None):
+        """Загружает полный снимок и инкрементальные снимки до номера until"""
+        chain = snapshot_chain(directory)
+        if until is not None:
+            chain = chain[:until + 1]
+        for path, manifest in chain:
+            self.load(iter_snapshot_records(path, manifest))
+            self.delete(iter_tombstones(path, manifest))
+        return chain
+
+    def delete(self, tombstones):
+        """Удаляет записи по отметкам об удалении"""
+        deleted = defaultdict(list)
+        for tombstone in tombstones:
+            model = self.get_model(tombstone["model"])
+            new_pk = self.pk_map[model].pop(tombstone["pk"], None) if model else None
+            if new_pk is not None:
+                deleted[model].append(new_pk)
+        # Удаление из снимка - не отмена брони: без листа ожидания и новых отметок об удалении
+        with restoring():
+            for model in reversed(dependency_order(deleted)):
+                pks = deleted[model]
+                for start in range(0, len(pks), self.chunk_size):
+                    model.objects.filter(pk__in=pks[start:start + self.chunk_size]).delete()
+        self.deleted += sum(len(pks) for pks in deleted.values())
+
+    def get_model(self, label):
+        try:
+            model = apps.get_model(label)
+        except LookupError:
+            return None
+        return model if model in SNAPSHOT_MODELS else None
+
+    def close_model(self, model, chunk, spooled):
+        if model is None or model in spooled:
+            return
+        if chunk:
+            self.insert(model, chunk)
+        self.link_self(model)
+        self.done.add(model)
+
+    def insert(self, model, records):
+        """Вставляет пачку записей одной модели, уже загруженные записи обновляет"""
+        started = time.perf_counter()
+        fields = related_fields(model)
+        pk_map = self.pk_map[model]
+        objects, old_pks, updated = [], [], []
+        singleton_pk = None
+        if model in SINGLETON_MODELS:
+            singleton_pk = model.objects.order_by("pk").values_list("pk", flat=True).first()
+        for deserialized in Deserializer(records, ignorenonexistent=True):
+            obj = deserialized.object
+            old_pk = obj.pk
+            obj.pk = pk_map.get(old_pk, singleton_pk)
+            if singleton_pk is not None:
+                pk_map[old_pk] = singleton_pk
+            for field in fields:
+                value = getattr(obj, field.attname)
+                if value is None:
+                    continue
+                if field.related_model is model:
+                    self.self_links[model].append((obj, field, value))
+                    setattr(obj, field.attname, None)
+                else:
+                    setattr(obj, field.attname, self.pk_map[field.related_model][value])
+            for name, values in deserialized.m2m_data.items():
+                self.m2m_links[(model, name)].extend((obj, value) for value in values)
+                if obj.pk is not None:
+                    self.m2m_reset[(model, name)].add(obj.pk)
+            if obj.pk is None:
+                objects.append(obj)
+                old_pks.append(old_pk)
+            else:
+                updated.append(obj)
+
+        if self.use_copy and model in COPY_MODELS:
+            self.copy(model, objects)
+        else:
+            model.objects.bulk_create(objects)
+        if updated:
+            model.objects.bulk_update(
+                updated, [field.name for field in model._meta.concrete_fields if not field.primary_key]
+            )
+
+        for old_pk, obj in zip(old_pks, objects):
+            pk_map[old_pk] = obj.pk
+        stats = self.stats[model.__name__]
+        stats[0] += len(objects) + len(updated)
+        stats[1] += time.perf_counter() - started
+
+    def copy(self, model, objects):
+        """Вставка через COPY с ключами, заранее взятыми из последовательности"""
+        meta = model._meta
+        quote_name = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+                [meta.db_table, meta.pk.column, len(objects)],
+            )
+            for obj, (pk,) in zip(objects, cursor.fetchall()):
+                obj.pk = pk
+            fields = meta.concrete_fields
+            rows = tempfile.TemporaryFile("w+", encoding="utf-8")
+            with rows:
+                for obj in objects:
+                    values = [
+                        field.get_db_prep_save(field.pre_save(obj, True), connection)
+                        for field in fields
+                    ]
+                    rows.write(",".join(quote_copy_value(value) for value in values) + "\n")
+                rows.seek(0)
+                columns = ", ".join(quote_name(field.column) for field in fields)
+                cursor.copy_expert(
+                    f"COPY {quote_name(meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv)",
+                    rows,
+                )
+
+    def link_self(self, model):
+        """Восстанавливает ссылки записей модели на записи той же модели"""
+        links = self.self_links.pop(model, [])
+        if not links:
+            return
+        started = time.perf_counter()
+        pk_map = self.pk_map[model]
+        by_field = defaultdict(list)
+        for obj, field, old_pk in links:
+            setattr(obj, field.attname, pk_map[old_pk])
+            by_field[field.name].append(obj)
+        for name, objects in by_field.items():
+            model.objects.bulk_update(objects, [name], batch_size=self.chunk_size)
+        self.stats[model.__name__][1] += time.perf_counter() - started
+
+    def link_m2m(self):
+        """Создает связи многие-ко-многим после загрузки всех моделей"""
+        for (model, name), links in self.m2m_links.items():
+            field = model._meta.get_field(name)
+            through = field.remote_field.through
+            source = through._meta.get_field(field.m2m_field_name()).attname
+            target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+            target_map = self.pk_map[field.related_model]
+            reset = self.m2m_reset.pop((model, name), None)
+            if reset:
+                through.objects.filter(**{f"{source}__in": reset}).delete()
+            through.objects.bulk_create(
+                [
+                    through(**{source: obj.pk, target: target_map[value]})
+                    for obj, value in links
+                    if value in target_map
+                ],
+                batch_size=self.chunk_size,
+                ignore_conflicts=True,
+            )
+        self.m2m_links.clear()
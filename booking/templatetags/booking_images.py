@@ -0,0 +1,51 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+from booking.image_cache import resized_srcset
+from booking.images import get_variants, variant_name
+
+register = template.Library()
+
+
+@register.filter
+def srcset(image, ext="jpg"):
+    """Список уменьшенных копий изображения для атрибута srcset"""
+    if not image:
+        return ""
+    return ", ".join(
+        f"{default_storage.url(variant_name(image.name, width, ext))} {width}w"
+        for width in get_variants(image.name)
+    )
+
+
+@register.simple_tag
+def responsive_image(image, alt="", sizes="100vw", widths="", **attrs):
+    """Тег <picture> с копиями WebP и JPEG или обычный <img>, пока копий нет"""
+    attrs_html = format_html_join("", ' {}="{}"', attrs.items())
+    if widths:
+        # widths="240,480" - копии нужных макету ширин готовит /images/ при первом запросе
+        widths = [int(width) for width in widths.split(",")]
+        try:
+            webp = resized_srcset(image.name, widths, "webp")
+            jpg = resized_srcset(image.name, widths, "jpg")
+        except FileNotFoundError:
+            webp = jpg = ""
+    else:
+        webp = srcset(image, "webp")
+        jpg = srcset(image)
+    if not webp:
+        return format_html('<img src="{}" alt="{}"{}>', image.url, alt, attrs_html)
+    # display: contents - разметка и стили вокруг <img> работают как раньше
+    return format_html(
+        '<picture style="display: contents;">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}"{}>'
+        "</picture>",
+        webp,
+        sizes,
+        image.url,
+        jpg,
+        sizes,
+        alt,
+        attrs_html,
+    )
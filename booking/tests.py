@@ -1,10 +1,70 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time as timer
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail import get_connection
+from django.core.management import CommandError, call_command
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
 from django.urls import reverse
-from .models import Table, Booking, Page
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+from . import image_cache, images, publish, waitlist
+from . import policy as booking_policy, restaurant as booking_restaurant
+from .availability import (
+    DayAvailability, SlotGrid, assign_table, get_table_status, get_venue_day, suggest_alternatives,
+)
+from .cache import get_stats
+from .combinations import find_table_combination, max_party_size, solve_combination
+from .export import calendar_token
+from .forms import BookingEditForm, BookingForm, FeedbackForm
+from .image_cache import resized_url
+from .images import get_variants, resize_to_width
+from .media_backup import STAGING_PREFIX, backup_media, make_staging, restore_media, swap_contents
+from .models import (
+    Table, Booking, Page, DeletedRecord, GalleryImage, MenuItem, OutgoingEmail, RestaurantSettings, WaitlistEntry,
+)
+from .outbox import retry_delay, send_batch
+from .pagination import paginate_keyset
+from .policy import get_policy
+from .restaurant import get_restaurant, refresh
+from .snapshot import write_snapshot
+from .templatetags.booking_images import responsive_image
+from .utils import send_registration_email
+from .waitlist import promote_entries, promote_for_interval, run_promotion
 from datetime import date, timedelta, time
 
 User = get_user_model()
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class CacheResetMixin:
+    """Чистый кэш в каждом тесте; shared_cache - общий для процессов файловый кэш, как Redis в docker-compose"""
+    shared_cache = False
+
+    def reset_cache(self):
+        if self.shared_cache:
+            location = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+            caches = override_settings(CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location},
+            })
+            caches.enable()
+            self.addCleanup(caches.disable)
+        cache.clear()
 
 
 class TableModelTest(TestCase):
@@ -159,8 +219,6 @@ class FormTests(TestCase):
         self.tomorrow = date.today() + timedelta(days=1)
 
     def test_booking_form_valid_data(self):
-        from .forms import BookingForm
-
         form_data = {
             "table": self.table.id,
             "date": self.tomorrow.strftime("%Y-%m-%d"),
@@ -174,8 +232,6 @@ class FormTests(TestCase):
         self.assertTrue(form.is_valid())
 
     def test_booking_form_guest_count_validation(self):
-        from .forms import BookingForm
-
         small_table = Table.objects.create(number=6, capacity=2, is_active=True)
 
         form_data = {
@@ -203,8 +259,6 @@ class FeedbackFormTest(TestCase):
         )
 
     def test_feedback_form_authenticated_user(self):
-        from .forms import FeedbackForm
-
         self.client.login(email="test@example.com", password="testpass123")
         form = FeedbackForm(user=self.user)
 
@@ -212,8 +266,6 @@ class FeedbackFormTest(TestCase):
         self.assertEqual(form.fields["name"].initial, "John Doe")
 
     def test_feedback_form_anonymous_user(self):
-        from .forms import FeedbackForm
-
         form = FeedbackForm()
         self.assertIsNone(form.fields["email"].initial)
         self.assertIsNone(form.fields["name"].initial)
@@ -247,3 +299,1338 @@ class BookingCRUDTests(TestCase):
         response = self.client.post(reverse("booking_cancel", args=[self.booking.id]))
         self.assertEqual(response.status_code, 302)
         self.assertFalse(Booking.objects.filter(id=self.booking.id).exists())
+
+
+class TableStatusTests(TestCase):
+    def setUp(self):
+        # Настройки ресторана загружаются процессом один раз, до замеров запросов
+        refresh()
+        self.user = User.objects.create_user(
+            username="statususer", email="status@example.com", password="testpass123"
+        )
+        self.today = date.today()
+
+    def _create_tables(self, count, start_number):
+        for number in range(start_number, start_number + count):
+            table = Table.objects.create(number=number, capacity=4, is_active=True)
+            Booking.objects.create(
+                user=self.user,
+                table=table,
+                date=self.today,
+                start_time=time(12, 0),
+                end_time=time(14, 0),
+                guests_count=2,
+            )
+
+    def test_get_table_status(self):
+        self._create_tables(2, 1)
+        Table.objects.create(number=3, capacity=2, is_active=True)
+
+        status = {item["table"].number: item for item in get_table_status(self.today)}
+        self.assertEqual(status[1]["busy_times"], ["12:00-14:00"])
+        self.assertTrue(status[1]["has_bookings_today"])
+        self.assertEqual(status[1]["bookings_count"], 1)
+        self.assertFalse(status[3]["has_bookings_today"])
+        self.assertEqual(status[3]["bookings_count"], 0)
+
+    def test_home_query_count_is_constant(self):
+        self._create_tables(2, 1)
+        # Проверка настроек ресторана, столики с бронями на сегодня
+        with self.assertNumQueries(3):
+            self.client.get(reverse("home"))
+
+        self._create_tables(20, 100)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("home"))
+        self.assertEqual(len(response.context["table_status"]), 22)
+
+
+class AvailabilityEngineTests(TestCase):
+    def setUp(self):
+        self.grid = SlotGrid(10, 23)
+        self.day = date.today() + timedelta(days=1)
+
+    def test_bitmap_overlap_checks(self):
+        availability = DayAvailability(
+            self.day, [(1, time(12, 0), time(14, 0)), (2, time(18, 30), time(19, 30))], self.grid
+        )
+        self.assertFalse(availability.is_available(time(13, 0), 1))
+        self.assertTrue(availability.is_available(time(14, 0), 2))
+        self.assertTrue(availability.is_available(time(10, 0), 2))
+        self.assertFalse(availability.is_available(time(17, 0), 2))
+        self.assertTrue(availability.is_available(time(13, 0), 1, exclude_booking_id=1))
+        self.assertFalse(availability.is_available(time(19, 15), 1))
+
+    def test_free_slots_and_busy_times(self):
+        availability = DayAvailability(
+            self.day, [(1, time(12, 0), time(14, 0)), (2, time(14, 0), time(15, 0))], self.grid
+        )
+        free = availability.free_slots(2)
+        self.assertIn(time(10, 0), free)
+        self.assertNotIn(time(11, 0), free)
+        self.assertIn(time(15, 0), free)
+        self.assertEqual(free[-1], time(21, 0))
+        self.assertEqual(availability.busy_times(), ["12:00-14:00", "14:00-15:00"])
+
+    def test_model_methods_delegate_with_single_query(self):
+        user = User.objects.create_user(
+            username="gridsuser", email="grid@example.com", password="testpass123"
+        )
+        table = Table.objects.create(number=40, capacity=4, is_active=True)
+        booking = Booking.objects.create(
+            user=user, table=table, date=self.day,
+            start_time=time(12, 0), end_time=time(14, 0), guests_count=2,
+        )
+        with self.assertNumQueries(1):
+            self.assertFalse(table.is_available(self.day, time(13, 0), 1))
+        self.assertTrue(
+            table.is_available(self.day, time(13, 0), 1, exclude_booking_id=booking.id)
+        )
+        self.assertEqual(table.get_busy_times(self.day), ["12:00-14:00"])
+
+
+class FreeSlotsApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="apiuser", email="api@example.com", password="testpass123"
+        )
+        self.day = date.today() + timedelta(days=1)
+        self.small = Table.objects.create(number=1, capacity=2, is_active=True)
+        self.large = Table.objects.create(number=2, capacity=6, is_active=True)
+        Table.objects.create(number=3, capacity=8, is_active=False)
+        Booking.objects.create(
+            user=self.user, table=self.large, date=self.day,
+            start_time=time(12, 0), end_time=time(14, 0), guests_count=4,
+        )
+        self.url = reverse("free_slots")
+        self.params = {"date": self.day.strftime("%Y-%m-%d"), "guests": 4, "duration": 1}
+
+    def test_free_slots_for_fitting_tables(self):
+        # Проверка настроек ресторана, три запроса версии для ETag и столики с бронями
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url, self.params)
+        self.assertEqual(response.status_code, 200)
+        tables = response.json()["tables"]
+        self.assertEqual([table["number"] for table in tables], [2])
+        self.assertNotIn("12:00", tables[0]["free_slots"])
+        self.assertNotIn("13:00", tables[0]["free_slots"])
+        self.assertIn("14:00", tables[0]["free_slots"])
+
+    def test_conditional_get_returns_not_modified(self):
+        response = self.client.get(self.url, self.params)
+        etag = response["ETag"]
+
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Версия берется из БД, а не из кэша процесса: сигналы не нужны
+        booking = Booking.objects.create(
+            user=self.user, table=self.large, date=self.day,
+            start_time=time(16, 0), end_time=time(17, 0), guests_count=2,
+        )
+        response = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response["ETag"]
+        booking.delete()
+        response = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_table_changes_invalidate_etag(self):
+        response = self.client.get(self.url, self.params)
+        etag = response["ETag"]
+
+        Table.objects.create(number=4, capacity=4, is_active=True)
+        response = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(4, [table["number"] for table in response.json()["tables"]])
+
+        etag = response["ETag"]
+        self.small.capacity = 4
+        self.small.save()
+        response = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(1, [table["number"] for table in response.json()["tables"]])
+
+        etag = response["ETag"]
+        self.large.capacity = 8
+        self.large.save()
+        response = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_cancel_is_not_hidden_by_if_modified_since(self):
+        booking = Booking.objects.get(table=self.large)
+        Booking.objects.create(
+            user=self.user, table=self.large, date=self.day,
+            start_time=time(18, 0), end_time=time(19, 0), guests_count=2,
+        )
+        response = self.client.get(self.url, self.params)
+        self.assertFalse(response.has_header("Last-Modified"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.delete()
+        response = self.client.get(
+            self.url, self.params, HTTP_IF_MODIFIED_SINCE=http_date(booking.updated_at.timestamp() + 60)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("12:00", response.json()["tables"][0]["free_slots"])
+
+    def test_invalid_params(self):
+        response = self.client.get(self.url, {"date": "bad", "guests": 2})
+        self.assertEqual(response.status_code, 400)
+
+
+class TableAssignmentTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="assignuser", email="assign@example.com", password="testpass123"
+        )
+        self.day = date.today() + timedelta(days=1)
+        self.vip = Table.objects.create(number=1, capacity=4, is_vip=True, is_active=True)
+        self.regular = Table.objects.create(number=2, capacity=4, is_active=True)
+        self.large = Table.objects.create(number=3, capacity=8, is_active=True)
+        Table.objects.create(number=4, capacity=2, is_active=True)
+
+    def test_assign_smallest_free_table(self):
+        with self.assertNumQueries(1):
+            table = assign_table(self.day, time(12, 0), 2, 3)
+        self.assertEqual(table, self.regular)
+
+        Booking.objects.create(
+            user=self.user, table=self.regular, date=self.day,
+            start_time=time(12, 0), end_time=time(14, 0), guests_count=2,
+        )
+        self.assertEqual(assign_table(self.day, time(13, 0), 1, 3), self.vip)
+        self.assertEqual(assign_table(self.day, time(12, 0), 1, 6), self.large)
+        self.assertIsNone(assign_table(self.day, time(12, 0), 1, 10))
+
+    def test_booking_create_assigns_table(self):
+        self.client.login(email="assign@example.com", password="testpass123")
+        response = self.client.post(
+            reverse("booking_create"),
+            {
+                "date": self.day.strftime("%Y-%m-%d"),
+                "start_time": "12:00",
+                "duration_hours": "2",
+                "guests_count": "3",
+                "special_requests": "",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Booking.objects.get(user=self.user).table, self.regular)
+
+
+class BookingOverlapConstraintTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="raceuser", email="race@example.com", password="testpass123"
+        )
+        self.table = Table.objects.create(number=50, capacity=4, is_active=True)
+        self.day = date.today() + timedelta(days=1)
+        self.client.login(email="race@example.com", password="testpass123")
+
+    def test_overlap_integrity_error_becomes_form_error(self):
+        error = IntegrityError('conflicting key value violates exclusion constraint "booking_no_overlap"')
+        with mock.patch.object(Booking, "save", side_effect=error):
+            response = self.client.post(
+                reverse("booking_create") + f"?table_id={self.table.id}",
+                {
+                    "table": self.table.id,
+                    "date": self.day.strftime("%Y-%m-%d"),
+                    "start_time": "12:00",
+                    "duration_hours": "2",
+                    "guests_count": "2",
+                    "special_requests": "",
+                },
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("start_time", response.context["form"].errors)
+
+
+@skipUnless(connection.vendor == "postgresql", "Ограничение исключения есть только в PostgreSQL")
+class BookingOverlapStressTests(TransactionTestCase):
+    def test_concurrent_bookings_do_not_overlap(self):
+        user = User.objects.create_user(
+            username="stressuser", email="stress@example.com", password="testpass123"
+        )
+        table = Table.objects.create(number=51, capacity=4, is_active=True)
+        day = date.today() + timedelta(days=1)
+        barrier = threading.Barrier(20)
+        results = []
+        # Исключения потоков проверяются в основном потоке после join()
+        errors = []
+
+        def book(hour):
+            try:
+                barrier.wait()
+                with transaction.atomic():
+                    Booking.objects.create(
+                        user=user, table=table, date=day,
+                        start_time=time(hour, 0), end_time=time(hour + 2, 0), guests_count=2,
+                    )
+                results.append(True)
+            except IntegrityError as e:
+                if not Booking.is_overlap_error(e):
+                    errors.append(e)
+                results.append(False)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book, args=(12 + i % 3,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), 20)
+        bookings = list(Booking.objects.filter(table=table, date=day).order_by("start_time"))
+        self.assertEqual(len(bookings), results.count(True))
+        for previous, current in zip(bookings, bookings[1:]):
+            self.assertLessEqual(previous.end_time, current.start_time)
+
+
+class AvailabilityCacheTests(CacheResetMixin, TestCase):
+    shared_cache = True
+
+    def setUp(self):
+        self.reset_cache()
+        self.user = User.objects.create_user(
+            username="cacheuser", email="cache@example.com", password="testpass123"
+        )
+        self.table = Table.objects.create(number=60, capacity=4, is_active=True)
+        self.day = date.today() + timedelta(days=1)
+
+    def test_busy_times_cached_until_booking_changes(self):
+        misses = get_stats()["misses"]
+        self.assertEqual(self.table.get_busy_times(self.day), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.table.get_busy_times(self.day), [])
+        self.assertEqual(get_stats()["misses"], misses + 1)
+
+        booking = Booking.objects.create(
+            user=self.user, table=self.table, date=self.day,
+            start_time=time(12, 0), end_time=time(14, 0), guests_count=2,
+        )
+        self.assertEqual(self.table.get_busy_times(self.day), ["12:00-14:00"])
+
+        booking.delete()
+        self.assertEqual(self.table.get_busy_times(self.day), [])
+
+    def test_table_status_cached_until_table_changes(self):
+        self.assertEqual(len(get_table_status(self.day)), 1)
+        with self.assertNumQueries(0):
+            get_table_status(self.day)
+
+        self.table.is_active = False
+        self.table.save()
+        self.assertEqual(get_table_status(self.day), [])
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_process_local_cache_is_bypassed(self):
+        # Сброс версии из другого процесса не дошел бы до locmem
+        self.table.get_busy_times(self.day)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.table.get_busy_times(self.day), [])
+
+
+class HeatmapTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        self.reset_cache()
+        refresh()
+        self.user = User.objects.create_user(
+            username="heatuser", email="heat@example.com", password="testpass123"
+        )
+        self.table = Table.objects.create(number=70, capacity=4, is_active=True)
+        Table.objects.create(number=71, capacity=2, is_active=True)
+        self.day = date.today() + timedelta(days=1)
+        Booking.objects.create(
+            user=self.user, table=self.table, date=self.day,
+            start_time=time(12, 0), end_time=time(14, 0), guests_count=2,
+        )
+
+    def test_heatmap_counts_free_capacity(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("availability_heatmap"))
+        days = {day["date"]: day for day in response.json()["days"]}
+        self.assertEqual(len(days), settings.MAX_BOOKING_DAYS_AHEAD + 1)
+
+        day = days[self.day.isoformat()]
+        self.assertEqual(day["hours"]["12:00"], {"free_seats": 2, "free_tables": 1})
+        self.assertEqual(day["hours"]["14:00"], {"free_seats": 6, "free_tables": 2})
+        self.assertEqual(day["free_capacity"], day["total_capacity"] - 8)
+        self.assertFalse(day["is_full"])
+
+
+class AlternativeSuggestionTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        self.reset_cache()
+        self.user = User.objects.create_user(
+            username="altuser", email="alt@example.com", password="testpass123"
+        )
+        self.day = date.today() + timedelta(days=1)
+        self.table = Table.objects.create(number=80, capacity=4, is_active=True)
+        self.other = Table.objects.create(number=81, capacity=6, is_active=True)
+        Table.objects.create(number=82, capacity=2, is_active=True)
+        Booking.objects.create(
+            user=self.user, table=self.table, date=self.day,
+            start_time=time(12, 0), end_time=time(14, 0), guests_count=2,
+        )
+
+    def test_conflict_suggests_times_and_tables(self):
+        form = BookingForm(
+            data={
+                "table": self.table.id,
+                "date": self.day.strftime("%Y-%m-%d"),
+                "start_time": "13:00",
+                "duration_hours": "1",
+                "guests_count": "3",
+                "special_requests": "",
+            },
+            table_id=self.table.id,
+        )
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.suggestions["times"], [time(11, 0), time(14, 0), time(15, 0)])
+        self.assertEqual(form.suggestions["tables"], [self.other])
+        self.assertIn("14:00", form.errors["start_time"][0])
+        self.assertIn("№81", form.errors["start_time"][0])
+
+    def test_conflict_costs_no_extra_queries(self):
+        venue_day = get_venue_day(self.day)
+        with self.assertNumQueries(0):
+            suggestions = suggest_alternatives(venue_day, self.table, time(12, 0), 2, 2)
+        self.assertEqual(suggestions["times"], [time(10, 0), time(14, 0), time(15, 0)])
+
+
+class WaitlistTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        self.reset_cache()
+        # Подбор из очереди выполняется сразу в потоке теста: он видит данные его транзакции
+        self.submit = mock.patch.object(
+            waitlist.executor, "submit", side_effect=lambda run, func, *args: func(*args)
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+        self.user = User.objects.create_user(
+            username="waituser", email="wait@example.com", password="testpass123"
+        )
+        self.guest = User.objects.create_user(
+            username="waitguest", email="guest@example.com", password="testpass123"
+        )
+        self.day = date.today() + timedelta(days=1)
+        self.table = Table.objects.create(number=90, capacity=4, is_active=True)
+        self.booking = Booking.objects.create(
+            user=self.user, table=self.table, date=self.day,
+            start_time=time(18, 0), end_time=time(20, 0), guests_count=4,
+        )
+
+    def _entry(self, **kwargs):
+        values = {
+            "user": self.guest, "date": self.day, "window_start": time(17, 0),
+            "window_end": time(21, 0), "duration_hours": 2, "guests_count": 3,
+        }
+        values.update(kwargs)
+        return WaitlistEntry.objects.create(**values)
+
+    def test_cancellation_promotes_first_compatible_entry(self):
+        too_big = self._entry(guests_count=6)
+        first = self._entry()
+        second = self._entry(window_end=time(19, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.delete()
+
+        for entry in (too_big, first, second):
+            entry.refresh_from_db()
+        self.assertIsNone(too_big.promoted_booking)
+        self.assertIsNone(second.promoted_booking)
+        booking = first.promoted_booking
+        self.assertEqual(booking.user, self.guest)
+        self.assertEqual((booking.start_time, booking.end_time), (time(17, 0), time(19, 0)))
+
+    def test_cancellation_queues_promotion(self):
+        entry = self._entry()
+        self.submit.side_effect = None
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.delete()
+
+        # Запрос отмены только ставит подбор в очередь
+        self.submit.assert_called_once_with(run_promotion, promote_for_interval, self.day, time(18, 0), time(20, 0))
+        entry.refresh_from_db()
+        self.assertIsNone(entry.promoted_booking)
+
+    def test_promoted_entry_is_not_booked_twice(self):
+        entry = self._entry()
+        self.booking.delete()
+        stale = list(type(entry).objects.filter(pk=entry.pk))
+        self.assertEqual(len(promote_entries([entry])), 1)
+        # Копия заявки, прочитанная до перевода другим процессом
+        self.assertEqual(promote_entries(stale), [])
+        self.assertEqual(Booking.objects.filter(user=self.guest).count(), 1)
+
+    def test_command_promotes_pending_entries(self):
+        entry = self._entry()
+        Booking.objects.filter(pk=self.booking.pk).delete()
+        out = StringIO()
+        call_command("promote_waitlist", stdout=out)
+        self.assertIn("Переведено в брони: 1", out.getvalue())
+        entry.refresh_from_db()
+        self.assertEqual(entry.promoted_booking.table, self.table)
+
+    def test_table_reactivation_promotes_entries(self):
+        self.booking.delete()
+        self.table.is_active = False
+        self.table.save()
+        entry = self._entry()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.table.is_active = True
+            self.table.save()
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.promoted_booking.table, self.table)
+
+    def test_waitlist_join_view(self):
+        self.client.login(email="guest@example.com", password="testpass123")
+        response = self.client.post(
+            reverse("waitlist_join"),
+            {
+                "date": self.day.strftime("%Y-%m-%d"),
+                "window_start": "18:00",
+                "window_end": "21:00",
+                "duration_hours": "2",
+                "guests_count": "2",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(WaitlistEntry.objects.filter(user=self.guest, date=self.day).exists())
+
+
+class TableCombinationTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        self.reset_cache()
+        self.user = User.objects.create_user(
+            username="comboUser", email="combo@example.com", password="testpass123"
+        )
+        self.day = date.today() + timedelta(days=1)
+        self.t1 = Table.objects.create(number=1, capacity=6, is_active=True)
+        self.t2 = Table.objects.create(number=2, capacity=6, is_active=True)
+        self.t3 = Table.objects.create(number=3, capacity=4, is_active=True)
+        self.t4 = Table.objects.create(number=4, capacity=8, is_active=True)
+        self.t1.adjacent_tables.add(self.t2, self.t3)
+
+    def test_cheapest_free_combination(self):
+        self.assertEqual(find_table_combination(self.day, time(12, 0), 2, 10), [self.t1, self.t3])
+        self.assertEqual(find_table_combination(self.day, time(12, 0), 2, 12), [self.t1, self.t2])
+        self.assertEqual(find_table_combination(self.day, time(12, 0), 2, 20), [])
+
+        Booking.objects.create(
+            user=self.user, table=self.t3, date=self.day,
+            start_time=time(12, 0), end_time=time(14, 0), guests_count=2,
+        )
+        self.assertEqual(find_table_combination(self.day, time(12, 0), 2, 10), [self.t1, self.t2])
+
+    def test_max_party_size_counts_only_connected_tables(self):
+        capacities = {table.id: table.capacity for table in (self.t1, self.t2, self.t3, self.t4)}
+        # Столик №4 ни с чем не сдвигается: 6 + 6 + 4, а не сумма четырех самых больших
+        self.assertEqual(max_party_size(capacities), 16)
+        self.assertEqual(max_party_size(capacities, max_tables=2), 12)
+        self.assertEqual(len(BookingForm().fields["guests_count"].choices), 16)
+
+    def test_solver_is_fast_on_large_floor(self):
+        tables = {
+            i: Table(id=i, number=i, capacity=2 + 2 * (i % 4), is_vip=False) for i in range(100)
+        }
+        adjacency = {
+            i: {j for j in (i - 1, i + 1, i - 10, i + 10)
+                if 0 <= j < 100 and (abs(i - j) == 10 or i // 10 == j // 10)}
+            for i in range(100)
+        }
+        started = timer.perf_counter()
+        combination = solve_combination(tables, adjacency, 20, max_tables=4)
+        self.assertEqual(sum(table.capacity for table in combination), 20)
+        self.assertEqual(solve_combination(tables, adjacency, 100, max_tables=4), [])
+        self.assertLess(timer.perf_counter() - started, 0.1)
+
+    def test_booking_create_books_combined_tables(self):
+        self.client.login(email="combo@example.com", password="testpass123")
+        response = self.client.post(
+            reverse("booking_create"),
+            {
+                "date": self.day.strftime("%Y-%m-%d"),
+                "start_time": "12:00",
+                "duration_hours": "2",
+                "guests_count": "10",
+                "special_requests": "",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        booking = Booking.objects.get(user=self.user, combined_with__isnull=True)
+        self.assertEqual(booking.table, self.t1)
+        self.assertEqual([b.table for b in booking.combined_bookings.all()], [self.t3])
+        self.assertFalse(self.t3.is_available(self.day, time(13, 0), 1))
+
+        self.client.post(reverse("booking_cancel", args=[booking.id]))
+        self.assertFalse(Booking.objects.filter(user=self.user).exists())
+
+
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="mailuser", email="mail@example.com", password="testpass123"
+        )
+        self.table = Table.objects.create(number=95, capacity=4, is_active=True)
+        self.day = date.today() + timedelta(days=1)
+
+    def test_booking_create_queues_email_without_sending(self):
+        self.client.login(email="mail@example.com", password="testpass123")
+        self.client.post(
+            reverse("booking_create"),
+            {
+                "table": self.table.id,
+                "date": self.day.strftime("%Y-%m-%d"),
+                "start_time": "12:00",
+                "duration_hours": "2",
+                "guests_count": "2",
+                "special_requests": "",
+            },
+        )
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.to_email, "mail@example.com")
+        self.assertEqual(email.status, OutgoingEmail.STATUS_PENDING)
+
+    def test_worker_sends_batch(self):
+        for _ in range(3):
+            send_registration_email(self.user, "Привет", "emails/registration.html")
+        call_command("send_outbox", batch_size=2, stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], "text/html")
+        self.assertFalse(OutgoingEmail.objects.exclude(status=OutgoingEmail.STATUS_SENT).exists())
+
+    def test_failed_email_is_retried_then_dead_lettered(self):
+        email = send_registration_email(self.user, "Привет", "emails/registration.html")
+        connection = get_connection()
+        with mock.patch.object(connection, "send_messages", side_effect=OSError("relay down")):
+            self.assertEqual(send_batch(connection, max_attempts=2), (0, 1))
+            email.refresh_from_db()
+            self.assertEqual(email.status, OutgoingEmail.STATUS_PENDING)
+            self.assertEqual(email.last_error, "relay down")
+            self.assertGreater(email.next_attempt_at, timezone.now() + retry_delay(1) - timedelta(seconds=5))
+            self.assertEqual(send_batch(connection, max_attempts=2), (0, 0))
+
+            OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+            send_batch(connection, max_attempts=2)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutgoingEmail.STATUS_DEAD, 2))
+
+    def test_reminders_are_sent_once(self):
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        reminded = [
+            Booking.objects.create(
+                user=self.user, table=self.table, date=tomorrow,
+                start_time=time(hour, 0), end_time=time(hour + 1, 0), guests_count=2,
+            )
+            for hour in (12, 14, 16)
+        ]
+        Booking.objects.create(
+            user=self.user, table=self.table, date=tomorrow + timedelta(days=1),
+            start_time=time(12, 0), end_time=time(13, 0), guests_count=2,
+        )
+
+        with self.assertNumQueries(11):
+            call_command("send_reminders", chunk_size=2, no_send=True, stdout=StringIO())
+        call_command("send_outbox", stdout=StringIO())
+        call_command("send_reminders", stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn("Напоминание", mail.outbox[0].subject)
+        for booking in reminded:
+            booking.refresh_from_db()
+            self.assertIsNotNone(booking.reminder_sent_at)
+
+
+class SnapshotTests(TestCase):
+    def test_load_data_remaps_keys_in_dependency_order(self):
+        user = User.objects.create_user(
+            username="loaduser", email="load@example.com", password="testpass123"
+        )
+        Table.objects.create(number=1, capacity=2)
+        booking = {"user": user.id, "table": 7, "date": "2030-01-01", "start_time": "12:00",
+                   "end_time": "14:00", "guests_count": 6, "status": "active"}
+        snapshot = [
+            {"model": "Booking", "data": [
+                {"model": "booking.booking", "pk": 40, "fields": dict(booking, table=8, combined_with=41)},
+                {"model": "booking.booking", "pk": 41, "fields": booking},
+            ]},
+            {"model": "Table", "data": [
+                {"model": "booking.table", "pk": 7, "fields": {"number": 70, "capacity": 4,
+                                                               "adjacent_tables": [8]}},
+                {"model": "booking.table", "pk": 8, "fields": {"number": 80, "capacity": 2,
+                                                               "adjacent_tables": [7]}},
+            ]},
+            {"model": "RestaurantSettings", "data": [
+                {"model": "booking.restaurantsettings", "pk": 5, "fields": {
+                    "restaurant_name": "Из снимка", "open_time": "09:00:00", "updated_at": "2030-01-01T00:00:00Z",
+                }},
+            ]},
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "data.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, indent=2)
+            call_command("load_data", file=path, chunk_size=2, stdout=StringIO())
+
+        table = Table.objects.get(number=70)
+        self.assertEqual(list(table.adjacent_tables.values_list("number", flat=True)), [80])
+        parent = Booking.objects.get(combined_with__isnull=True)
+        self.assertEqual(parent.table, table)
+        self.assertEqual(list(parent.combined_bookings.values_list("table__number", flat=True)), [80])
+
+        restaurant = RestaurantSettings.objects.get()
+        self.assertEqual((restaurant.restaurant_name, restaurant.open_time), ("Из снимка", time(9, 0)))
+
+    def test_snapshot_round_trip(self):
+        user = User.objects.create_user(
+            username="snapuser", email="snap@example.com", password="testpass123"
+        )
+        first = Table.objects.create(number=1, capacity=4)
+        second = Table.objects.create(number=2, capacity=2)
+        first.adjacent_tables.add(second)
+        for hour in (12, 15):
+            Booking.objects.create(
+                user=user, table=first, date=date(2030, 1, 1),
+                start_time=time(hour, 0), end_time=time(hour + 2, 0), guests_count=2,
+            )
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            MEDIA_ROOT=os.path.join(directory, "no-media")
+        ):
+            path = os.path.join(directory, "snapshot")
+            call_command("save_data", output=path, chunk_size=1, stdout=StringIO())
+            with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.assertEqual(
+                {entry["model"]: entry["rows"] for entry in manifest["models"]}["booking.booking"], 2
+            )
+
+            Table.objects.all().delete()
+            call_command("load_data", file=path, stdout=StringIO())
+            self.assertEqual(Booking.objects.filter(table__number=1).count(), 2)
+            self.assertEqual(
+                list(Table.objects.get(number=1).adjacent_tables.values_list("number", flat=True)), [2]
+            )
+
+            manifest["models"][0]["rows"] += 1
+            with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            Table.objects.all().delete()
+            with self.assertRaises(CommandError):
+                call_command("load_data", file=path, stdout=StringIO())
+            self.assertFalse(Table.objects.exists())
+
+    def test_incremental_snapshot_restore(self):
+        user = User.objects.create_user(
+            username="deltauser", email="delta@example.com", password="testpass123"
+        )
+        table = Table.objects.create(number=1, capacity=4)
+        removed_table = Table.objects.create(number=2, capacity=2)
+        _, changed, cancelled = [
+            Booking.objects.create(
+                user=user, table=table, date=date(2030, 1, 1),
+                start_time=time(hour, 0), end_time=time(hour + 1, 0), guests_count=2,
+            )
+            for hour in (12, 14, 16)
+        ]
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            MEDIA_ROOT=os.path.join(directory, "no-media")
+        ):
+            path = os.path.join(directory, "snapshot")
+            call_command("save_data", output=path, stdout=StringIO())
+
+            changed.guests_count = 4
+            changed.save()
+            cancelled.delete()
+            removed_table.delete()
+            table.capacity = 6
+            table.save()
+            Booking.objects.create(
+                user=user, table=Table.objects.create(number=3, capacity=8), date=date(2030, 1, 2),
+                start_time=time(18, 0), end_time=time(20, 0), guests_count=7,
+            )
+            call_command("save_data", output=path, incremental=True, stdout=StringIO())
+            self.assertTrue(os.path.isdir(os.path.join(path, "deltas", "0001")))
+
+            expected = sorted(Booking.objects.values_list("table__number", "start_time", "guests_count"))
+            Table.objects.all().delete()
+            call_command("restore_data", file=path, stdout=StringIO())
+
+            self.assertEqual(
+                sorted(Booking.objects.values_list("table__number", "start_time", "guests_count")), expected
+            )
+            self.assertEqual(
+                sorted(Table.objects.values_list("number", "capacity")), [(1, 6), (3, 8)]
+            )
+
+            Table.objects.all().delete()
+            call_command("restore_data", file=path, until=0, stdout=StringIO())
+            self.assertEqual(Booking.objects.count(), 3)
+            self.assertEqual(Table.objects.count(), 2)
+
+    def test_restore_tombstones_have_no_side_effects(self):
+        user = User.objects.create_user(
+            username="tombuser", email="tomb@example.com", password="testpass123"
+        )
+        table = Table.objects.create(number=1, capacity=4)
+        cancelled = Booking.objects.create(
+            user=user, table=table, date=date(2030, 1, 1),
+            start_time=time(16, 0), end_time=time(17, 0), guests_count=2,
+        )
+        entry = WaitlistEntry.objects.create(
+            user=user, date=date(2030, 1, 1), window_start=time(16, 0), window_end=time(17, 0),
+            duration_hours=1, guests_count=2,
+        )
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            MEDIA_ROOT=os.path.join(directory, "no-media")
+        ):
+            path = os.path.join(directory, "snapshot")
+            call_command("save_data", output=path, stdout=StringIO())
+            cancelled.delete()
+            call_command("save_data", output=path, incremental=True, stdout=StringIO())
+
+            Table.objects.all().delete()
+            counts = (DeletedRecord.objects.count(), Booking.objects.count(), OutgoingEmail.objects.count())
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command("restore_data", file=path, stdout=StringIO())
+
+        self.assertEqual(
+            (DeletedRecord.objects.count(), Booking.objects.count(), OutgoingEmail.objects.count()), counts
+        )
+        entry.refresh_from_db()
+        self.assertIsNone(entry.promoted_booking)
+
+    def test_full_snapshot_keeps_latest_deletion(self):
+        DeletedRecord.objects.bulk_create([
+            DeletedRecord(model="booking.booking", object_id=object_id) for object_id in (1, 2, 3)
+        ])
+        DeletedRecord.objects.update(deleted_at=timezone.now() - timedelta(hours=1))
+        latest = DeletedRecord.objects.order_by("id").last()
+        with tempfile.TemporaryDirectory() as directory:
+            write_snapshot(os.path.join(directory, "snapshot"))
+        # Last-Modified календаря не откатывается назад после очистки отметок
+        self.assertEqual(list(DeletedRecord.objects.all()), [latest])
+
+    def test_media_backup_is_deduplicated_and_restored(self):
+        with tempfile.TemporaryDirectory() as directory:
+            media = os.path.join(directory, "media")
+            store = os.path.join(directory, "media-store")
+            manifest = os.path.join(directory, "media.json")
+            os.makedirs(os.path.join(media, "gallery"))
+            for name, content in [("gallery/a.jpg", b"a"), ("gallery/b.jpg", b"b"), ("copy.jpg", b"a")]:
+                with open(os.path.join(media, name), "wb") as f:
+                    f.write(content)
+
+            stats = backup_media(media, store, manifest)
+            self.assertEqual((stats["files"], stats["copied"]), (3, 2))
+            stats = backup_media(media, store, manifest)
+            self.assertEqual((stats["hashed"], stats["copied"]), (0, 0))
+
+            os.remove(os.path.join(media, "gallery", "b.jpg"))
+            with open(os.path.join(media, "stray.jpg"), "wb") as f:
+                f.write(b"stray")
+            self.assertEqual(restore_media(manifest, store, media), 3)
+            self.assertEqual(sorted(os.listdir(media)), ["copy.jpg", "gallery"])
+            with open(os.path.join(media, "gallery", "b.jpg"), "rb") as f:
+                self.assertEqual(f.read(), b"b")
+
+            # Запись поверх восстановленного файла не портит хранилище
+            with open(os.path.join(media, "gallery", "b.jpg"), "wb") as f:
+                f.write(b"changed")
+            self.assertEqual(restore_media(manifest, store, media), 3)
+            with open(os.path.join(media, "gallery", "b.jpg"), "rb") as f:
+                self.assertEqual(f.read(), b"b")
+
+    def test_media_swap_rolls_back_on_error(self):
+        rename = os.rename
+
+        def failing_rename(source, target):
+            if os.path.basename(source) == "b.jpg":
+                raise OSError("нет места")
+            rename(source, target)
+
+        with tempfile.TemporaryDirectory() as directory:
+            media = os.path.join(directory, "media")
+            os.makedirs(os.path.join(media, "gallery"))
+            staging = make_staging(media)
+            files = [(media, "a.jpg", b"old"), (staging, "a.jpg", b"new"), (staging, "b.jpg", b"b")]
+            for root, name, content in files:
+                with open(os.path.join(root, name), "wb") as f:
+                    f.write(content)
+
+            with mock.patch("os.rename", side_effect=failing_rename), self.assertRaises(OSError):
+                swap_contents(staging, media)
+            names = [name for name in os.listdir(media) if not name.startswith(STAGING_PREFIX)]
+            self.assertEqual(sorted(names), ["a.jpg", "gallery"])
+            with open(os.path.join(media, "a.jpg"), "rb") as f:
+                self.assertEqual(f.read(), b"old")
+
+    def test_media_store_keeps_objects_of_every_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            media = os.path.join(directory, "media")
+            store = os.path.join(directory, "media-store")
+            os.makedirs(media)
+            os.makedirs(os.path.join(directory, "first"))
+            os.makedirs(os.path.join(directory, "second"))
+            first = os.path.join(directory, "first", "media.json")
+            second = os.path.join(directory, "second", "media.json")
+            with open(os.path.join(media, "a.jpg"), "wb") as f:
+                f.write(b"old")
+            backup_media(media, store, first)
+
+            with open(os.path.join(media, "a.jpg"), "wb") as f:
+                f.write(b"new content")
+            stats = backup_media(media, store, second)
+            self.assertEqual(stats["removed"], 0)
+
+            inode = os.stat(media).st_ino
+            self.assertEqual(restore_media(first, store, media), 1)
+            with open(os.path.join(media, "a.jpg"), "rb") as f:
+                self.assertEqual(f.read(), b"old")
+            # Папка медиа может быть точкой монтирования: меняется только содержимое
+            self.assertEqual(os.stat(media).st_ino, inode)
+            self.assertEqual(os.listdir(media), ["a.jpg"])
+
+            os.remove(first)
+            stats = backup_media(media, store, second)
+            self.assertEqual(stats["removed"], 1)
+
+
+class PageCacheTests(CacheResetMixin, TestCase):
+    shared_cache = True
+
+    def setUp(self):
+        self.reset_cache()
+        refresh()
+        self.page = Page.objects.create(page_type="menu", title="Меню", content="Блюда")
+
+    def test_anonymous_hit_skips_rendering_and_save_invalidates(self):
+        self.client.get(reverse("menu"))
+        # Только проверка времени изменения настроек ресторана
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("menu"))
+        self.assertContains(response, "Меню")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MenuItem.objects.create(page=self.page, name="Борщ", price=300)
+        self.assertContains(self.client.get(reverse("menu")), "Борщ")
+
+    def test_warm_pages_fills_cache(self):
+        call_command("warm_pages", stdout=StringIO())
+        with self.assertNumQueries(1):
+            self.assertContains(self.client.get(reverse("gallery")), "Галерея")
+
+
+class ImageVariantTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        self.reset_cache()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media = directory.name
+        media_settings = override_settings(MEDIA_ROOT=self.media)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.page = Page.objects.create(page_type="gallery", title="Галерея", content="Фото")
+
+    def upload(self, name, width, mode="RGB"):
+        buffer = io.BytesIO()
+        Image.new(mode, (width, width // 2), "red").save(buffer, "PNG")
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+    def test_upload_generates_variants_in_background(self):
+        with mock.patch.object(images.executor, "submit") as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                item = GalleryImage.objects.create(page=self.page, image=self.upload("a.png", 800, "RGBA"))
+            submit.assert_called_once_with(images.process_image, item.image.name)
+            item.title = "Без новой загрузки"
+            with self.captureOnCommitCallbacks(execute=True):
+                item.save()
+            submit.assert_called_once()
+
+        images.process_image(item.image.name)
+        for width in (320, 640):
+            for ext in ("webp", "jpg"):
+                self.assertTrue(os.path.exists(os.path.join(self.media, "gallery", f"a.w{width}.{ext}")))
+        self.assertFalse(os.path.exists(os.path.join(self.media, "gallery", "a.w1280.webp")))
+
+        html = Template("{% load booking_images %}{% responsive_image image alt='Зал' %}").render(
+            Context({"image": item.image})
+        )
+        self.assertIn(
+            'type="image/webp" srcset="/media/gallery/a.w320.webp 320w, /media/gallery/a.w640.webp 640w"', html
+        )
+        self.assertIn('src="/media/gallery/a.png"', html)
+
+    def test_backfill_command_runs_in_parallel_and_skips_done(self):
+        with mock.patch("booking.images.executor"):
+            GalleryImage.objects.create(page=self.page, image=self.upload("b.png", 700))
+            item = MenuItem.objects.create(page=self.page, name="Борщ", price=300, image=self.upload("c.png", 200))
+            MenuItem.objects.create(page=self.page, name="Чай", price=100)
+
+        out = StringIO()
+        call_command("generate_images", workers=2, stdout=out)
+        self.assertIn("Изображений: 2, создано копий: 4, с ошибкой: 0", out.getvalue())
+        self.assertEqual(get_variants("gallery/b.png"), [320, 640])
+        self.assertEqual(get_variants(item.image.name), [])
+
+        out = StringIO()
+        call_command("generate_images", workers=2, stdout=out)
+        self.assertIn("создано копий: 0", out.getvalue())
+
+
+class ResizedImageTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=os.path.join(directory.name, "media"))
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        cache_dir = mock.patch("booking.image_cache.CACHE_DIR", os.path.join(directory.name, "cache"))
+        cache_dir.start()
+        self.addCleanup(cache_dir.stop)
+        os.makedirs(os.path.join(directory.name, "media", "menu"))
+        for name in ("soup.jpg", "tea.jpg"):
+            Image.new("RGB", (900, 600), "green").save(os.path.join(directory.name, "media", "menu", name))
+
+    def test_resizes_once_and_serves_immutable(self):
+        url = resized_url("menu/soup.jpg", 480, "webp")
+        with mock.patch("booking.image_cache.resize_to_width", wraps=resize_to_width) as resize:
+            barrier = threading.Barrier(4)
+            responses = []
+
+            def fetch():
+                barrier.wait()
+                responses.append(self.client.get(url))
+
+            threads = [threading.Thread(target=fetch) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(resize.call_count, 1)
+        response = responses[0]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertIn("immutable", response["Cache-Control"])
+        image = Image.open(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(image.size, (480, 320))
+
+        self.assertEqual(self.client.get(url.replace("/480.", "/500.")).status_code, 404)
+        self.assertEqual(self.client.get(url.replace("soup", "missing")).status_code, 404)
+        stale = self.client.get(url.replace(url.split("/")[2], "0" * 12))
+        self.assertRedirects(stale, url, fetch_redirect_response=False)
+
+    def test_srcset_skips_widths_wider_than_original(self):
+        image = SimpleNamespace(name="menu/soup.jpg", url="/media/menu/soup.jpg")
+        html = responsive_image(image, widths="480,900,1280")
+        self.assertIn(" 480w", html)
+        self.assertNotIn(" 900w", html)
+        self.assertNotIn(" 1280w", html)
+        # Все ширины больше оригинала - обычный <img>
+        self.assertNotIn("<picture", responsive_image(image, widths="1280,1600"))
+
+    def test_eviction_keeps_cache_under_limit(self):
+        old = image_cache.get_resized("menu/soup.jpg", 320, "jpg", image_cache.source_version("menu/soup.jpg"))
+        old.close()
+        os.utime(old.name, (1, 1))
+        size = os.path.getsize(old.name)
+        with mock.patch("booking.image_cache.CACHE_MAX_BYTES", size + 1):
+            image_cache.get_resized("menu/tea.jpg", 320, "jpg", image_cache.source_version("menu/tea.jpg")).close()
+        self.assertFalse(os.path.exists(old.name))
+
+    def test_decompression_bomb_is_not_found(self):
+        url = resized_url("menu/soup.jpg", 320, "jpg")
+        with mock.patch("PIL.Image.MAX_IMAGE_PIXELS", 1000):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+    def test_eviction_scan_is_throttled(self):
+        with mock.patch.dict(image_cache.cache_size, {"bytes": None, "scanned_at": 0.0}), \
+                mock.patch("booking.image_cache.evict", wraps=image_cache.evict) as evict:
+            for name in ("menu/soup.jpg", "menu/tea.jpg"):
+                image_cache.get_resized(name, 320, "jpg", image_cache.source_version(name)).close()
+            self.assertEqual(evict.call_count, 1)
+            self.assertGreater(image_cache.cache_size["bytes"], 0)
+
+
+class PublishPagesTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        publish_settings = override_settings(STATIC_PAGES_DIR=self.directory)
+        publish_settings.enable()
+        self.addCleanup(publish_settings.disable)
+        self.page = Page.objects.create(page_type="menu", title="Меню", content="Блюда")
+
+    def read(self, *parts):
+        with open(os.path.join(self.directory, *parts, "index.html"), encoding="utf-8") as f:
+            return f.read()
+
+    def test_command_publishes_home_and_pages(self):
+        out = StringIO()
+        call_command("publish_pages", stdout=out)
+        self.assertIn("Опубликовано страниц: 5", out.getvalue())
+        self.assertIn("Меню", self.read("menu"))
+        self.assertIn("Забронируйте столик онлайн", self.read())
+        self.assertIn("находится в разработке", self.read("team"))
+
+    def test_page_change_republishes_in_background(self):
+        self.addCleanup(publish.pending.clear)
+        with mock.patch.object(publish.executor, "submit") as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                MenuItem.objects.create(page=self.page, name="Борщ", price=300)
+                MenuItem.objects.create(page=self.page, name="Чай", price=100)
+        submit.assert_called_once_with(publish.run_pending)
+        self.assertEqual(publish.pending, set(publish.page_names()))
+
+        publish.publish_pages(["menu"])
+        self.assertIn("Борщ", self.read("menu"))
+
+    def test_booking_changes_republish_home_once_per_window(self):
+        self.addCleanup(publish.pending.clear)
+        table = Table.objects.create(number=90, capacity=4)
+        with mock.patch.object(publish.executor, "submit") as submit, \
+                mock.patch("threading.Timer") as timer:
+            with self.captureOnCommitCallbacks(execute=True):
+                table.is_vip = True
+                table.save()
+            with self.captureOnCommitCallbacks(execute=True):
+                table.is_vip = False
+                table.save()
+        submit.assert_not_called()
+        timer.assert_called_once_with(publish.HOME_PUBLISH_DELAY, submit, [publish.run_pending])
+        self.assertEqual(publish.pending, {publish.HOME})
+
+    def test_render_uses_configured_host(self):
+        with override_settings(ALLOWED_HOSTS=[".example.com", "*", "booking.example.com"]):
+            self.assertEqual(publish.publish_host(), "booking.example.com")
+            path, response = publish.render_anonymous(publish.HOME)
+        self.assertEqual((path, response.status_code), ("/", 200))
+
+
+class RestaurantSettingsTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        self.reset_cache()
+        # Настройки процесса - глобальные, тест не оставляет их измененными
+        self.addCleanup(setattr, booking_restaurant, "current", booking_restaurant.current)
+        self.addCleanup(setattr, booking_policy, "current", booking_policy.current)
+
+    def test_admin_edit_reaches_process_cache_and_forms(self):
+        self.assertEqual(RestaurantSettings.objects.count(), 1)
+        restaurant = refresh()
+        self.assertEqual(restaurant.open_time, time(10, 0))
+        with self.assertNumQueries(1):
+            self.assertIs(refresh(), restaurant)
+
+        obj = RestaurantSettings.objects.get()
+        obj.open_time = time(12, 0)
+        obj.max_booking_hours = 2
+        obj.save()
+        # Без перезапуска: следующая проверка updated_at подхватывает изменение
+        self.assertIs(get_restaurant(), restaurant)
+        self.client.get(reverse("about"))
+        restaurant = get_restaurant()
+        self.assertEqual(restaurant.open_time, time(12, 0))
+
+        form = BookingForm()
+        self.assertEqual(form.fields["start_time"].choices[0], ("12:00", "12:00"))
+        self.assertEqual(len(form.fields["duration_hours"].choices), 2)
+
+    def test_edit_from_another_process_is_picked_up(self):
+        refresh()
+        # update() не отправляет сигналы и не трогает кэш, как запись из другого процесса
+        RestaurantSettings.objects.update(open_time=time(11, 0), updated_at=timezone.now())
+        self.assertEqual(refresh().open_time, time(11, 0))
+
+
+class BookingPolicyTests(CacheResetMixin, TestCase):
+    shared_cache = True
+
+    def setUp(self):
+        self.reset_cache()
+        refresh()
+        self.user = User.objects.create_user(
+            username="policyuser", email="policy@example.com", password="testpass123"
+        )
+        self.day = date.today() + timedelta(days=1)
+        self.table = Table.objects.create(number=90, capacity=4, is_active=True)
+        self.booking = Booking.objects.create(
+            user=self.user, table=self.table, date=self.day,
+            start_time=time(12, 0), end_time=time(14, 0), guests_count=2,
+        )
+
+    def test_time_checks_without_queries(self):
+        policy = get_policy()
+        with self.assertNumQueries(0):
+            errors = policy.check_time(self.day, time(22, 0), 2)
+            far = policy.check_time(self.day + timedelta(days=60), time(12, 0), 1)
+        self.assertEqual([field for field, _ in errors], ["duration_hours"])
+        self.assertEqual([field for field, _ in far], ["date"])
+        self.assertIs(policy.guest_choices(4), policy.guest_choices(4))
+
+    def test_validate_loads_day_once(self):
+        policy = get_policy()
+        with self.assertNumQueries(1):
+            result = policy.validate(self.table, self.day, time(13, 0), 1, 2)
+        self.assertEqual([field for field, _ in result.errors], ["start_time"])
+        with self.assertNumQueries(0):
+            result = policy.validate(self.table, self.day, time(15, 0), 1, 6)
+        self.assertEqual([field for field, _ in result.errors], ["guests_count"])
+
+    def test_edit_form_ignores_own_booking(self):
+        form = BookingEditForm(
+            data={
+                "table": self.table.id,
+                "date": self.day.strftime("%Y-%m-%d"),
+                "start_time": "13:00",
+                "duration_hours": "2",
+                "guests_count": "3",
+                "special_requests": "",
+            },
+            instance=self.booking,
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertFalse(form.availability.is_available(time(13, 0), 2))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="cursoruser", email="cursor@example.com", password="testpass123"
+        )
+        self.table = Table.objects.create(number=95, capacity=4, is_active=True)
+        today = date.today()
+        for offset in range(1, 13):
+            for hour in (12, 18):
+                Booking.objects.create(
+                    user=self.user, table=self.table, date=today - timedelta(days=offset),
+                    start_time=time(hour, 0), end_time=time(hour + 2, 0), guests_count=2,
+                )
+        self.upcoming = Booking.objects.create(
+            user=self.user, table=self.table, date=today + timedelta(days=1),
+            start_time=time(12, 0), end_time=time(14, 0), guests_count=2,
+        )
+
+    def test_pages_follow_cursors_without_count(self):
+        ordering = ["-date", "-start_time", "-id"]
+        bookings = Booking.objects.filter(user=self.user, date__lt=date.today())
+        expected = list(bookings.order_by(*ordering).values_list("id", flat=True))
+
+        seen, pages, cursor = [], [], None
+        while True:
+            with self.assertNumQueries(1):
+                page = paginate_keyset(bookings, ordering, after=cursor, per_page=10)
+            pages.append(page)
+            seen += [booking.id for booking in page]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, expected)
+        self.assertEqual([len(page) for page in pages], [10, 10, 4])
+        self.assertFalse(pages[0].has_previous)
+
+        back = paginate_keyset(bookings, ordering, before=pages[1].previous_cursor, per_page=10)
+        self.assertEqual([booking.id for booking in back], expected[:10])
+        self.assertFalse(back.has_previous)
+        self.assertTrue(back.has_next)
+
+        broken = paginate_keyset(bookings, ordering, after="not-a-cursor", per_page=10)
+        self.assertEqual([booking.id for booking in broken], expected[:10])
+
+    def test_booking_list_splits_upcoming_and_past(self):
+        self.client.login(email="cursor@example.com", password="testpass123")
+        response = self.client.get(reverse("booking_list"))
+        self.assertEqual(list(response.context["bookings"]), [self.upcoming])
+        self.assertFalse(response.context["page_obj"].has_other_pages())
+
+        response = self.client.get(reverse("booking_list"), {"show": "past"})
+        page = response.context["page_obj"]
+        self.assertEqual(len(page), 10)
+        self.assertNotIn(self.upcoming, page.object_list)
+        response = self.client.get(reverse("booking_list"), {"show": "past", "after": page.next_cursor})
+        self.assertEqual(len(response.context["bookings"]), 10)
+
+
+class BookingExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="exportuser", email="export@example.com", password="testpass123"
+        )
+        self.table = Table.objects.create(number=96, capacity=4, is_active=True)
+        self.booking = Booking.objects.create(
+            user=self.user, table=self.table, date=date.today() + timedelta(days=2),
+            start_time=time(19, 0), end_time=time(21, 0), guests_count=3,
+            special_requests="У окна, пожалуйста; детский стул",
+        )
+
+    def test_csv_export_streams_bookings(self):
+        self.client.login(email="export@example.com", password="testpass123")
+        response = self.client.get(reverse("booking_export_csv"))
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content).decode()
+        lines = content.splitlines()
+        self.assertTrue(lines[0].startswith("﻿Номер брони"))
+        self.assertIn("№96", lines[1])
+        self.assertIn('"У окна, пожалуйста; детский стул"', lines[1])
+
+    def test_calendar_feed_supports_conditional_get(self):
+        url = reverse("booking_calendar", args=[calendar_token(self.user)])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        content = b"".join(response.streaming_content).decode()
+        self.assertIn(f"UID:booking-{self.booking.id}@", content)
+        self.assertIn("DTSTART:" + self.booking.date.strftime("%Y%m%d") + "T190000", content)
+        unfolded = content.replace("\r\n ", "")
+        self.assertIn(r"DESCRIPTION:Гостей: 3\nПожелания: У окна\, пожалуйста\; детский стул", unfolded)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in content.split("\r\n")))
+
+        etag = response["ETag"]
+        with self.assertNumQueries(3):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.booking.guests_count = 4
+        self.booking.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_calendar_cancel_moves_last_modified(self):
+        Booking.objects.create(
+            user=self.user, table=self.table, date=date.today() + timedelta(days=3),
+            start_time=time(12, 0), end_time=time(14, 0), guests_count=2,
+        )
+        # Заголовок с точностью до секунды: изменения - в прошлом
+        past = timezone.now() - timedelta(hours=1)
+        Booking.objects.filter(user=self.user).update(updated_at=past)
+        RestaurantSettings.objects.update(updated_at=past)
+        url = reverse("booking_calendar", args=[calendar_token(self.user)])
+        last_modified = self.client.get(url)["Last-Modified"]
+        self.assertEqual(last_modified, http_date(past.timestamp()))
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        booking_id = self.booking.id
+        self.booking.delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        content = b"".join(response.streaming_content).decode()
+        self.assertNotIn(f"UID:booking-{booking_id}@", content)
+
+    def test_calendar_rejects_bad_token(self):
+        response = self.client.get(reverse("booking_calendar", args=[f"{self.user.pk}:forged"]))
+        self.assertEqual(response.status_code, 404)
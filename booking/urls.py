@@ -10,13 +10,27 @@ urlpatterns = [
     path("feedback/", views.feedback, name="feedback"),
     path("booking/create/", views.booking_create, name="booking_create"),
     path("booking/list/", views.booking_list, name="booking_list"),
+    path("booking/export.csv", views.booking_export_csv, name="booking_export_csv"),
+    path(
+        "booking/calendar/<str:token>.ics", views.booking_calendar, name="booking_calendar"
+    ),
     path("booking/edit/<int:booking_id>/", views.booking_edit, name="booking_edit"),
     path(
         "booking/cancel/<int:booking_id>/", views.booking_cancel, name="booking_cancel"
     ),
+    path("booking/waitlist/", views.waitlist_join, name="waitlist_join"),
     path(
         "tables/<int:table_id>/capacity/",
         views.get_table_capacity,
         name="table_capacity",
     ),
+    path("tables/free-slots/", views.free_slots, name="free_slots"),
+    path(
+        "tables/heatmap/", views.availability_heatmap, name="availability_heatmap"
+    ),
+    path(
+        "images/<str:version>/<int:width>.<str:ext>/<path:name>",
+        views.resized_image,
+        name="resized_image",
+    ),
 ]
@@ -1,53 +1,53 @@
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
-from django.conf import settings
+from .models import OutgoingEmail
+from .restaurant import get_restaurant
 
 
-def send_booking_email(user, booking, subject, template):
-    """Отправка email о бронировании."""
-    html_message = render_to_string(
-        template,
-        {
-            "user": user,
-            "booking": booking,
-            "restaurant_name": settings.RESTAURANT_NAME,
-            "contact_phone": settings.CONTACT_PHONE,
-            "contact_email": settings.CONTACT_EMAIL,
-            "address": settings.ADDRESS,
-        },
+def build_email(to_email, subject, html_message):
+    """Письмо для очереди из готового HTML (без сохранения)."""
+    return OutgoingEmail(
+        to_email=to_email,
+        subject=subject,
+        body=strip_tags(html_message),
+        html_body=html_message,
     )
-    plain_message = strip_tags(html_message)
 
-    send_mail(
+
+def queue_email(to_email, subject, template, context):
+    """Постановка письма в очередь на отправку."""
+    email = build_email(to_email, subject, render_to_string(template, context))
+    email.save()
+    return email
+
+
+def email_context(**kwargs):
+    """Контекст письма с контактами ресторана."""
+    restaurant = get_restaurant()
+    return {
+        "restaurant_name": restaurant.restaurant_name,
+        "contact_phone": restaurant.contact_phone,
+        "contact_email": restaurant.contact_email,
+        "address": restaurant.address,
+        **kwargs,
+    }
+
+
+def send_booking_email(user, booking, subject, template):
+    """Отправка email о бронировании."""
+    return queue_email(
+        user.email,
         subject,
-        plain_message,
-        None,
-        [user.email],
-        html_message=html_message,
-        fail_silently=False,
+        template,
+        email_context(user=user, booking=booking),
     )
 
 
 def send_registration_email(user, subject, template):
     """Отправка email при регистрации."""
-    html_message = render_to_string(
-        template,
-        {
-            "user": user,
-            "restaurant_name": settings.RESTAURANT_NAME,
-            "contact_phone": settings.CONTACT_PHONE,
-            "contact_email": settings.CONTACT_EMAIL,
-            "address": settings.ADDRESS,
-        },
-    )
-    plain_message = strip_tags(html_message)
-
-    send_mail(
+    return queue_email(
+        user.email,
         subject,
-        plain_message,
-        None,
-        [user.email],
-        html_message=html_message,
-        fail_silently=False,
+        template,
+        email_context(user=user),
     )
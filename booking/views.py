@@ -2,47 +2,57 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
-from django.http import JsonResponse
-from django.core.paginator import Paginator
-from django.conf import settings
-from .models import Booking, Table, Page
-from .forms import BookingForm, FeedbackForm, BookingEditForm
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Q
+from django.urls import reverse
+from django.views.decorators.http import condition, require_GET
+from .models import Booking, DeletedRecord, Table, Page
+from .forms import BookingForm, FeedbackForm, BookingEditForm, WaitlistForm
 from .utils import send_booking_email
+from .availability import get_heatmap, get_table_status, load_tables_day
+from .cache import get_page, set_page
+from .export import calendar_token, calendar_user_id, iter_csv, iter_ics, user_bookings
+from .pagination import paginate_keyset
+from .restaurant import get_restaurant
+from .image_cache import CONTENT_TYPES, RESIZE_WIDTHS, get_resized, resized_url, source_version
+import hashlib
 from datetime import datetime, timedelta
+from PIL import Image, UnidentifiedImageError
+
+# Порядок списка броней совпадает с индексом booking_user_cursor_idx
+BOOKING_LIST_ORDERING = ["-date", "-start_time", "-id"]
 
 
 def home(request):
     """Главная страница со списком столиков"""
-    tables = Table.objects.filter(is_active=True)
+    table_status = get_table_status(timezone.now().date())
 
-    table_status = []
-    today = timezone.now().date()
+    return render(request, "booking/home.html", {"table_status": table_status})
 
-    for table in tables:
-        bookings_today = Booking.objects.filter(table=table, date=today).order_by(
-            "start_time"
-        )
-        busy_times = []
 
-        for booking in bookings_today:
-            busy_times.append(
-                f"{booking.start_time.strftime('%H:%M')}-{booking.end_time.strftime('%H:%M')}"
-            )
+def page_detail(request, page_type):
+    """Детальная страница сайта, для анонимных посетителей - из кэша"""
+    # Сообщения показываются один раз, такую страницу кэшировать нельзя
+    cacheable = (
+        request.method == "GET"
+        and not request.user.is_authenticated
+        and not len(messages.get_messages(request))
+    )
+    if cacheable:
+        content = get_page(page_type)
+        if content is not None:
+            return HttpResponse(content)
 
-        table_status.append(
-            {
-                "table": table,
-                "busy_times": busy_times,
-                "has_bookings_today": bookings_today.exists(),
-                "bookings_count": bookings_today.count(),
-            }
-        )
+    response = render_page(request, page_type)
+    if cacheable and response.status_code == 200:
+        set_page(page_type, response.content)
+    return response
 
-    return render(request, "booking/home.html", {"table_status": table_status})
 
-
-def page_detail(request, page_type):
-    """Детальная страница сайта"""
+def render_page(request, page_type):
+    """Отрисовка страницы сайта с дочерними записями"""
     try:
         page = Page.objects.get(page_type=page_type, is_active=True)
 
@@ -111,20 +121,22 @@ def booking_create(request):
             booking.end_time = end_datetime.time()
 
             try:
-                booking.save()
-
-                try:
+                with transaction.atomic():
+                    booking.save()
+                    booking.add_combined_tables(form.extra_tables)
                     send_booking_email(
                         request.user,
                         booking,
                         "Подтверждение бронирования",
                         "emails/booking_confirmation.html",
                     )
-                except Exception as e:
-                    print(f"Ошибка отправки email: {e}")
 
                 messages.success(request, "Столик успешно забронирован!")
                 return redirect("booking_list")
+            except IntegrityError as e:
+                if not Booking.is_overlap_error(e):
+                    raise
+                form.add_error("start_time", "Столик только что забронировали на это время. Выберите другое время")
             except Exception as e:
                 messages.error(request, f"Ошибка бронирования: {str(e)}")
     else:
@@ -142,32 +154,127 @@ def booking_create(request):
 
 @login_required
 def booking_list(request):
-    """Список бронирований пользователя"""
-    bookings = Booking.objects.filter(user=request.user).order_by(
-        "-date", "-start_time"
+    """Список бронирований пользователя: предстоящие или прошедшие, страницы по курсору"""
+    now = datetime.now()
+    show_past = request.GET.get("show") == "past"
+    upcoming = Q(date__gt=now.date()) | Q(date=now.date(), end_time__gt=now.time())
+    if show_past:
+        bookings = Booking.objects.filter(~upcoming)
+        ordering = BOOKING_LIST_ORDERING
+    else:
+        # Ближайшие брони первыми
+        bookings = Booking.objects.filter(upcoming)
+        ordering = [name.lstrip("-") for name in BOOKING_LIST_ORDERING]
+    bookings = (
+        bookings.filter(user=request.user, combined_with__isnull=True)
+        .select_related("table")
+        .prefetch_related("combined_bookings__table")
     )
 
-    paginator = Paginator(bookings, 10)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate_keyset(
+        bookings,
+        ordering,
+        after=request.GET.get("after"),
+        before=request.GET.get("before"),
+        per_page=10,
+    )
 
     return render(
         request,
         "booking/booking_list.html",
-        {"page_obj": page_obj, "bookings": page_obj.object_list},
+        {
+            "page_obj": page_obj,
+            "bookings": page_obj.object_list,
+            "show_past": show_past,
+            "calendar_url": request.build_absolute_uri(
+                reverse("booking_calendar", args=[calendar_token(request.user)])
+            ),
+        },
     )
 
 
+@login_required
+def booking_export_csv(request):
+    """Выгрузка всех бронирований пользователя в CSV потоком"""
+    response = StreamingHttpResponse(
+        iter_csv(user_bookings(request.user)), content_type="text/csv; charset=utf-8"
+    )
+    response["Content-Disposition"] = 'attachment; filename="bookings.csv"'
+    return response
+
+
+def _calendar_version(request, token):
+    """Время последнего изменения и число броней владельца календаря; None для неверного токена"""
+    if not hasattr(request, "_calendar_version"):
+        user_id = calendar_user_id(token)
+        version = None
+        if user_id is not None:
+            version = Booking.objects.filter(user_id=user_id, combined_with__isnull=True).aggregate(
+                updated_at=Max("updated_at"), count=Count("id")
+            )
+            version["user_id"] = user_id
+            # Отмена брони не оставляет строки с updated_at: время последнего удаления брони
+            deleted_at = DeletedRecord.objects.filter(model=Booking._meta.label_lower).aggregate(
+                deleted_at=Max("deleted_at")
+            )["deleted_at"]
+            # Название и адрес ресторана входят в события
+            version["restaurant_updated_at"] = get_restaurant().updated_at
+            stamps = [version["updated_at"], deleted_at, version["restaurant_updated_at"]]
+            version["last_modified"] = max(stamp for stamp in stamps if stamp)
+        request._calendar_version = version
+    return request._calendar_version
+
+
+def _calendar_etag(request, token):
+    version = _calendar_version(request, token)
+    if version is None:
+        return None
+    # Отмена меняет число броней, поэтому ETag не зависит от удалений у других пользователей
+    updated_at = version["updated_at"]
+    stamp = updated_at.timestamp() if updated_at else 0
+    return f"{version['user_id']}-{stamp}-{version['count']}-{version['restaurant_updated_at'].timestamp()}"
+
+
+def _calendar_last_modified(request, token):
+    version = _calendar_version(request, token)
+    return version["last_modified"] if version else None
+
+
+@require_GET
+@condition(etag_func=_calendar_etag, last_modified_func=_calendar_last_modified)
+def booking_calendar(request, token):
+    """Календарь бронирований пользователя (iCalendar) по подписанной ссылке"""
+    version = _calendar_version(request, token)
+    if version is None:
+        raise Http404("Календарь не найден")
+    bookings = user_bookings(version["user_id"])
+    response = StreamingHttpResponse(
+        iter_ics(bookings, request.get_host()), content_type="text/calendar; charset=utf-8"
+    )
+    response["Content-Disposition"] = 'inline; filename="bookings.ics"'
+    # Календарь проверяется заново при каждом опросе: без изменений ответ 304
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
 @login_required
 def booking_edit(request, booking_id):
     """Редактирование бронирования"""
-    booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+    booking = get_object_or_404(
+        Booking, id=booking_id, user=request.user, combined_with__isnull=True
+    )
+
+    if booking.combined_bookings.exists():
+        messages.error(
+            request,
+            "Бронь на несколько столиков нельзя изменить. Отмените ее и забронируйте заново.",
+        )
+        return redirect("booking_list")
 
     if request.method == "POST":
         form = BookingEditForm(request.POST, instance=booking)
         if form.is_valid():
             old_date = booking.date
-            old_time = booking.start_time
 
             booking = form.save(commit=False)
 
@@ -175,48 +282,28 @@ def booking_edit(request, booking_id):
             start_datetime = datetime.combine(booking.date, booking.start_time)
             end_datetime = start_datetime + timedelta(hours=duration_hours)
             booking.end_time = end_datetime.time()
-
-            if old_date != booking.date or old_time != booking.start_time:
-                if not booking.table.is_available(
-                        booking.date, booking.start_time, duration_hours, exclude_booking_id=booking_id
-                ):
-                    busy_times = booking.table.get_busy_times(booking.date)
-
-                    busy_times_filtered = []
-                    for busy in busy_times:
-                        start_str, end_str = busy.split('-')
-                        if not (start_str == old_time.strftime('%H:%M') and
-                                end_str == booking.end_time.strftime('%H:%M')):
-                            busy_times_filtered.append(busy)
-
-                    if busy_times_filtered:
-                        messages.error(
-                            request,
-                            f'Столик занят на выбранное время. Занятое время: {", ".join(busy_times_filtered)}',
-                        )
-                    else:
-                        messages.error(
-                            request,
-                            'Выбранное время совпадает с текущим бронированием',
-                        )
-
-                    return render(
-                        request,
-                        "booking/booking_edit.html",
-                        {"form": form, "booking": booking},
-                    )
-
-            booking.save()
+            # Бронь перенесена на другой день - напоминание отправится заново
+            if old_date != booking.date:
+                booking.reminder_sent_at = None
 
             try:
-                send_booking_email(
-                    request.user,
-                    booking,
-                    "Изменение бронирования",
-                    "emails/booking_updated.html",
+                with transaction.atomic():
+                    booking.save()
+                    send_booking_email(
+                        request.user,
+                        booking,
+                        "Изменение бронирования",
+                        "emails/booking_updated.html",
+                    )
+            except IntegrityError as e:
+                if not Booking.is_overlap_error(e):
+                    raise
+                form.add_error("start_time", "Столик только что забронировали на это время. Выберите другое время")
+                return render(
+                    request,
+                    "booking/booking_edit.html",
+                    {"form": form, "booking": booking},
                 )
-            except Exception as e:
-                print(f"Ошибка отправки email: {e}")
 
             messages.success(request, "Бронирование успешно изменено!")
             return redirect("booking_list")
@@ -236,26 +323,45 @@ def booking_edit(request, booking_id):
 @login_required
 def booking_cancel(request, booking_id):
     """Отмена бронирования"""
-    booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+    booking = get_object_or_404(
+        Booking, id=booking_id, user=request.user, combined_with__isnull=True
+    )
 
     if request.method == "POST":
-        try:
+        with transaction.atomic():
             send_booking_email(
                 request.user,
                 booking,
                 "Отмена бронирования",
                 "emails/booking_cancellation.html",
             )
-        except Exception as e:
-            print(f"Ошибка отправки email: {e}")
-
-        booking.delete()
+            booking.delete()
         messages.success(request, "Бронирование отменено.")
         return redirect("booking_list")
 
     return render(request, "booking/booking_cancel_confirm.html", {"booking": booking})
 
 
+@login_required
+def waitlist_join(request):
+    """Запись в лист ожидания"""
+    if request.method == "POST":
+        form = WaitlistForm(request.POST)
+        if form.is_valid():
+            entry = form.save(commit=False)
+            entry.user = request.user
+            entry.save()
+            messages.success(
+                request,
+                "Вы в листе ожидания. Мы забронируем столик и сообщим вам, как только он освободится.",
+            )
+            return redirect("booking_list")
+    else:
+        form = WaitlistForm(initial={"date": request.GET.get("date")})
+
+    return render(request, "booking/waitlist_form.html", {"form": form})
+
+
 def get_table_capacity(request, table_id):
     """API для получения вместимости столика"""
     try:
@@ -263,3 +369,141 @@ def get_table_capacity(request, table_id):
         return JsonResponse({"capacity": table.capacity, "table_number": table.number})
     except Table.DoesNotExist:
         return JsonResponse({"capacity": 0, "table_number": 0}, status=404)
+
+
+def _free_slots_params(request):
+    """Разбирает параметры запроса свободных слотов; None при ошибке"""
+    if not hasattr(request, "_free_slots_params"):
+        params = None
+        try:
+            date_obj = datetime.strptime(request.GET.get("date", ""), "%Y-%m-%d").date()
+            guests = int(request.GET.get("guests", ""))
+            restaurant = get_restaurant()
+            duration = int(request.GET.get("duration", restaurant.min_booking_hours))
+            today = datetime.now().date()
+            max_date = today + timedelta(days=restaurant.max_booking_days_ahead)
+            if guests >= 1 and 1 <= duration <= restaurant.max_booking_hours and today <= date_obj <= max_date:
+                params = (date_obj, guests, duration)
+        except ValueError:
+            pass
+        request._free_slots_params = params
+    return request._free_slots_params
+
+
+def _free_slots_version(request):
+    """Состояние броней на дату и подходящих столиков из БД, общее для всех процессов"""
+    if not hasattr(request, "_free_slots_version"):
+        params = _free_slots_params(request)
+        version = None
+        if params:
+            date_obj, guests, _ = params
+            version = Booking.objects.filter(date=date_obj).aggregate(
+                last_modified=Max("updated_at"), count=Count("id")
+            )
+            # Удаление брони не оставляет строки с updated_at
+            version["deleted_at"] = DeletedRecord.objects.filter(
+                model=Booking._meta.label_lower
+            ).aggregate(deleted_at=Max("deleted_at"))["deleted_at"]
+            # У столиков нет времени изменения: в версию входят поля, которые отдает API
+            version["tables"] = list(
+                Table.objects.filter(is_active=True, capacity__gte=guests)
+                .order_by("id").values_list("id", "number", "capacity", "is_vip")
+            )
+        request._free_slots_version = version
+    return request._free_slots_version
+
+
+def _free_slots_etag(request):
+    version = _free_slots_version(request)
+    if version is None:
+        return None
+    date_obj, guests, duration = _free_slots_params(request)
+    stamps = [value.timestamp() if value else 0 for value in (version["last_modified"], version["deleted_at"])]
+    tables = hashlib.md5(repr(version["tables"]).encode()).hexdigest()
+    restaurant = get_restaurant()
+    etag = (
+        f"{date_obj.isoformat()}-{guests}-{duration}-{stamps[0]}-{version['count']}-{stamps[1]}-{tables}"
+        f"-{restaurant.open_time.hour}-{restaurant.close_time.hour}"
+    )
+    now = timezone.localtime()
+    if date_obj == now.date():
+        etag += f"-{now.hour}"
+    return etag
+
+
+@require_GET
+# Без Last-Modified: у столиков нет времени изменения, и смена столика не сдвинула бы его
+@condition(etag_func=_free_slots_etag)
+def free_slots(request):
+    """API свободных времен начала по всем подходящим столикам на дату"""
+    params = _free_slots_params(request)
+    if params is None:
+        return JsonResponse(
+            {"error": "Укажите корректные date (ГГГГ-ММ-ДД), guests и duration"},
+            status=400,
+        )
+    date_obj, guests, duration = params
+
+    now = datetime.now()
+    earliest = now + timedelta(hours=1) if date_obj == now.date() else None
+
+    tables = Table.objects.filter(is_active=True, capacity__gte=guests)
+    result = []
+    for table, availability in load_tables_day(date_obj, tables):
+        slots = [
+            slot for slot in availability.free_slots(duration)
+            if earliest is None or datetime.combine(date_obj, slot) >= earliest
+        ]
+        result.append(
+            {
+                "id": table.id,
+                "number": table.number,
+                "capacity": table.capacity,
+                "is_vip": table.is_vip,
+                "free_slots": [slot.strftime("%H:%M") for slot in slots],
+            }
+        )
+
+    return JsonResponse(
+        {
+            "date": date_obj.isoformat(),
+            "guests": guests,
+            "duration_hours": duration,
+            "tables": result,
+        }
+    )
+
+
+@require_GET
+def availability_heatmap(request):
+    """API свободной вместимости по дням и часам на весь горизонт бронирования"""
+    today = datetime.now().date()
+    return JsonResponse(
+        {
+            "start_date": today.isoformat(),
+            "days": get_heatmap(today, get_restaurant().max_booking_days_ahead),
+        }
+    )
+
+
+@require_GET
+def resized_image(request, version, width, ext, name):
+    """Копия изображения из медиа нужной ширины и формата, готовится при первом запросе"""
+    if width not in RESIZE_WIDTHS or ext not in CONTENT_TYPES:
+        raise Http404
+    try:
+        current = source_version(name)
+    except (FileNotFoundError, SuspiciousFileOperation):
+        raise Http404
+    if version != current:
+        # Оригинал заменен: адрес прежней версии ведет на текущую
+        return redirect(resized_url(name, width, ext, current))
+    try:
+        f = get_resized(name, width, ext, version)
+    except (UnidentifiedImageError, Image.DecompressionBombError, IsADirectoryError):
+        # Не изображение или слишком большое изображение (защита Pillow от бомб)
+        raise Http404
+    response = FileResponse(f, content_type=CONTENT_TYPES[ext])
+    # Адрес меняется вместе с оригиналом, поэтому копию можно кэшировать навсегда
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
@@ -0,0 +1,139 @@
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+from .availability import fit_key, load_tables_day
+from .models import Booking, WaitlistEntry
+from .utils import send_booking_email
+
+logger = logging.getLogger(__name__)
+
+# Сколько заявок рассматривается за одно освобождение столика
+MATCH_LIMIT = getattr(settings, "WAITLIST_MATCH_LIMIT", 20)
+
+# Один поток: освобождения обрабатываются по очереди, запрос отмены не ждет подбора
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="waitlist")
+
+
+def run_promotion(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception("Не удалось перевести заявки из листа ожидания")
+    finally:
+        # Соединения этого потока не должны висеть до следующего освобождения
+        connections.close_all()
+
+
+def schedule_promotion(func, *args):
+    """Ставит подбор заявок в фоновый поток после фиксации транзакции"""
+    transaction.on_commit(lambda: executor.submit(run_promotion, func, *args))
+
+
+def promote_for_interval(date, start_time, end_time, limit=MATCH_LIMIT):
+    """Переводит в брони заявки, чье окно пересекается с освободившимся интервалом"""
+    entries = WaitlistEntry.objects.filter(
+        date=date,
+        promoted_at__isnull=True,
+        window_start__lt=end_time,
+        window_end__gt=start_time,
+    ).select_related("user")[:limit]
+    return promote_entries(entries)
+
+
+def promote_for_table(table, limit=MATCH_LIMIT):
+    """Переводит в брони заявки, которые помещаются за вновь доступный столик"""
+    entries = WaitlistEntry.objects.filter(
+        date__gte=datetime.now().date(),
+        promoted_at__isnull=True,
+        guests_count__lte=table.capacity,
+    ).select_related("user").order_by("date", "created_at")[:limit]
+    return promote_entries(entries)
+
+
+def promote_pending():
+    """Подбор для всех ожидающих заявок с сегодняшнего дня (команда promote_waitlist)"""
+    entries = WaitlistEntry.objects.filter(
+        date__gte=datetime.now().date(),
+        promoted_at__isnull=True,
+    ).select_related("user").order_by("date", "created_at")
+    return promote_entries(entries)
+
+
+def promote_entries(entries):
+    """Подбирает столики заявкам по порядку очереди и создает брони"""
+    entries_by_date = defaultdict(list)
+    for entry in entries:
+        entries_by_date[entry.date].append(entry)
+
+    promoted = []
+    for date, date_entries in entries_by_date.items():
+        venue_day = load_tables_day(date)
+        for entry in date_entries:
+            if _place(entry, venue_day):
+                promoted.append(entry)
+    return promoted
+
+
+def _place(entry, venue_day):
+    now = datetime.now()
+    window_start = datetime.combine(entry.date, entry.window_start)
+    window_end = datetime.combine(entry.date, entry.window_end)
+
+    start = window_start
+    while start + timedelta(hours=entry.duration_hours) <= window_end:
+        if start >= now + timedelta(hours=1):
+            candidates = [
+                (table, availability)
+                for table, availability in venue_day
+                if table.capacity >= entry.guests_count
+                and availability.is_available(start.time(), entry.duration_hours)
+            ]
+            if candidates:
+                table, availability = min(candidates, key=fit_key)
+                end_time = (start + timedelta(hours=entry.duration_hours)).time()
+                booking = _book(entry, table, start.time(), end_time)
+                if booking:
+                    availability.add_booking(booking.id, booking.start_time, booking.end_time)
+                    return booking
+        start += timedelta(hours=1)
+    return None
+
+
+def _book(entry, table, start_time, end_time):
+    try:
+        with transaction.atomic():
+            booking = Booking.objects.create(
+                user=entry.user,
+                table=table,
+                date=entry.date,
+                start_time=start_time,
+                end_time=end_time,
+                guests_count=entry.guests_count,
+                special_requests="Бронь из листа ожидания",
+            )
+            promoted_at = timezone.now()
+            # Ту же заявку может одновременно переводить другой процесс
+            claimed = WaitlistEntry.objects.filter(pk=entry.pk, promoted_at__isnull=True).update(
+                promoted_booking=booking, promoted_at=promoted_at
+            )
+            if not claimed:
+                transaction.set_rollback(True)
+                return None
+            entry.promoted_booking = booking
+            entry.promoted_at = promoted_at
+            send_booking_email(
+                entry.user,
+                booking,
+                "Столик из листа ожидания",
+                "emails/waitlist_promoted.html",
+            )
+    except IntegrityError as e:
+        if not Booking.is_overlap_error(e):
+            raise
+        return None
+
+    return booking
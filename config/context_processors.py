@@ -1,16 +1,17 @@
-from django.conf import settings
+from booking.restaurant import get_restaurant
 
 
 def restaurant_info(request):
     """Добавляет информацию о ресторане в контекст шаблонов."""
+    restaurant = get_restaurant()
     return {
-        "restaurant_name": settings.RESTAURANT_NAME,
-        "restaurant_head_name": settings.RESTAURANT_HEAD_NAME,
-        "restaurant_description": settings.RESTAURANT_DESCRIPTION,
-        "contact_phone": settings.CONTACT_PHONE,
-        "contact_email": settings.CONTACT_EMAIL,
-        "address": settings.ADDRESS,
-        "open_time": settings.OPEN_TIME,
-        "close_time": settings.CLOSE_TIME,
-        "booking_rules": getattr(settings, "BOOKING_RULES", []),
+        "restaurant_name": restaurant.restaurant_name,
+        "restaurant_head_name": restaurant.head_name,
+        "restaurant_description": restaurant.description,
+        "contact_phone": restaurant.contact_phone,
+        "contact_email": restaurant.contact_email,
+        "address": restaurant.address,
+        "open_time": restaurant.open_time_display,
+        "close_time": restaurant.close_time_display,
+        "booking_rules": restaurant.booking_rules,
     }
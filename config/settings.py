@@ -31,6 +31,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "booking.restaurant.restaurant_settings_middleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -85,6 +86,15 @@ TIME_ZONE = "Europe/Moscow"
 USE_I18N = True
 USE_TZ = True
 
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
 STATIC_URL = "/static/"
 STATICFILES_DIRS = [BASE_DIR / "static"]
 STATIC_ROOT = BASE_DIR / "staticfiles"
@@ -120,6 +130,11 @@ MAX_BOOKING_HOURS = int(os.getenv("MAX_BOOKING_HOURS"))
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Статические копии публичных страниц для прокси (не задано - публикация выключена)
+STATIC_PAGES_DIR = os.getenv("STATIC_PAGES_DIR")
+# Главная перерисовывается не чаще раза в столько секунд
+STATIC_HOME_DELAY = int(os.getenv("STATIC_HOME_DELAY", "60"))
+
 BOOKING_RULES = os.getenv("BOOKING_RULES").split("|")
 MAX_BOOKING_DAYS_AHEAD = int(os.getenv("MAX_BOOKING_DAYS_AHEAD"))
 
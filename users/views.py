@@ -2,10 +2,11 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 from .forms import CustomUserCreationForm, CustomAuthenticationForm
 from .forms import CustomUserChangeForm
 from booking.utils import send_registration_email
-from django.conf import settings
+from booking.restaurant import get_restaurant
 
 
 def register(request):
@@ -13,20 +14,15 @@ def register(request):
     if request.method == "POST":
         form = CustomUserCreationForm(request.POST)
         if form.is_valid():
-            user = form.save()
-            login(request, user)
-
-            try:
+            with transaction.atomic():
+                user = form.save()
                 send_registration_email(
                     user,
-                    f"Добро пожаловать в {settings.RESTAURANT_NAME}!",
+                    f"Добро пожаловать в {get_restaurant().restaurant_name}!",
                     "emails/registration.html",
                 )
-                messages.success(request, "Вы зарегистрированы. Проверьте Вашу почту.")
-            except Exception as e:
-                messages.warning(
-                    request, f"Ваша регистрация прошла, но почта недоступна: {e}"
-                )
+            login(request, user)
+            messages.success(request, "Вы зарегистрированы. Проверьте Вашу почту.")
 
             return redirect("home")
     else: